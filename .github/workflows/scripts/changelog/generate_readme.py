@@ -14,6 +14,17 @@ The `releaser` script is used to create a GitHub release, including:
 It gathers commits between specified tags across the repositories specified in `changelog_config.json`, matches them
 with pull requests and formats their titles into a list of changes.
 
+To regenerate the changelog sections of past releases, pass `--backfill-tags` with consecutive root repository
+release tags, oldest first: the repository versions of each release are taken from the `versions-config.json`
+history, every repository is walked once over all the ranges and the sections are written to `--backfill-output`.
+
+To see where a slow run spends its time, pass `--trace-summary` to print a per-phase profile at the end of the run
+and `--trace-path trace.json` to save every span (clone, `git log`, GitHub requests, retry sleeps) as a Chrome trace.
+
+Pull requests referenced by commit messages are fetched with batched GraphQL queries, several in flight at once:
+the batch size adapts to the response latency and the concurrency to the remaining GraphQL rate limit points,
+labels are paged, so every label of a pull request is taken into account.
+
 For a pull request to be included in the changelog, add a `{changelog_label}` label to it.
 
 Other labels can be used to control which section the changes end up in and the component that will be mentioned.
@@ -1,20 +1,28 @@
+import collections
+import concurrent.futures
 import datetime
 import functools
+import json
 import logging
+import math
 import os
 import subprocess
 import time
-import urllib
+import urllib.parse
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
 import shutil
 
 import attr
 import requests
 
+from tracing import TRACER
+
 
 LOGGER = logging.getLogger(__name__)
 
+RATE_LIMIT_HEADERS = ("X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Used", "X-RateLimit-Reset", "X-RateLimit-Resource")
+
 
 @attr.s(auto_attribs=True)
 class CommitInfo:
@@ -44,15 +52,7 @@ def make_gh_auth_headers_from_env() -> dict[str, str]:
 
 
 def get_latest_repo_release(repo_full_name: str, headers: dict[str, str]) -> str:
-    release_resp = request_with_retries(
-        functools.partial(
-            requests.get,
-            url=f"https://api.github.com/repos/{repo_full_name}/releases/latest",
-            headers=headers,
-        )
-    )
-    release_resp.raise_for_status()
-    latest_release = release_resp.json()["name"].split(" ")[0]
+    latest_release = get_release_lookup(repo_full_name, headers).latest()["name"].split(" ")[0]
     return latest_release
 
 
@@ -60,48 +60,87 @@ def request_with_retries(
     req_func: Callable[[], requests.Response],
     max_retries: int = 20,
     retry_delay: int = 10,
+    retry_server_errors: bool = True,
+    retry_graphql_errors: bool = False,
 ) -> requests.Response:
 
+    def _get_rate_limit_delay(response: requests.Response) -> Optional[int]:
+        if int(response.headers.get("X-RateLimit-Remaining", -1)) > 0:
+            return retry_delay
+
+        ratelimit_reset = int(response.headers.get("X-RateLimit-Reset", -1))
+        if ratelimit_reset > 0:
+            current_timestamp = int(datetime.datetime.now().timestamp())
+            return ratelimit_reset - current_timestamp + 1
+
+        return None
+
     def _get_retry_delay(response: requests.Response) -> Optional[int]:
-        if response.status_code == 403 and "X-RateLimit-Remaining" not in resp.headers or response.status_code >= 500:
+        if response.status_code >= 500:
+            return retry_delay if retry_server_errors else None
+
+        if response.status_code == 403 and "X-RateLimit-Remaining" not in response.headers:
             return retry_delay
 
         if response.status_code in (403, 429):
-            if int(resp.headers.get("X-RateLimit-Remaining", -1)) > 0:
-                return retry_delay
+            return _get_rate_limit_delay(response)
 
-            ratelimit_reset = int(resp.headers.get("X-RateLimit-Reset", -1))
-            if ratelimit_reset > 0:
-                current_timestamp = int(datetime.datetime.now().timestamp())
-                return ratelimit_reset - current_timestamp + 1
+        return None
 
+    def _get_graphql_retry_delay(response: requests.Response) -> Optional[int]:
+        # GraphQL reports rate limits and server failures as `errors` of a 200 response
+        error_types = {error.get("type") for error in response.json().get("errors") or []}
+        if "RATE_LIMITED" in error_types:
+            return _get_rate_limit_delay(response) or retry_delay
+        if None in error_types:  # untyped errors are failures of the server, e.g. a query that timed out
+            return retry_delay
         return None
 
+    span_args = _describe_request(req_func)
     retries = 0
     while retries < max_retries:
-        resp = req_func()
+        with TRACER.span(span_args["url"], category="http", retry=retries, **span_args) as span:
+            resp = req_func()
+            span.update(
+                status=resp.status_code,
+                bytes=len(resp.content),
+                **{header: resp.headers[header] for header in RATE_LIMIT_HEADERS if header in resp.headers},
+            )
         if resp.status_code != 200:
             delay = _get_retry_delay(resp)
-            if delay is not None:
-                LOGGER.info(f"Got status {resp.status_code} on try {retries + 1}, going to retry in {delay}s...")
-                retries += 1
-                if retries >= max_retries:
-                    resp.raise_for_status()
-                    raise RuntimeError(f"Reached maximum number of retries, last response: {resp}")
-                time.sleep(delay)
-            else:
-                resp.raise_for_status()
+        elif retry_graphql_errors:
+            delay = _get_graphql_retry_delay(resp)
         else:
             return resp
 
+        if delay is None:
+            resp.raise_for_status()
+            return resp
+        LOGGER.info(f"Got status {resp.status_code} on try {retries + 1}, going to retry in {delay}s...")
+        retries += 1
+        if retries >= max_retries:
+            resp.raise_for_status()
+            raise RuntimeError(f"Reached maximum number of retries, last response: {resp}")
+        TRACER.sleep(delay, status=resp.status_code, **span_args)
+
+
+def _describe_request(req_func: Callable[[], requests.Response]) -> dict[str, str]:
+    """ Span args for a request passed as a `functools.partial` over `requests.get/post/...` """
+
+    func = getattr(req_func, "func", req_func)
+    url = getattr(req_func, "keywords", {}).get("url", "")
+    return dict(method=getattr(func, "__name__", "request").upper(), url=urllib.parse.urlsplit(url).path or url)
+
 
 def get_commits_between_tags(tag_from: str, tag_to: str, repo_path: Path) -> list[CommitInfo]:
-    git_log = subprocess.run(
-        ["git", "log", f"{tag_from}..{tag_to}", "--format=%H\t%s"],
-        capture_output=True,
-        text=True,
-        cwd=repo_path,
-    )
+    with TRACER.span("git log", category="git", repo=repo_path.name, range=f"{tag_from}..{tag_to}"):
+        git_log = subprocess.run(
+            # no tag_from: the repo was not released yet, everything up to tag_to is new
+            ["git", "log", f"{tag_from}..{tag_to}" if tag_from else tag_to or "HEAD", "--format=%H\t%s"],
+            capture_output=True,
+            text=True,
+            cwd=repo_path,
+        )
     raw_records = git_log.stdout.strip().split("\n")
 
     commits: list[CommitInfo] = [
@@ -114,20 +153,116 @@ def get_commits_between_tags(tag_from: str, tag_to: str, repo_path: Path) -> lis
     return commits
 
 
+def get_commits_for_ranges(ranges: list[tuple[str, str]], repo_path: Path) -> list[list[CommitInfo]]:
+    """
+    Same as calling `get_commits_between_tags` for each (tag_from, tag_to) pair, but with a single `git log` walk.
+
+    The ranges are expected to be consecutive, i.e. the first range starts at the oldest tag: the walk covers
+    everything reachable from any of the `tag_to` and not from the first `tag_from`, then each range is cut out
+    of that commit graph by reachability. An empty `tag_from` (the repo was not released yet) starts the range
+    at the first commit of the repo.
+    """
+
+    changed_ranges = [tag_range for tag_range in ranges if tag_range[0] != tag_range[1]]
+    if not changed_ranges:
+        return [[] for _ in ranges]
+
+    tags = sorted({tag for tag_range in changed_ranges for tag in tag_range if tag})
+    rev_parse = subprocess.run(
+        ["git", "rev-parse", "HEAD^{commit}", *(f"{tag}^{{commit}}" for tag in tags)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=repo_path,
+    )
+    head_sha, *tag_shas = rev_parse.stdout.split()
+    sha_by_tag = dict(zip(tags, tag_shas))
+    sha_ranges = [
+        (sha_by_tag[tag_from] if tag_from else None, sha_by_tag[tag_to] if tag_to else head_sha)
+        for tag_from, tag_to in changed_ranges
+    ]
+    oldest_sha = sha_ranges[0][0]
+
+    with TRACER.span("git log", category="git", repo=repo_path.name, ranges=len(changed_ranges)):
+        git_log = subprocess.run(
+            [
+                "git", "log", "--format=%H%x09%P%x09%s",
+                *sorted({sha_to for _, sha_to in sha_ranges}),
+                *([f"^{oldest_sha}"] if oldest_sha else []),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=repo_path,
+        )
+
+    commits: list[CommitInfo] = []
+    parents: dict[str, list[str]] = {}
+    for record in git_log.stdout.strip().split("\n"):
+        if not record:
+            continue
+        sha, commit_parents, message = record.split("\t", 2)
+        commits.append(CommitInfo(sha=sha, message=message))
+        parents[sha] = commit_parents.split()
+
+    def _reachable(start: Optional[str]) -> set[str]:
+        seen: set[str] = set()
+        if start is None:  # the range starts at the first commit
+            return seen
+        stack = [start]
+        while stack:
+            sha = stack.pop()
+            if sha in seen or sha not in parents:  # outside the walked graph means reachable from the oldest tag
+                continue
+            seen.add(sha)
+            stack.extend(parents[sha])
+        return seen
+
+    commits_by_range: dict[tuple[str, str], list[CommitInfo]] = {}
+    for tag_range, (sha_from, sha_to) in zip(changed_ranges, sha_ranges):
+        range_shas = _reachable(sha_to) - _reachable(sha_from)
+        commits_by_range[tag_range] = [commit for commit in commits if commit.sha in range_shas]
+
+    return [commits_by_range.get(tag_range, []) for tag_range in ranges]
+
+
+def read_file_at_ref(repo_path: Path, ref: str, file_path: str) -> str:
+    git_show = subprocess.run(
+        ["git", "show", f"{ref}:{file_path}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=repo_path,
+    )
+    return git_show.stdout
+
+
+def get_ref_date(repo_path: Path, ref: str) -> str:
+    git_log = subprocess.run(
+        ["git", "log", "-1", "--format=%cs", ref],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=repo_path,
+    )
+    return git_log.stdout.strip()
+
+
 def get_pull_requests_by_commit(repo_full_name: str, commit: CommitInfo, auth_headers: dict, include_label: Optional[str] = None) -> list[PullRequestInfo]:
     search_str = f"repo:{repo_full_name}+type:pr+is:merged+{commit.sha[:10]}"
     if include_label is not None:
         search_str += f"+label:{include_label}"
     params_str = urllib.parse.urlencode(dict(q=search_str), safe=':+')
 
-    prs_info_raw = request_with_retries(
-        functools.partial(
-            requests.get,
-            url="https://api.github.com/search/issues",
-            headers=auth_headers,
-            params=params_str,
+    with TRACER.span("search", category="github", commit=commit.sha):
+        prs_info_raw = request_with_retries(
+            functools.partial(
+                requests.get,
+                url="https://api.github.com/search/issues",
+                headers=auth_headers,
+                params=params_str,
+            )
         )
-    )
     prs_info_raw.raise_for_status()
     prs_info = [
         PullRequestInfo(
@@ -141,65 +276,275 @@ def get_pull_requests_by_commit(repo_full_name: str, commit: CommitInfo, auth_he
         LOGGER.warning(f"Got >1 ({len(prs_info)}) PRs for search str {search_str}")
     return prs_info
 
-def get_pull_requests_by_numbers(repo_full_name: str, pr_numbers: list[str], auth_headers: dict, include_label: Optional[str] = None) -> list[PullRequestInfo]:
-    repos_search = repo_full_name.split("/")
-    query_prefix = "query($owner: String!, $repo: String!) { repository(owner: $owner, name: $repo) {"
-    all_prs_info = []
+GRAPHQL_URL = "https://api.github.com/graphql"
+LABELS_PAGE_SIZE = 20
 
-    # process in batches of 50
-    for i in range(0, len(pr_numbers), 50):
-        batch = pr_numbers[i:i+50]
-        pr_seed = [f"pr{num}: pullRequest(number: {num}) {{ number title state labels(first: 10){{nodes{{name}}}} mergedAt }}" 
-                  for num in batch]
 
-        prs_info_raw = request_with_retries(
-            functools.partial(
-                requests.post,
-                url="https://api.github.com/graphql",
-                headers=auth_headers,
-                json={
-                    "query": query_prefix + " ".join(pr_seed) + "} }",
-                    "variables": {
-                        "owner": repos_search[0],
-                        "repo": repos_search[1]
-                    }
-                }
-            )
+@attr.s(auto_attribs=True)
+class PullRequestBatcher:
+    """
+    Fetches pull requests by number with batches of aliased `pullRequest` lookups sent to GraphQL.
+
+    The batch size follows the response latency: it grows while full batches come back within half of
+    `target_seconds` and shrinks in proportion when they take longer; a batch that GitHub fails with a 5xx
+    (a query that timed out) is put back and taken again at half the size. Every query asks for its
+    `rateLimit { cost remaining resetAt }`: up to `max_workers` batches are in flight at once while their cost,
+    estimated from the cost per pull request of the previous batches, fits in the remaining points, a batch
+    is never grown past its share of them, and with the points exhausted the dispatch sleeps until `resetAt`.
+
+    Labels are requested `LABELS_PAGE_SIZE` at a time, the pull requests that have more get their next
+    pages in follow-up batches, so the label sets are always complete.
+    """
+
+    repo_full_name: str
+    headers: dict[str, str]
+    batch_size: int = 50
+    min_batch_size: int = 1
+    max_batch_size: int = 100
+    max_workers: int = 4
+    target_seconds: float = 5.0
+    _cost_per_pr: Optional[float] = attr.ib(default=None, init=False)
+    _remaining: Optional[int] = attr.ib(default=None, init=False)
+    _reset_at: Optional[str] = attr.ib(default=None, init=False)
+
+    def _render_lookup(self, number: int, labels_cursor: Optional[str]) -> str:
+        if labels_cursor is None:
+            labels_args = f"first: {LABELS_PAGE_SIZE}"
+            fields = "number title state mergedAt"
+        else:
+            labels_args = f"first: 100, after: {json.dumps(labels_cursor)}"
+            fields = "number"
+        return (
+            f"pr{number}: pullRequest(number: {number}) {{ {fields}"
+            f" labels({labels_args}) {{ nodes {{ name }} pageInfo {{ hasNextPage endCursor }} }} }}"
+        )
+
+    def _query(self, batch: list[tuple[int, Optional[str]]]) -> tuple[dict[str, Any], float]:
+        """ Sends a batch, returns the `data` of the response and its latency; runs in the worker threads """
+
+        owner, repo = self.repo_full_name.split("/")
+        query = (
+            "query($owner: String!, $repo: String!) { rateLimit { cost remaining resetAt }"
+            " repository(owner: $owner, name: $repo) { "
+            + " ".join(self._render_lookup(number, cursor) for number, cursor in batch)
+            + " } }"
         )
-        prs_info_raw.raise_for_status()
-        
-        batch_prs = [
-            PullRequestInfo(
-                title=pr_raw["title"],
-                number=pr_raw["number"],
-                merged_at=pr_raw["mergedAt"],
-                labels=[label["name"] for label in pr_raw["labels"].get("nodes", [])],
+        started = time.perf_counter()
+        with TRACER.span("graphql batch", category="github", batch_size=len(batch)) as span:
+            resp = request_with_retries(
+                functools.partial(
+                    requests.post,
+                    url=GRAPHQL_URL,
+                    headers=self.headers,
+                    json=dict(query=query, variables=dict(owner=owner, repo=repo)),
+                ),
+                retry_server_errors=False,
+                retry_graphql_errors=True,
             )
-            for pr_raw in prs_info_raw.json()['data']['repository'].values() 
-            if pr_raw["state"] == "MERGED"
-        ]
-        all_prs_info.extend(batch_prs)
+            payload = resp.json()
+            rate_limit = (payload.get("data") or {}).get("rateLimit") or {}
+            span.update(cost=rate_limit.get("cost"), remaining=rate_limit.get("remaining"))
+
+        # transient errors are retried by request_with_retries, the rest fail the run
+        for error in payload.get("errors", []):
+            if error.get("type") != "NOT_FOUND":
+                raise RuntimeError(f"GraphQL query for {self.repo_full_name} failed: {error.get('message', error)}")
+            LOGGER.warning(f"{self.repo_full_name}: {error.get('message')}")
+        return payload["data"], time.perf_counter() - started
+
+    def _estimate_cost(self, size: int) -> int:
+        if self._cost_per_pr is None:
+            return 1
+        return max(1, math.ceil(self._cost_per_pr * size))
+
+    def _adapt(self, size: int, seconds: float, rate_limit: dict[str, Any]) -> None:
+        self._remaining = rate_limit["remaining"]
+        self._reset_at = rate_limit["resetAt"]
+        self._cost_per_pr = rate_limit["cost"] / size
+
+        if seconds > self.target_seconds:
+            self.batch_size = min(self.batch_size, int(size * self.target_seconds / seconds))
+        elif seconds < self.target_seconds / 2 and size >= self.batch_size:
+            self.batch_size = size * 3 // 2 + 1
+
+        # a query costs at least a point, so the share of the points only caps batches that cost more than that
+        affordable = int(max(self._remaining / self.max_workers, 1) / self._cost_per_pr) if self._cost_per_pr else self.max_batch_size
+        self.batch_size = max(self.min_batch_size, min(self.batch_size, self.max_batch_size, affordable))
+
+    def _wait_for_reset(self) -> None:
+        reset_at = datetime.datetime.fromisoformat(self._reset_at.replace("Z", "+00:00"))
+        delay = (reset_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds() + 1
+        LOGGER.info(f"GraphQL points are exhausted ({self._remaining} left), waiting {delay:.0f}s for the reset")
+        TRACER.sleep(max(delay, 1.0), reason="graphql rate limit")
+        self._remaining = None
+
+    def fetch(self, pr_numbers: Iterable[Union[int, str]]) -> list[PullRequestInfo]:
+        """ Returns the merged pull requests among the numbers, each number is looked up once """
+
+        pending: collections.deque[tuple[int, Optional[str]]] = collections.deque(
+            (number, None) for number in sorted({int(number) for number in pr_numbers})
+        )
+        prs: dict[int, PullRequestInfo] = {}
+        in_flight: dict[concurrent.futures.Future, tuple[list[tuple[int, Optional[str]]], int]] = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.max_workers:
+                    batch_size = min(self.batch_size, len(pending))
+                    cost = self._estimate_cost(batch_size)
+                    if self._remaining is not None and cost + sum(c for _, c in in_flight.values()) > self._remaining:
+                        if in_flight:
+                            break
+                        self._wait_for_reset()
+                    batch = [pending.popleft() for _ in range(batch_size)]
+                    in_flight[pool.submit(self._query, batch)] = (batch, cost)
+
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    batch, _ = in_flight.pop(future)
+                    try:
+                        data, seconds = future.result()
+                    except requests.HTTPError as err:
+                        if err.response is None or err.response.status_code < 500 or len(batch) == 1:
+                            raise
+                        self.batch_size = max(self.min_batch_size, len(batch) // 2)
+                        LOGGER.info(f"GraphQL batch of {len(batch)} failed with {err.response.status_code}, retrying by {self.batch_size}")
+                        pending.extendleft(reversed(batch))
+                        continue
+
+                    self._adapt(len(batch), seconds, data["rateLimit"])
+                    for pr_raw in data["repository"].values():
+                        if pr_raw is None:
+                            continue
+                        number = pr_raw["number"]
+                        if "state" in pr_raw:
+                            if pr_raw["state"] != "MERGED":
+                                continue
+                            prs[number] = PullRequestInfo(
+                                title=pr_raw["title"], number=number, merged_at=pr_raw["mergedAt"], labels=[]
+                            )
+                        prs[number].labels.extend(label["name"] for label in pr_raw["labels"]["nodes"])
+                        if pr_raw["labels"]["pageInfo"]["hasNextPage"]:
+                            pending.append((number, pr_raw["labels"]["pageInfo"]["endCursor"]))
+
+        return [prs[number] for number in sorted(prs)]
+
+
+def get_pull_requests_by_numbers(repo_full_name: str, pr_numbers: Iterable[str], auth_headers: dict, include_label: Optional[str] = None) -> list[PullRequestInfo]:
+    all_prs_info = PullRequestBatcher(repo_full_name=repo_full_name, headers=auth_headers).fetch(pr_numbers)
 
     if include_label is not None:
-        all_prs_info = [pr for pr in all_prs_info if bool(set(pr.labels) & set([include_label]))]
+        all_prs_info = [pr for pr in all_prs_info if include_label in pr.labels]
 
     return all_prs_info
 
 
+@attr.s(auto_attribs=True)
+class ReleaseLookup:
+    """
+    Finds releases of a single repository with a bounded number of requests.
+
+    A tag that is not memoized yet is looked up with the direct `/releases/tags/{tag}` endpoint,
+    which does not see draft releases, so on a 404 the `/releases` list is paged lazily until the
+    tag shows up. The latest release is a single `/releases/latest` request. Every release seen on
+    the way is memoized, the pages are never fetched twice within a run.
+    """
+
+    repo_full_name: str
+    headers: dict[str, str]
+    per_page: int = 100
+    _by_tag: dict[str, dict[str, Any]] = attr.ib(factory=dict, init=False)
+    _listed: list[dict[str, Any]] = attr.ib(factory=list, init=False)
+    _next_page: Optional[int] = attr.ib(default=1, init=False)
+    _latest: Optional[dict[str, Any]] = attr.ib(default=None, init=False)
+
+    @property
+    def _releases_url(self) -> str:
+        return f"https://api.github.com/repos/{self.repo_full_name}/releases"
+
+    def _remember(self, release: dict[str, Any]) -> dict[str, Any]:
+        return self._by_tag.setdefault(release["tag_name"], release)
+
+    def _fetch_release(self, url: str) -> Optional[dict[str, Any]]:
+        """ A single release from the given endpoint, None on 404 """
 
-def find_release_by_tag(repo_full_name: str, headers: dict[str, str], release_tag: str) -> str:
-    release_resp = request_with_retries(
-        functools.partial(
-            requests.get,
-            url=f"https://api.github.com/repos/{repo_full_name}/releases",
-            headers=headers,
+        try:
+            release_resp = request_with_retries(functools.partial(requests.get, url=url, headers=self.headers))
+        except requests.HTTPError as err:
+            if err.response is None or err.response.status_code != 404:
+                raise
+            return None
+        return self._remember(release_resp.json())
+
+    def _fetch_next_page(self) -> list[dict[str, Any]]:
+        page = self._next_page
+        LOGGER.info(f"Fetching releases page {page} for {self.repo_full_name}")
+        releases_resp = request_with_retries(
+            functools.partial(
+                requests.get,
+                url=self._releases_url,
+                headers=self.headers,
+                params=dict(per_page=self.per_page, page=page),
+            )
         )
-    )
-    release_resp.raise_for_status()
-    release = next((release for release in release_resp.json() if release["tag_name"] == release_tag), None)
-    if release is None:
-        raise RuntimeError(f'Could not find a release by tag "{release_tag}"')
-    return release["id"]
+        releases_resp.raise_for_status()
+        releases = releases_resp.json()
+        self._next_page = page + 1 if len(releases) == self.per_page else None
+        for release in releases:
+            self._remember(release)
+        self._listed.extend(releases)
+        return releases
+
+    def iter_releases(self) -> Iterator[dict[str, Any]]:
+        """ Yields releases newest first, requesting the next page only when the previous one is exhausted """
+
+        idx = 0
+        while True:
+            while idx < len(self._listed):
+                yield self._listed[idx]
+                idx += 1
+            if self._next_page is None or not self._fetch_next_page():
+                return
+
+    def by_tag(self, release_tag: str) -> dict[str, Any]:
+        if release_tag in self._by_tag:
+            return self._by_tag[release_tag]
+
+        # whatever has been listed so far, one direct request is cheaper than paging further
+        release = self._fetch_release(f"{self._releases_url}/tags/{urllib.parse.quote(release_tag, safe='')}")
+        if release is not None:
+            return release
+        LOGGER.info(f'No published release with tag "{release_tag}", looking through drafts as well')
+
+        release = next((release for release in self.iter_releases() if release["tag_name"] == release_tag), None)
+        if release is None:
+            raise RuntimeError(f'Could not find a release by tag "{release_tag}"')
+        return release
+
+    def latest(self) -> dict[str, Any]:
+        """ The newest release that is neither a draft nor a prerelease """
+
+        if self._latest is None:
+            self._latest = self._fetch_release(f"{self._releases_url}/latest")
+        if self._latest is None:
+            raise RuntimeError(f"Could not find any published release in {self.repo_full_name}")
+        return self._latest
+
+
+_RELEASE_LOOKUPS: dict[str, ReleaseLookup] = {}
+
+
+def get_release_lookup(repo_full_name: str, headers: dict[str, str]) -> ReleaseLookup:
+    """ Returns the run-wide release lookup for the repo, so that all callers share its memoized results """
+
+    if repo_full_name not in _RELEASE_LOOKUPS:
+        _RELEASE_LOOKUPS[repo_full_name] = ReleaseLookup(repo_full_name=repo_full_name, headers=headers)
+    return _RELEASE_LOOKUPS[repo_full_name]
+
+
+def find_release_by_tag(repo_full_name: str, headers: dict[str, str], release_tag: str) -> str:
+    return get_release_lookup(repo_full_name, headers).by_tag(release_tag)["id"]
+
 
 def clone_repository(repo_url: str, repo_path: Path) -> None:
     clone_url = f"{repo_url}.git"
@@ -208,25 +553,26 @@ def clone_repository(repo_url: str, repo_path: Path) -> None:
     if gh_token is not None and "github.com" in repo_url:
         clone_url = clone_url.replace("github.com", f"{gh_token}@github.com")
 
-    if repo_path.exists():
-        try:
-            LOGGER.info(f"Pull existed repo: [{repo_url}] in [{repo_path}]")
-            subprocess.run(
-                ["git", "pull", "origin"],
-                check= True,
-                capture_output=True,
-                text=True,
-                cwd=repo_path,
-            )          
-            return
-        except:
-            LOGGER.info(f"Pull repo error, trying to remove and clone: [{repo_url}] in [{repo_path}]")
-            shutil.rmtree(repo_path)
-
-    LOGGER.info(f"Clone new repo: [{repo_url}] to [{repo_path}]")
-    subprocess.run(
-        ["git", "clone", clone_url, repo_path],
-        check= True,
-        capture_output=True,
-        text=True,
-    )
+    with TRACER.span("clone", category="git", repo=repo_url):
+        if repo_path.exists():
+            try:
+                LOGGER.info(f"Pull existed repo: [{repo_url}] in [{repo_path}]")
+                subprocess.run(
+                    ["git", "pull", "origin"],
+                    check= True,
+                    capture_output=True,
+                    text=True,
+                    cwd=repo_path,
+                )          
+                return
+            except:
+                LOGGER.info(f"Pull repo error, trying to remove and clone: [{repo_url}] in [{repo_path}]")
+                shutil.rmtree(repo_path)
+
+        LOGGER.info(f"Clone new repo: [{repo_url}] to [{repo_path}]")
+        subprocess.run(
+            ["git", "clone", clone_url, repo_path],
+            check= True,
+            capture_output=True,
+            text=True,
+        )
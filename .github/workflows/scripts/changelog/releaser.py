@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import argparse
+import atexit
 import datetime
 import logging
 import re
 import json
+import sys
 from collections import defaultdict
 from typing import Any
 from pathlib import Path
@@ -12,6 +14,7 @@ from pathlib import Path
 import requests
 
 import github_helpers as gh
+from tracing import TRACER
 
 
 logging.basicConfig(level=logging.INFO)
@@ -125,99 +128,108 @@ def write_output(content: str) -> None:
         f.write(content)
 
 
+def repo_version_by_images(repo_images: list[dict[str, Any]], repo_versions: dict[str, str]) -> str:
+    """ The version of a repo providing images: the oldest of its image versions, "" if none is released yet """
+
+    image_versions = [repo_versions[img["version_descriptor"]] for img in repo_images if repo_versions.get(img["version_descriptor"])]
+    if len(set(image_versions)) > 1:
+        LOGGER.info(f"Got multiple image tags for {repo_images[0]['name']}, picking the older one ({min(image_versions)})")
+    return min(image_versions, default="")
+
+
 def populate_helper_maps(
     changelog_config: dict[str, Any],
     current_repo_versions: dict[str, str],
     new_repo_versions: dict[str, str],
+    img_versions_by_name: dict[str, dict[str, str]] = IMG_VERSIONS_BY_NAME,
+    repo_versions: dict[str, dict[str, str]] = REPO_VERSIONS,
 ) -> None:
     for repo in changelog_config["repositories"]:
         for img in repo.get("images", []):
             REPO_CFG_BY_IMG[img["name"]] = repo
-            IMG_VERSIONS_BY_NAME[img["name"]]["from"] = current_repo_versions[img["version_descriptor"]]
+            img_versions_by_name[img["name"]]["from"] = current_repo_versions.get(img["version_descriptor"], "")
 
     for repo in changelog_config["repositories"]:
         repo_images = repo.get("images", [])
-        for img in repo_images:
-            existing_tag = REPO_VERSIONS.get(repo["name"], {}).get("from")
-            new_tag = current_repo_versions[img["version_descriptor"]]
-            if existing_tag:
-                new_tag = min(new_tag, existing_tag)
-                LOGGER.info(
-                    f"Got multiple image tags for {img['name']}, "
-                    f"picking the older one for the starting version ({new_tag})"
-                )
-            REPO_VERSIONS[repo["name"]]["from"] = new_tag
-        if not repo_images:
+        if repo_images:
+            # "" for a repo not released yet: its range starts at its first commit
+            repo_versions[repo["name"]]["from"] = repo_version_by_images(repo_images, current_repo_versions)
+        else:
             # if the repo provides no images, its version should be described by its name
-            REPO_VERSIONS[repo["name"]]["from"] = current_repo_versions.get(repo["name"], "")
+            repo_versions[repo["name"]]["from"] = current_repo_versions.get(repo["name"], "")
 
     for repo_name, new_version in new_repo_versions.items():
-        REPO_VERSIONS[repo_name]["to"] = new_version
-    for repo_name, versions in REPO_VERSIONS.items():
+        repo_versions[repo_name]["to"] = new_version
+    for repo_name, versions in repo_versions.items():
         if "to" not in versions:  # means the repo is unchanged
-            REPO_VERSIONS[repo_name]["to"] = versions["from"]
+            repo_versions[repo_name]["to"] = versions["from"]
 
         # normalize tags
-        REPO_VERSIONS[repo_name] = {
-            "from": normalize_tag(REPO_VERSIONS[repo_name]["from"]),
-            "to": normalize_tag(REPO_VERSIONS[repo_name]["to"]),
+        repo_versions[repo_name] = {
+            "from": normalize_tag(repo_versions[repo_name]["from"]),
+            "to": normalize_tag(repo_versions[repo_name]["to"]),
         }
 
         # save result image to map
         repo_images = next(repo.get("images", []) for repo in changelog_config["repositories"] if repo["name"] == repo_name)
         for img in repo_images:
-            IMG_VERSIONS_BY_NAME[img["name"]]["to"] = normalize_version(REPO_VERSIONS[repo_name]["to"])
+            img_versions_by_name[img["name"]]["to"] = normalize_version(repo_versions[repo_name]["to"])
 
 
+def resolve_commits_prs(
+    repo_full_name: str,
+    commits: list[gh.CommitInfo],
+    gh_headers: dict[str, str],
+    cfg: dict[str, Any],
+) -> dict[str, list[gh.PullRequestInfo]]:
+    """ Matches commits with their pull requests, returns them by commit sha """
 
-def gather_changelog(cfg: dict[str, Any], repos_dir: Path, gh_headers: dict[str, str]) -> TChangelog:
-    changelog: TChangelog = defaultdict(list)
-    CF = ChangelogFormatter
-    other_changes_section = (999999, cfg["other_changes_section"])  # max weight to put it at the end
+    pr_numbers_by_sha: dict[str, str] = {}
+    commits_for_search: list[gh.CommitInfo] = []
+    prs_by_sha: dict[str, list[gh.PullRequestInfo]] = {}
 
-    for repository in cfg["repositories"]:
-        repo_full_name = "/".join(repository["url"].split("/")[-2:])
+    for commit in commits:
+        match = re.search(r'\(#(\d+)\)$', commit.message)
+        if match:
+            pr_numbers_by_sha[commit.sha] = match.group(1)
+        else:
+            LOGGER.warning(f"Could not extract PR number from commit message: {commit.message}, will be grubbed from search")
+            commits_for_search.append(commit)
 
-        tag_from = REPO_VERSIONS[repository["name"]]["from"]
-        tag_to = REPO_VERSIONS[repository["name"]]["to"]
-        commits = gh.get_commits_between_tags(
-            tag_from=tag_from,
-            tag_to=tag_to,
-            repo_path=repos_dir / repository["name"],
+    if len(pr_numbers_by_sha) > 0:
+        prs_info = gh.get_pull_requests_by_numbers(
+            repo_full_name, pr_numbers_by_sha.values(), gh_headers, cfg["changelog_include_label"]
+        )
+        LOGGER.info(f"[{len(prs_info)}] Fetched PRs with graphql")
+        prs_by_number = {str(pr.number): pr for pr in prs_info}
+        for sha, pr_number in pr_numbers_by_sha.items():
+            if pr_number in prs_by_number:
+                prs_by_sha[sha] = [prs_by_number[pr_number]]
+
+    for idx, commit in enumerate(commits_for_search):
+        LOGGER.info(f"[{idx + 1}/{len(commits_for_search)}] Fetching PRs for commit {commit.sha}")
+        prs_by_sha[commit.sha] = gh.get_pull_requests_by_commit(
+            repo_full_name, commit, gh_headers, cfg["changelog_include_label"]
         )
-        LOGGER.info(f"Got {len(commits)} commits from range {tag_from}..{tag_to} for {repo_full_name}")
-
-        pr_numbers_from_commits = []
-        commits_for_search = []
-        prs_info = []
-
-        for commit in commits:
-            match = re.search(r'\(#(\d+)\)$', commit.message)
-            if match:
-                pr_number = match.group(1)
-                pr_numbers_from_commits.append(pr_number)
-            else:
-                LOGGER.warning(f"Could not extract PR number from commit message: {commit.message}, will be grubbed from search")
-                commits_for_search.append(commit)
-        if len(pr_numbers_from_commits) > 0:
-            prs_info = gh.get_pull_requests_by_numbers(
-                repo_full_name, pr_numbers_from_commits, gh_headers, changelog_config["changelog_include_label"]
-            )
-            LOGGER.info(f"[{len(prs_info)}] Fetched PRs with graphql")
 
-        for idx, commit in enumerate(commits_for_search):
-            LOGGER.info(f"[{idx + 1}/{len(commits_for_search)}] Fetching PRs for commit {commit.sha}")
-            prs_info_commit = gh.get_pull_requests_by_commit(
-                repo_full_name, commit, gh_headers, changelog_config["changelog_include_label"]
-            )
-            prs_info.extend(prs_info_commit)
+    return prs_by_sha
+
+
+def collect_prs(commits: list[gh.CommitInfo], prs_by_sha: dict[str, list[gh.PullRequestInfo]]) -> list[gh.PullRequestInfo]:
+    prs_by_number = {pr.number: pr for commit in commits for pr in prs_by_sha.get(commit.sha, [])}
+    return sorted(prs_by_number.values(), key=lambda x: x.number)
+
+
+def make_changelog(cfg: dict[str, Any], prs_by_repo: list[tuple[dict[str, Any], list[gh.PullRequestInfo]]]) -> TChangelog:
+    changelog: TChangelog = defaultdict(list)
+    CF = ChangelogFormatter
+    other_changes_section = (999999, cfg["other_changes_section"])  # max weight to put it at the end
 
-        prs_info = sorted(prs_info, key=lambda x: x.number)
-        
-        for idx, pr in enumerate(prs_info):
+    for repository, prs_info in prs_by_repo:
+        for pr in prs_info:
             pr_components = []
-            for component in changelog_config["component_tags"]["tags"]:
-                prefix = changelog_config["component_tags"]["prefix"]
+            for component in cfg["component_tags"]["tags"]:
+                prefix = cfg["component_tags"]["prefix"]
                 tag = prefix + component["id"]
                 if tag in pr.labels:
                     pr_components.append(component["text"])
@@ -225,8 +237,8 @@ def gather_changelog(cfg: dict[str, Any], repos_dir: Path, gh_headers: dict[str,
             section = next(  # sortable section tuple: weight (order idx in config) and name
                 (
                     (idx, section["text"])
-                    for idx, section in enumerate(changelog_config["section_tags"]["tags"])
-                    if f"{changelog_config['section_tags']['prefix']}{section['id']}" in pr.labels
+                    for idx, section in enumerate(cfg["section_tags"]["tags"])
+                    if f"{cfg['section_tags']['prefix']}{section['id']}" in pr.labels
                 ),
                 other_changes_section,  # changes without a section (type)
             )
@@ -239,12 +251,148 @@ def gather_changelog(cfg: dict[str, Any], repos_dir: Path, gh_headers: dict[str,
     if len(changelog) == 1 and changelog.get(other_changes_section) is not None:
         # switch to a prettier section title if all changes are untyped
         changelog = {
-            (0, changelog_config["single_section_title"]): changelog[other_changes_section]
+            (0, cfg["single_section_title"]): changelog[other_changes_section]
         }
 
     return changelog
 
 
+def gather_changelog(cfg: dict[str, Any], repos_dir: Path, gh_headers: dict[str, str]) -> TChangelog:
+    prs_by_repo: list[tuple[dict[str, Any], list[gh.PullRequestInfo]]] = []
+
+    for repository in cfg["repositories"]:
+        repo_full_name = "/".join(repository["url"].split("/")[-2:])
+
+        tag_from = REPO_VERSIONS[repository["name"]]["from"]
+        tag_to = REPO_VERSIONS[repository["name"]]["to"]
+        with TRACER.span("gather repository", repo=repo_full_name) as span:
+            commits = gh.get_commits_between_tags(
+                tag_from=tag_from,
+                tag_to=tag_to,
+                repo_path=repos_dir / repository["name"],
+            )
+            LOGGER.info(f"Got {len(commits)} commits from range {tag_from}..{tag_to} for {repo_full_name}")
+
+            prs_by_sha = resolve_commits_prs(repo_full_name, commits, gh_headers, cfg)
+            prs_by_repo.append((repository, collect_prs(commits, prs_by_sha)))
+            span.update(commits=len(commits), prs=len(prs_by_repo[-1][1]))
+
+    return make_changelog(cfg, prs_by_repo)
+
+
+def render_changelog(
+    cfg: dict[str, Any],
+    release_tag: str,
+    release_date: str,
+    changelog: TChangelog,
+    img_versions_by_name: dict[str, dict[str, str]] = IMG_VERSIONS_BY_NAME,
+) -> list[str]:
+    CF = ChangelogFormatter
+    changelog_lines: list[str] = []
+    no_changes = not bool(changelog)
+
+    changelog_lines.append(CF.release(release_tag) + f" ({release_date})")
+
+    changelog_lines.append(CF.section(cfg["images_versions_section"]))
+    img_versions_list: list[str] = []
+    for img_name, img_versions in img_versions_by_name.items():
+        if not img_versions["to"]:
+            continue  # not released yet
+        if not img_versions["from"]:
+            new_image_url = "{repo_url}/commits/v{v_to}".format(repo_url=REPO_CFG_BY_IMG[img_name]["url"], v_to=img_versions["to"])
+            img_versions_list.append(CF.img_version_changed(img_name, "new", img_versions["to"], new_image_url))
+        elif img_versions["from"] != img_versions["to"]:
+            full_changelog_url = "{repo_url}/compare/v{v_from}...v{v_to}".format(
+                repo_url=REPO_CFG_BY_IMG[img_name]["url"],
+                v_from=img_versions["from"],
+                v_to=img_versions["to"],
+            )
+            img_versions_list.append(CF.img_version_changed(img_name, img_versions["from"], img_versions["to"], full_changelog_url))
+        else:
+            img_versions_list.append(CF.img_version_unchanged(img_name, img_versions["to"]))
+    changelog_lines.extend(sorted(img_versions_list))  # let's have them in a predictable order
+
+    for changelog_section, section_lines in sorted(changelog.items()):  # type: str, list[tuple[str, str]]
+        changelog_lines.append(CF.section(changelog_section[1]))
+        changelog_lines.extend(CF.li(line[1]) for line in sorted(section_lines, key=lambda i: i[0]))
+        # ^ PRs sorted by mergedAt
+    if no_changes:
+        changelog_lines.append(CF.section(cfg["single_section_title"]))
+        changelog_lines.append(CF.li(cfg["no_changes_message"]))
+
+    return changelog_lines
+
+
+def backfill_changelog(
+    cfg: dict[str, Any],
+    repos_dir: Path,
+    gh_headers: dict[str, str],
+    release_tags: list[str],
+    root_repo_name_short: str,
+    version_config_file: str = "versions-config.json",
+) -> str:
+    """
+    Renders changelog sections for each pair of consecutive root repo release tags, newest first.
+
+    Repo versions of every release are read from the `versions-config.json` history of the root repo.
+    Each repository is walked with a single `git log` over the union of the ranges and its pull requests
+    are resolved once, so the cost is close to that of a single release spanning all of them.
+    """
+
+    root_repo_path = repos_dir / root_repo_name_short
+    release_tags = [normalize_tag(tag) for tag in release_tags]
+    versions_by_tag: dict[str, dict[str, str]] = {}
+    for tag in release_tags:
+        versions_by_tag[tag] = json.loads(gh.read_file_at_ref(root_repo_path, tag, version_config_file))
+        if cfg.get("include_root_repo_changes", True):
+            versions_by_tag[tag][root_repo_name_short] = tag
+
+    img_maps: list[dict[str, dict[str, str]]] = []
+    repo_maps: list[dict[str, dict[str, str]]] = []
+    for tag_from, tag_to in zip(release_tags, release_tags[1:]):
+        new_repo_versions: dict[str, str] = {}
+        for repo in cfg["repositories"]:
+            repo_images = repo.get("images", [])
+            if repo_images:
+                # the same rule as the "from" side, so consecutive ranges meet at the same version
+                new_repo_versions[repo["name"]] = repo_version_by_images(repo_images, versions_by_tag[tag_to])
+            elif repo["name"] in versions_by_tag[tag_to]:
+                new_repo_versions[repo["name"]] = versions_by_tag[tag_to][repo["name"]]
+
+        img_versions_by_name: dict[str, dict[str, str]] = defaultdict(dict)
+        repo_versions: dict[str, dict[str, str]] = defaultdict(dict)
+        populate_helper_maps(cfg, versions_by_tag[tag_from], new_repo_versions, img_versions_by_name, repo_versions)
+        img_maps.append(img_versions_by_name)
+        repo_maps.append(repo_versions)
+
+    prs_by_release: list[list[tuple[dict[str, Any], list[gh.PullRequestInfo]]]] = [[] for _ in repo_maps]
+    for repository in cfg["repositories"]:
+        repo_full_name = "/".join(repository["url"].split("/")[-2:])
+        tag_ranges = [(repo_versions[repository["name"]]["from"], repo_versions[repository["name"]]["to"]) for repo_versions in repo_maps]
+        with TRACER.span("gather repository", repo=repo_full_name) as span:
+            commits_by_range = gh.get_commits_for_ranges(tag_ranges, repos_dir / repository["name"])
+            all_commits = [commit for commits in commits_by_range for commit in commits]
+            LOGGER.info(f"Got {len(all_commits)} commits from {len(tag_ranges)} ranges for {repo_full_name}")
+
+            prs_by_sha = resolve_commits_prs(repo_full_name, all_commits, gh_headers, cfg)
+            span.update(commits=len(all_commits))
+        for idx, commits in enumerate(commits_by_range):
+            prs_by_release[idx].append((repository, collect_prs(commits, prs_by_sha)))
+
+    sections: list[str] = []
+    for idx, release_tag in enumerate(release_tags[1:]):
+        changelog_lines = render_changelog(
+            cfg,
+            release_tag,
+            gh.get_ref_date(root_repo_path, release_tag),
+            make_changelog(cfg, prs_by_release[idx]),
+            img_maps[idx],
+        )
+        sections.append("\n".join(changelog_lines) + "\n\n")
+
+    return "".join(reversed(sections))
+
+
 if __name__ == "__main__":
     print(
         'Note: this script operates under the assumption that repo version tag is '
@@ -258,7 +406,7 @@ if __name__ == "__main__":
     parser.add_argument("--changelog-path", type=Path, default=Path("../../../../CHANGELOG.md"))
     parser.add_argument("--version-config-path", required=True, type=Path, help="path to versions-config.json")
     parser.add_argument("--release-type", choices=("major", "minor", "patch"), default="minor")
-    parser.add_argument("--new-repo-versions", required=True, help=(
+    parser.add_argument("--new-repo-versions", help=(
         'a new version for each repo, space separated in the format "name:tag",'
         ' e.g. "datalens-backend:v0.2.0 datalens-ui:v0.3.0"'
     ))
@@ -269,6 +417,19 @@ if __name__ == "__main__":
         "do not modify files or create a Github release"
     ))
     parser.add_argument("--make-outputs", default=False, action="store_true", help="whether to create outputs file")
+    parser.add_argument("--backfill-tags", help=(
+        "regenerate changelog sections for past releases instead of making a new one: space separated"
+        ' root repo release tags, oldest first, e.g. "v1.20.0 v1.21.0 v1.22.0"; a section is rendered'
+        " for every tag but the first one"
+    ))
+    parser.add_argument("--backfill-output", type=Path, help="file to write the backfilled sections to")
+    parser.add_argument("--trace-path", type=Path, help=(
+        "write the spans of the run (clone, git log, GitHub requests, retry sleeps, ...) to this file"
+        " in the Chrome trace event format, viewable in chrome://tracing or Perfetto"
+    ))
+    parser.add_argument("--trace-summary", default=False, action="store_true", help=(
+        "print the time spent per phase and request type at the end of the run"
+    ))
 
     # Load configs
     args = parser.parse_args()
@@ -276,9 +437,44 @@ if __name__ == "__main__":
     if dry_run and args.create_release:
         print("Note: --create-release is ignored in a dry run")
 
+    if args.trace_path is not None:
+        atexit.register(TRACER.export_chrome_trace, args.trace_path)
+    if args.trace_summary:
+        atexit.register(lambda: print("Run profile:", TRACER.summary_table(), sep="\n"))
+
     with open(args.config_path, "r") as f:
         changelog_config: dict[str, Any] = json.load(f)
 
+    if args.backfill_tags:
+        backfill_tags = args.backfill_tags.split()
+        if len(backfill_tags) < 2:
+            parser.error("--backfill-tags needs at least two release tags")
+
+        gh_auth_headers = gh.make_gh_auth_headers_from_env()
+        with TRACER.span("clone repos"):
+            if not args.repos_dir.exists():
+                args.repos_dir.mkdir(parents=True)
+            for repo in changelog_config["repositories"]:
+                gh.clone_repository(repo["url"], args.repos_dir / repo["name"])
+
+        with TRACER.span("backfill", releases=len(backfill_tags) - 1):
+            backfill_result = backfill_changelog(
+                changelog_config,
+                args.repos_dir,
+                gh_auth_headers,
+                backfill_tags,
+                args.root_repo_name.split("/")[-1],
+                args.version_config_path.name,
+            )
+        print("Backfilled changelog content:", backfill_result, sep="\n")
+        if args.backfill_output is not None and not dry_run:
+            with open(args.backfill_output, "w") as f:
+                f.write(backfill_result)
+        sys.exit(0)
+
+    if args.new_repo_versions is None:
+        parser.error("--new-repo-versions is required unless --backfill-tags is passed")
+
     with open(args.version_config_path, "r") as f:
         current_repo_versions: dict[str, str] = json.load(f)
 
@@ -293,7 +489,8 @@ if __name__ == "__main__":
     gh_auth_headers = gh.make_gh_auth_headers_from_env()
     root_repo_name_full = args.root_repo_name
     root_repo_name_short = root_repo_name_full.split("/")[-1]
-    latest_release = gh.get_latest_repo_release(root_repo_name_full, gh_auth_headers)
+    with TRACER.span("latest release"):
+        latest_release = gh.get_latest_repo_release(root_repo_name_full, gh_auth_headers)
     new_release = release_bump_version(latest_release, args.release_type)
 
     # Prepare helper mappings
@@ -303,43 +500,19 @@ if __name__ == "__main__":
     populate_helper_maps(changelog_config, current_repo_versions, new_repo_versions)
 
     # Clone repos
-    if not args.repos_dir.exists():
-        args.repos_dir.mkdir(parents=True)
-    for repo in changelog_config["repositories"]:
-        gh.clone_repository(repo["url"], args.repos_dir / repo["name"])
+    with TRACER.span("clone repos"):
+        if not args.repos_dir.exists():
+            args.repos_dir.mkdir(parents=True)
+        for repo in changelog_config["repositories"]:
+            gh.clone_repository(repo["url"], args.repos_dir / repo["name"])
 
     # Gather changes
-    CF = ChangelogFormatter
-    changelog = gather_changelog(changelog_config, args.repos_dir, gh_auth_headers)
+    with TRACER.span("gather changelog"):
+        changelog = gather_changelog(changelog_config, args.repos_dir, gh_auth_headers)
 
     # Render changelog
-    changelog_lines: list[str] = []
-    no_changes = not bool(changelog)
-
-    changelog_lines.append(CF.release(new_release) + f" ({datetime.date.today()})")
-
-    changelog_lines.append(CF.section(changelog_config["images_versions_section"]))
-    img_versions_list: list[str] = []
-    for img_name, img_versions in IMG_VERSIONS_BY_NAME.items():
-        if img_versions["from"] != img_versions["to"]:
-            full_changelog_url = "{repo_url}/compare/v{v_from}...v{v_to}".format(
-                repo_url=REPO_CFG_BY_IMG[img_name]["url"],
-                v_from=img_versions["from"],
-                v_to=img_versions["to"],
-            )
-            img_versions_list.append(CF.img_version_changed(img_name, img_versions["from"], img_versions["to"], full_changelog_url))
-        else:
-            img_versions_list.append(CF.img_version_unchanged(img_name, img_versions["to"]))
-    changelog_lines.extend(sorted(img_versions_list))  # let's have them in a predictable order
-
-    for changelog_section, section_lines in sorted(changelog.items()):  # type: str, list[tuple[str, str]]
-        changelog_lines.append(CF.section(changelog_section[1]))
-        changelog_lines.extend(CF.li(line[1]) for line in sorted(section_lines, key=lambda i: i[0]))
-        # ^ PRs sorted by mergedAt
-    if no_changes:
-        changelog_lines.append(CF.section(changelog_config["single_section_title"]))
-        changelog_lines.append(CF.li(changelog_config["no_changes_message"]))
-
+    with TRACER.span("render changelog"):
+        changelog_lines = render_changelog(changelog_config, new_release, str(datetime.date.today()), changelog)
     changelog_result = "\n".join(changelog_lines) + "\n\n"
     print("Changelog content:", changelog_result, sep="\n")
 
@@ -368,19 +541,21 @@ if __name__ == "__main__":
 
     # Create GitHub release
     if args.create_release and not dry_run:
-        release_resp = requests.post(
-            f"https://api.github.com/repos/{root_repo_name_full}/releases",
-            headers=gh_auth_headers,
-            json=dict(
-                tag_name=new_release,
-                target_commitish="main",
-                name=changelog_lines[0].lstrip("# "),
-                body="\n".join(changelog_lines[1:]),  # without the 1st line
-                draft=True,
-                prerelease=False,
-                generate_release_notes=False,
+        with TRACER.span("create release", category="http", method="POST", url=f"/repos/{root_repo_name_full}/releases") as span:
+            release_resp = requests.post(
+                f"https://api.github.com/repos/{root_repo_name_full}/releases",
+                headers=gh_auth_headers,
+                json=dict(
+                    tag_name=new_release,
+                    target_commitish="main",
+                    name=changelog_lines[0].lstrip("# "),
+                    body="\n".join(changelog_lines[1:]),  # without the 1st line
+                    draft=True,
+                    prerelease=False,
+                    generate_release_notes=False,
+                )
             )
-        )
+            span.update(status=release_resp.status_code, bytes=len(release_resp.content))
         release_resp.raise_for_status()
         resp_body = release_resp.json()
         release_url = resp_body.get("html_url")
@@ -0,0 +1,117 @@
+""" Lightweight spans for the releaser scripts, exportable as a Chrome trace and as a summary table """
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import attr
+
+
+SLEEP_CATEGORY = "sleep"
+
+
+@attr.s(auto_attribs=True)
+class Span:
+    name: str
+    category: str
+    start: float  # seconds since the tracer origin
+    thread_id: int
+    duration: float = 0.0
+    args: dict[str, Any] = attr.ib(factory=dict)
+
+
+@attr.s(auto_attribs=True)
+class Tracer:
+    spans: list[Span] = attr.ib(factory=list)
+    _origin: float = attr.ib(factory=time.perf_counter, init=False)
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "phase", **args: Any) -> Iterator[dict[str, Any]]:
+        """ Times the block; the yielded dict can be filled with more args (status, bytes, ...) while inside it """
+
+        span = Span(
+            name=name,
+            category=category,
+            start=time.perf_counter() - self._origin,
+            thread_id=threading.get_ident(),
+            args=args,
+        )
+        try:
+            yield span.args
+        except BaseException as err:
+            span.args.setdefault("error", repr(err))
+            raise
+        finally:
+            span.duration = time.perf_counter() - self._origin - span.start
+            with self._lock:
+                self.spans.append(span)
+
+    def sleep(self, seconds: float, **args: Any) -> None:
+        """ time.sleep that is accounted separately from the useful work """
+
+        with self.span("sleep", category=SLEEP_CATEGORY, seconds=seconds, **args):
+            time.sleep(seconds)
+
+    def to_chrome_trace(self) -> dict[str, Any]:
+        pid = os.getpid()
+        thread_ids = {thread_id: idx for idx, thread_id in enumerate(dict.fromkeys(span.thread_id for span in self.spans))}
+        events = [
+            dict(
+                name=span.name,
+                cat=span.category,
+                ph="X",
+                ts=round(span.start * 1e6),
+                dur=round(span.duration * 1e6),
+                pid=pid,
+                tid=thread_ids[span.thread_id],
+                args=span.args,
+            )
+            for span in sorted(self.spans, key=lambda span: span.start)
+        ]
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def export_chrome_trace(self, path: Path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def summary_table(self) -> str:
+        totals: dict[tuple[str, str], list[float]] = defaultdict(list)
+        for span in self.spans:
+            totals[(span.category, span.name)].append(span.duration)
+
+        header = f"{'category':<10} {'name':<32} {'count':>6} {'total, s':>10} {'mean, ms':>10} {'max, ms':>10}"
+        lines = [header, "-" * len(header)]
+        for (category, name), durations in sorted(totals.items(), key=lambda item: -sum(item[1])):
+            lines.append(
+                f"{category:<10} {name[:32]:<32} {len(durations):>6} {sum(durations):>10.3f}"
+                f" {sum(durations) / len(durations) * 1e3:>10.1f} {max(durations) * 1e3:>10.1f}"
+            )
+
+        wall_time = time.perf_counter() - self._origin
+        # sleeps of concurrent workers overlap, each moment of the timeline is counted once
+        sleep_time = _union_length(
+            (span.start, span.start + span.duration) for span in self.spans if span.category == SLEEP_CATEGORY
+        )
+        lines.append("-" * len(header))
+        lines.append(f"wall time: {wall_time:.3f}s, retry sleeps: {sleep_time:.3f}s, work: {wall_time - sleep_time:.3f}s")
+        return "\n".join(lines)
+
+
+def _union_length(intervals: Iterable[tuple[float, float]]) -> float:
+    """ Total length of the timeline covered by at least one of the (start, end) intervals """
+
+    total = 0.0
+    covered_until = float("-inf")
+    for start, end in sorted(intervals):
+        if end > covered_until:
+            total += end - max(start, covered_until)
+            covered_until = end
+    return total
+
+
+TRACER = Tracer()
@@ -11,7 +11,7 @@ import github_helpers as gh
 def update_release_body(repo_full_name: str, headers: dict[str, str], release_tag: str, new_body: str) -> str:
     """ Updates the release description with the passed content, returns release url """
 
-    release_id = gh.find_release_by_tag(args.root_repo_name, gh_auth_headers, release_tag)
+    release_id = gh.find_release_by_tag(repo_full_name, headers, release_tag)
 
     release_resp = gh.request_with_retries(
         functools.partial(
@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
+import os
+import re
 import sys
 import json
+import stat
+import time
+import socket
+import asyncio
+import argparse
 import datetime
-from typing import Dict, Any, Optional
+import concurrent.futures
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Any, List, Optional, Tuple
 from rich.console import Console
 from rich.text import Text
 
@@ -152,15 +162,8 @@ def format_log(log_obj: Dict[str, Any]) -> Text:
     # Format message
     message = fields.get("message")
     if message:
-        message_str = str(message)
-        # Check if message is very long and might contain structured data
-        if len(message_str) > 200 and (
-            "headers:" in message_str or "method:" in message_str
-        ):
-            # Try to format structured message more nicely
-            text.append(format_structured_message(message_str), style="white")
-        else:
-            text.append(message_str, style="white")
+        # Shorten structured messages (HTTP requests, SQL queries, ...) to their key info
+        text.append(format_structured_message(str(message)), style="white")
 
     # Add context information on new lines
     context_added = False
@@ -263,95 +266,475 @@ def format_log(log_obj: Dict[str, Any]) -> Text:
     return text
 
 
+@dataclass
+class MessageParser:
+    """A message shape: a cheap guard and the extractor of its key info."""
+
+    name: str
+    guard: Callable[[str], bool]
+    extract: Callable[[str], Optional[str]]
+    hits: int = 0
+    misses: int = 0
+    seconds: float = 0.0
+
+    def parse(self, message: str) -> Optional[str]:
+        started = time.perf_counter()
+        result = self.extract(message)
+        self.seconds += time.perf_counter() - started
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+
+_HTTP_METHOD_RE = re.compile(r"method:([^,]+)")
+_HTTP_PATH_RE = re.compile(r"path:([^,]+)")
+
+
+def _http_guard(message: str) -> bool:
+    return len(message) > 200 and ("headers:" in message or "method:" in message)
+
+
+def _extract_http(message: str) -> Optional[str]:
+    """HTTP request messages: `method: GET, path: /api, headers: {...}`."""
+    method_match = _HTTP_METHOD_RE.search(message)
+    path_match = _HTTP_PATH_RE.search(message)
+    if method_match is None or path_match is None:
+        return None
+    method = method_match.group(1).strip()
+    path = path_match.group(1).strip()
+    if not method or not path:
+        return None
+    return f"{method} {path}"
+
+
+_SQL_IDENT = r"(?:\"?\w+\"?\.)?\"?\w+\"?"
+# A leading keyword alone is not enough ("Update available for ...", "With retries exhausted, ..."): the
+# statement has to be logged by the ORM or look like SQL, in upper case
+_SQL_RE = re.compile(
+    r"\s*(?:Executing \([^)]*\):\s*|(?="
+    r"SELECT\b.*?\bFROM\s"
+    r"|INSERT INTO\s"
+    rf"|UPDATE\s+{_SQL_IDENT}\s+SET\s"
+    r"|DELETE FROM\s"
+    rf"|WITH\s+(?:RECURSIVE\s+)?{_SQL_IDENT}(?:\s*\([^)]*\))?\s+AS\s*\("
+    r"))(SELECT|INSERT|UPDATE|DELETE|WITH)\b",
+    re.DOTALL,
+)
+_SQL_TABLE_RE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|JOIN)\s+((?:\"?\w+\"?\.)?\"?\w+\"?)", re.IGNORECASE
+)
+_WHITESPACE_RE = re.compile(r"\s+")
+# Long statements are cut to this length only when asked to, e.g. PRETTY_LOG_SQL_MAX_LENGTH=200
+SQL_MAX_LENGTH = int(os.environ.get("PRETTY_LOG_SQL_MAX_LENGTH", "0"))
+
+
+def _extract_sql(message: str) -> Optional[str]:
+    """SQL query logs, e.g. knex/sequelize `Executing (default): SELECT ...`."""
+    match = _SQL_RE.match(message)
+    if match is None:
+        return None
+    statement = _WHITESPACE_RE.sub(" ", message[match.start(1) :]).strip()
+    table_match = _SQL_TABLE_RE.search(statement)
+    table = f" {table_match.group(1)}" if table_match else ""
+    if SQL_MAX_LENGTH and len(statement) > SQL_MAX_LENGTH:
+        statement = statement[:SQL_MAX_LENGTH] + "..."
+    return f"SQL {match.group(1)}{table}: {statement}"
+
+
+# The whole message has to be the call, its status and duration, anything else (an error, a status before
+# the URL) would be lost in the short form
+_UPSTREAM_RE = re.compile(
+    r"\s*(GET|POST|PUT|PATCH|DELETE|HEAD|OPTIONS)\s+(https?://[^\s,]+)"
+    r"(?:[\s,]+(?:status(?:_code)?[:=]\s*)?([1-5]\d\d))?"
+    r"(?:[\s,]+(?:in\s+)?(\d+(?:\.\d+)?)\s*ms)?[\s,.]*"
+)
+
+
+def _extract_upstream(message: str) -> Optional[str]:
+    """Calls to upstream services: `GET https://host/path 200 35ms`."""
+    match = _UPSTREAM_RE.fullmatch(message)
+    if match is None:
+        return None
+    method, url, status, duration = match.groups()
+    result = f"-> {method} {url}"
+    if status:
+        result += f" {status}"
+    if duration:
+        result += f" ({duration}ms)"
+    return result
+
+
+# Parsers in dispatch order, the first one whose guard matches is used
+MESSAGE_PARSERS: List[MessageParser] = [
+    MessageParser("http", _http_guard, _extract_http),
+    MessageParser("sql", _SQL_RE.match, _extract_sql),
+    MessageParser("upstream", lambda message: "://" in message, _extract_upstream),
+]
+
+
+def register_parser(parser: MessageParser, first: bool = False) -> None:
+    """Add a message parser to the registry."""
+    if first:
+        MESSAGE_PARSERS.insert(0, parser)
+    else:
+        MESSAGE_PARSERS.append(parser)
+
+
 def format_structured_message(message: str) -> str:
     """Format structured messages (like HTTP requests) more nicely."""
-    # Try to break up long structured messages
-    if "headers:" in message:
-        parts = message.split("headers:")
-        if len(parts) == 2:
-            prefix = parts[0].strip()
-            headers_part = parts[1].strip()
-
-            # Try to parse headers if they look like a dict
-            if headers_part.startswith("{") and headers_part.endswith("}"):
-                try:
-                    # Extract just the method and path for the main line
-                    method_match = prefix.find("method:")
-                    path_match = prefix.find("path:")
-
-                    if method_match != -1 and path_match != -1:
-                        # Extract method and path
-                        method_part = (
-                            prefix[method_match:]
-                            .split(",")[0]
-                            .replace("method:", "")
-                            .strip()
-                        )
-                        path_part = (
-                            prefix[path_match:]
-                            .split(",")[0]
-                            .replace("path:", "")
-                            .strip()
-                        )
-                        return f"{method_part} {path_part}"
-                except:
-                    pass
-
-    # For other structured messages, try to extract key info
-    if "method:" in message and "path:" in message:
-        try:
-            method_start = message.find("method:") + 7
-            method_end = message.find(",", method_start)
-            if method_end == -1:
-                method_end = message.find(" ", method_start)
-
-            path_start = message.find("path:") + 5
-            path_end = message.find(",", path_start)
-            if path_end == -1:
-                path_end = message.find(" ", path_start)
-
-            if method_end > method_start and path_end > path_start:
-                method = message[method_start:method_end].strip()
-                path = message[path_start:path_end].strip()
-                return f"{method} {path}"
-        except:
-            pass
-
-    return message
-
-
-def pretty_print_log(line: str) -> None:
-    """Pretty print a single log line."""
+    parser = next((p for p in MESSAGE_PARSERS if p.guard(message)), None)
+    if parser is None:
+        return message
+    result = parser.parse(message)
+    return message if result is None else result
+
+
+def print_parser_stats() -> None:
+    """Print per-parser hit counts and time to stderr."""
+    stats_console = Console(stderr=True)
+    for parser in MESSAGE_PARSERS:
+        stats_console.print(
+            f"[dim]{parser.name:10} hits={parser.hits} misses={parser.misses} "
+            f"time={parser.seconds * 1000:.3f}ms[/dim]"
+        )
+
+
+def pretty_print_log(line: str, prefix: Optional[Text] = None) -> None:
+    """Pretty print a single log line, after the prefix if any."""
     try:
         log_obj = json.loads(line.strip())
 
         if isinstance(log_obj, dict):
             formatted = format_log(log_obj)
-            console.print(formatted)
         else:
             # Not a dict, just print as JSON
-            console.print(json.dumps(log_obj, indent=2))
+            formatted = Text(json.dumps(log_obj, indent=2))
+        console.print(Text.assemble(prefix, formatted) if prefix else formatted)
 
     except json.JSONDecodeError:
         # Not JSON, print as-is
-        console.print(line, end="")
+        if prefix:
+            console.print(Text.assemble(prefix, line), end="")
+        else:
+            console.print(line, end="")
     except Exception as e:
         # Any other error, print original line
         console.print(f"[dim red]Error formatting log: {e}[/dim red]")
         console.print(line, end="")
 
 
+# Collector mode: many producers send their logs to a single pretty-log over a socket, e.g.
+#   python dev/python/pretty-log.py --listen :5170
+#   PRETTY_LOG=true PRETTY_LOG_COLLECTOR=host.docker.internal:5170 docker compose -f docker-compose.dev.yaml up
+# A producer may start with a `#source NAME` line to name its logs, see `forward`
+SOURCE_LINE_PREFIX = b"#source "
+COLLECTOR_BUFFER_SIZE = 64 * 1024
+COLLECTOR_MAX_LINE = 16 * 1024 * 1024
+SOURCE_HIGH_WATER = 10000  # queued lines of a source before reading from it is paused
+SOURCE_LOW_WATER = 1000  # queued lines of a paused source when reading is resumed
+RENDER_ROUND_LINES = 256  # lines taken from a source per round of the output stage
+SOURCE_STYLES = [
+    "magenta",
+    "cyan",
+    "yellow",
+    "blue",
+    "bright_magenta",
+    "bright_cyan",
+    "bright_yellow",
+    "bright_blue",
+]
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """Parse `unix:PATH`, a path, `tcp:HOST:PORT` or `HOST:PORT`."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:") :]
+    if "/" in address:
+        return "unix", address
+    if address.startswith("tcp:"):
+        address = address[len("tcp:") :]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host.strip("[]") or None, int(port))
+
+
+@dataclass
+class Source:
+    """A producer of the collector, with its queued lines and rate accounting."""
+
+    name: str
+    style: str
+    lines: Deque[str] = field(default_factory=deque)
+    transport: Optional[asyncio.BaseTransport] = None
+    paused: bool = False
+    connections: int = 0
+    first_seen: float = field(default_factory=time.monotonic)
+    total_lines: int = 0
+    total_bytes: int = 0
+    window_lines: int = 0
+    window_started: float = field(default_factory=time.monotonic)
+
+    @property
+    def connected(self) -> bool:
+        return self.transport is not None
+
+    def prefix(self) -> Text:
+        return Text(f"{self.name} | ", style=self.style)
+
+
+class LogCollector:
+    """Queues the lines of every source and renders them in a single output stage."""
+
+    def __init__(self):
+        self.sources: Dict[str, Source] = {}
+        self._ready = asyncio.Event()
+        self._anonymous = 0
+
+    def connect(self, name: Optional[str], transport: asyncio.BaseTransport) -> Source:
+        """Return the source of a new connection, a reconnecting producer keeps its source."""
+        if name is None:
+            peer = transport.get_extra_info("peername")
+            if isinstance(peer, tuple):
+                name = f"{peer[0]}:{peer[1]}"
+            else:
+                self._anonymous += 1
+                name = f"unix#{self._anonymous}"
+        base_name, number = name, 1
+        while name in self.sources and self.sources[name].connected:
+            number += 1
+            name = f"{base_name}#{number}"
+        source = self.sources.get(name)
+        if source is None:
+            style = SOURCE_STYLES[len(self.sources) % len(SOURCE_STYLES)]
+            source = self.sources[name] = Source(name, style)
+        source.transport = transport
+        source.connections += 1
+        return source
+
+    def push(self, source: Source, line: str, size: int) -> None:
+        source.lines.append(line)
+        source.total_lines += 1
+        source.window_lines += 1
+        source.total_bytes += size
+        if len(source.lines) >= SOURCE_HIGH_WATER and not source.paused:
+            # only this producer waits for the output, the others keep being read
+            source.transport.pause_reading()
+            source.paused = True
+        self._ready.set()
+
+    def disconnect(self, source: Source) -> None:
+        source.transport = None
+        source.paused = False
+        self._ready.set()
+
+    def _take_round(self) -> List[Tuple[Source, str]]:
+        """Take up to RENDER_ROUND_LINES lines of every source, so no producer holds up the others."""
+        batch = []
+        for source in self.sources.values():
+            for _ in range(min(RENDER_ROUND_LINES, len(source.lines))):
+                batch.append((source, source.lines.popleft()))
+            if source.paused and len(source.lines) <= SOURCE_LOW_WATER:
+                source.transport.resume_reading()
+                source.paused = False
+        return batch
+
+    @staticmethod
+    def _render(batch: List[Tuple[Source, str]]) -> None:
+        for source, line in batch:
+            pretty_print_log(line, source.prefix())
+
+    async def render_loop(self) -> None:
+        """The output stage: rendering runs in its own thread while the sockets are read."""
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while batch := self._take_round():
+                    await loop.run_in_executor(executor, self._render, batch)
+
+    def print_stats(self) -> None:
+        """Print per-source line counts and rates to stderr."""
+        stats_console = Console(stderr=True)
+        now = time.monotonic()
+        for source in self.sources.values():
+            window = max(now - source.window_started, 1e-6)
+            lifetime = max(now - source.first_seen, 1e-6)
+            stats_console.print(
+                f"[dim]{source.name:20} lines={source.total_lines} bytes={source.total_bytes} "
+                f"rate={source.window_lines / window:.1f}/s avg={source.total_lines / lifetime:.1f}/s "
+                f"queued={len(source.lines)} connections={source.connections}"
+                f"{'' if source.connected else ' (disconnected)'}[/dim]"
+            )
+            source.window_lines = 0
+            source.window_started = now
+
+
+class CollectorProtocol(asyncio.BufferedProtocol):
+    """Reads NDJSON of one connection into a preallocated buffer, lines are decoded from views of it."""
+
+    def __init__(self, collector: LogCollector):
+        self._collector = collector
+        self._buffer = bytearray(COLLECTOR_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._end = 0
+        self._transport: Optional[asyncio.BaseTransport] = None
+        self._source: Optional[Source] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if self._end == len(self._buffer):
+            if len(self._buffer) >= COLLECTOR_MAX_LINE:
+                # a line that does not fit even the largest buffer is printed in pieces
+                self._line(self._view[: self._end])
+                self._end = 0
+            else:
+                buffer = bytearray(len(self._buffer) * 2)
+                buffer[: self._end] = self._view[: self._end]
+                self._buffer, self._view = buffer, memoryview(buffer)
+        return self._view[self._end :]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        start, end = 0, self._end + nbytes
+        newline = self._buffer.find(b"\n", self._end, end)
+        while newline >= 0:
+            self._line(self._view[start : newline + 1])
+            start = newline + 1
+            newline = self._buffer.find(b"\n", start, end)
+        if start:
+            # only the incomplete last line is moved to the start of the buffer
+            self._buffer[: end - start] = self._buffer[start:end]
+        self._end = end - start
+
+    def _line(self, line: memoryview) -> None:
+        if self._source is None:
+            name = None
+            if line[: len(SOURCE_LINE_PREFIX)] == SOURCE_LINE_PREFIX:
+                name = str(line[len(SOURCE_LINE_PREFIX) :], "utf-8", "replace").strip()
+            self._source = self._collector.connect(name or None, self._transport)
+            if name is not None:
+                return
+        if len(line) > 1:  # skip empty lines
+            self._collector.push(self._source, str(line, "utf-8", "replace"), len(line))
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self._end:
+            self._line(self._view[: self._end])
+            self._end = 0
+        if self._source is not None:
+            self._collector.disconnect(self._source)
+
+
+async def collect(
+    collector: LogCollector, addresses: List[str], stats_interval: float
+) -> None:
+    """Listen on the addresses and render the logs of all producers."""
+    loop = asyncio.get_running_loop()
+    status_console = Console(stderr=True)
+    for address in addresses:
+        kind, target = parse_address(address)
+        if kind == "unix":
+            if os.path.exists(target) and stat.S_ISSOCK(os.stat(target).st_mode):
+                os.unlink(target)
+            await loop.create_unix_server(lambda: CollectorProtocol(collector), target)
+            os.chmod(target, 0o666)  # producers in containers run as other users
+        else:
+            await loop.create_server(lambda: CollectorProtocol(collector), *target)
+        status_console.print(f"[dim]Collecting logs on {address}[/dim]")
+
+    tasks = [collector.render_loop()]
+    if stats_interval > 0:
+
+        async def _report_stats():
+            while True:
+                await asyncio.sleep(stats_interval)
+                collector.print_stats()
+
+        tasks.append(_report_stats())
+    await asyncio.gather(*tasks)
+
+
+def forward(address: str, source: str) -> None:
+    """Send stdin to a collector, print it locally while the collector is unavailable."""
+    kind, target = parse_address(address)
+    sock: Optional[socket.socket] = None
+    try:
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(target)
+        else:
+            sock = socket.create_connection((target[0] or "localhost", target[1]))
+        sock.sendall(SOURCE_LINE_PREFIX + source.encode() + b"\n")
+    except OSError as e:
+        console.print(
+            f"[dim red]Collector {address} is unavailable ({e}), printing locally[/dim red]"
+        )
+        sock = None
+
+    for line in sys.stdin.buffer:
+        if sock is not None:
+            try:
+                sock.sendall(line)
+                continue
+            except OSError as e:
+                console.print(
+                    f"[dim red]Lost collector {address} ({e}), printing locally[/dim red]"
+                )
+                sock = None
+        if line.strip():
+            pretty_print_log(line.decode("utf-8", "replace"))
+
+
 def main():
-    """Main function to process stdin."""
+    """Main function to process stdin, or to collect logs from sockets."""
+    parser = argparse.ArgumentParser(description="Pretty print JSON logs")
+    parser.add_argument(
+        "--listen",
+        action="append",
+        default=[],
+        metavar="ADDRESS",
+        help="collect NDJSON logs on unix:PATH or HOST:PORT, can be repeated",
+    )
+    parser.add_argument(
+        "--forward", metavar="ADDRESS", help="send stdin to a collector instead"
+    )
+    parser.add_argument(
+        "--source",
+        default=socket.gethostname(),
+        help="name of the logs in the collector output",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=0,
+        help="seconds between per-source stats of the collector",
+    )
+    args = parser.parse_args()
+
+    collector = None
     try:
-        for line in sys.stdin:
-            if line.strip():  # Skip empty lines
-                pretty_print_log(line)
+        if args.listen:
+            collector = LogCollector()
+            asyncio.run(collect(collector, args.listen, args.stats_interval))
+        elif args.forward:
+            forward(args.forward, args.source)
+        else:
+            for line in sys.stdin:
+                if line.strip():  # Skip empty lines
+                    pretty_print_log(line)
     except KeyboardInterrupt:
         pass
     except BrokenPipeError:
         # Handle broken pipe gracefully (e.g., when piping to head)
         pass
+    finally:
+        if os.environ.get("PRETTY_LOG_STATS") == "true":
+            print_parser_stats()
+            if collector is not None:
+                collector.print_stats()
 
 
 if __name__ == "__main__":
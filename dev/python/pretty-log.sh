@@ -5,4 +5,9 @@ set -eo pipefail
 # [-e] - immediately exit if any command has a non-zero exit status
 # [-o pipefail] - if any command in a pipeline fails, that return code will be used as the return code of the whole pipeline
 
-${RUN_DEV} | python /opt/dev/pretty-log.py
+# PRETTY_LOG_COLLECTOR - address of a shared `pretty-log.py --listen` collector, e.g. host.docker.internal:5170
+if [ -n "${PRETTY_LOG_COLLECTOR}" ]; then
+  ${RUN_DEV} | python /opt/dev/pretty-log.py --forward "${PRETTY_LOG_COLLECTOR}" --source "${PRETTY_LOG_SOURCE:-$(hostname)}"
+else
+  ${RUN_DEV} | python /opt/dev/pretty-log.py
+fi
@@ -1,12 +1,124 @@
+"""
+Fernet helper for connection secrets.
+
+    crypto.py KEY VALUE                      - encrypt a single value (the historical interface)
+    crypto.py KEY --decrypt VALUE            - decrypt a single value
+    crypto.py KEY --stream ndjson            - encrypt every JSON string read from stdin, one per line
+    crypto.py KEY --stream length-prefixed   - same for records framed with a 4-byte big-endian length
+
+With --stream the results are written to stdout in the input order and framing, `--decrypt` switches
+the direction. A null record, skipped as-is or written for an invalid token with --skip-invalid, is
+JSON null in ndjson and the length 0xFFFFFFFF without data in length-prefixed framing, so it stays
+distinct from an empty string. The key is set up once per process, so a whole file costs a single interpreter start.
+"""
+import argparse
+import json
+import struct
 import sys
+from typing import BinaryIO, Iterator, Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+
+LENGTH_PREFIX = struct.Struct(">I")
+NULL_LENGTH = 0xFFFFFFFF
+
+
+def iter_ndjson(stream: BinaryIO) -> Iterator[Optional[bytes]]:
+    for line in stream:
+        if not line.strip():
+            continue
+        value = json.loads(line)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"Expected a JSON string or null per line, got: {line[:100]!r}")
+        yield None if value is None else value.encode("utf-8")
+
+
+def write_ndjson(stream: BinaryIO, value: Optional[bytes]) -> None:
+    stream.write(json.dumps(None if value is None else value.decode("utf-8"), ensure_ascii=False).encode("utf-8"))
+    stream.write(b"\n")
+
+
+def iter_length_prefixed(stream: BinaryIO) -> Iterator[Optional[bytes]]:
+    while True:
+        header = stream.read(LENGTH_PREFIX.size)
+        if not header:
+            return
+        if len(header) != LENGTH_PREFIX.size:
+            raise ValueError("Truncated record length")
+        (length,) = LENGTH_PREFIX.unpack(header)
+        if length == NULL_LENGTH:
+            yield None
+            continue
+        value = stream.read(length)
+        if len(value) != length:
+            raise ValueError(f"Truncated record: expected {length} bytes, got {len(value)}")
+        yield value
+
 
-from cryptography.fernet import Fernet
+def write_length_prefixed(stream: BinaryIO, value: Optional[bytes]) -> None:
+    if value is None:
+        stream.write(LENGTH_PREFIX.pack(NULL_LENGTH))
+        return
+    if len(value) >= NULL_LENGTH:
+        raise ValueError(f"Record of {len(value)} bytes is too long for a 4-byte length")
+    stream.write(LENGTH_PREFIX.pack(len(value)))
+    stream.write(value)
+
+
+STREAM_FORMATS = {
+    "ndjson": (iter_ndjson, write_ndjson),
+    "length-prefixed": (iter_length_prefixed, write_length_prefixed),
+}
+
+
+def process_stream(fernet: Fernet, stream_format: str, decrypt: bool, skip_invalid: bool, src: BinaryIO, dst: BinaryIO) -> int:
+    read_records, write_record = STREAM_FORMATS[stream_format]
+    transform = fernet.decrypt if decrypt else fernet.encrypt
+
+    count = 0
+    for value in read_records(src):
+        if value is not None:
+            try:
+                value = transform(value)
+            except InvalidToken:
+                if not skip_invalid:
+                    raise ValueError(f"Record #{count + 1} is not a valid token for this key")
+                value = None
+        write_record(dst, value)
+        count += 1
+
+    dst.flush()
+    return count
 
 
 def main():
-    fernet = Fernet(sys.argv[1])
-    encrypted = fernet.encrypt(sys.argv[2].encode("utf-8")).decode()
-    print(encrypted)
+    # keep `crypto.py KEY VALUE` working for any value, even one that looks like an option
+    if len(sys.argv) == 3 and sys.argv[2] not in ("--decrypt", "--stream", "-h", "--help"):
+        fernet = Fernet(sys.argv[1])
+        print(fernet.encrypt(sys.argv[2].encode("utf-8")).decode())
+        return
+
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt connection secrets with a Fernet key")
+    parser.add_argument("key", help="Fernet key (CONTROL_API_CRYPTO_KEY)")
+    parser.add_argument("value", nargs="?", help="single value to process, omit with --stream")
+    parser.add_argument("--decrypt", action="store_true", help="decrypt instead of encrypting")
+    parser.add_argument("--stream", choices=sorted(STREAM_FORMATS), help="process all records from stdin")
+    parser.add_argument("--skip-invalid", action="store_true", help="write null for tokens that fail to decrypt")
+    args = parser.parse_intermixed_args()
+
+    fernet = Fernet(args.key)
+
+    if args.stream is not None:
+        if args.value is not None:
+            parser.error("a value can not be combined with --stream")
+        process_stream(fernet, args.stream, args.decrypt, args.skip_invalid, sys.stdin.buffer, sys.stdout.buffer)
+        return
+
+    if args.value is None:
+        parser.error("a value or --stream is required")
+    value = args.value.encode("utf-8")
+    print((fernet.decrypt(value) if args.decrypt else fernet.encrypt(value)).decode())
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Re-encrypts connection secrets of UnitedStorage entries with a new crypto key.
+
+Every `{"<field>": {"cypher_text": ..., "key_id": ...}}` object in `entries.unversioned_data` (`password`,
+`token`, ...) is decrypted with any of the old keys and encrypted with the new one, MultiFernet style.
+Rows are read either from a us-dump.sh dump, which is then written out re-encrypted, or straight from the
+database, where only the changed rows are updated, in batches. The crypto work runs in a process pool.
+
+    crypto_rotate.py --new-key NEW --old-key OLD [--old-key OLDER ...] --dump in.sql --output out.sql
+    crypto_rotate.py --new-key NEW --old-key OLD --db
+"""
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+import us_db
+import us_dump
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+ON_INVALID_CHOICES = ("fail", "keep", "null")
+
+_KEY_RING: Optional[MultiFernet] = None
+_KEY_ID = "KEY"
+_ON_INVALID = "fail"
+
+
+def make_key_ring(new_key: str, old_keys: list[str]) -> MultiFernet:
+    """ Encrypts with the new key, decrypts with any of the keys """
+
+    return MultiFernet([Fernet(key) for key in [new_key, *old_keys]])
+
+
+def _init_worker(new_key: str, old_keys: list[str], key_id: str, on_invalid: str) -> None:
+    global _KEY_RING, _KEY_ID, _ON_INVALID
+    _KEY_RING = make_key_ring(new_key, old_keys)
+    _KEY_ID = key_id
+    _ON_INVALID = on_invalid
+
+
+def rotate_secrets(unversioned_data: dict[str, Any], entry_id: str) -> tuple[int, int]:
+    """ Re-encrypts the secrets in place, returns the number of rotated and invalid ones """
+
+    rotated = invalid = 0
+    for field, secret in unversioned_data.items():
+        if not isinstance(secret, dict) or not isinstance(secret.get("cypher_text"), str):
+            continue
+        try:
+            secret["cypher_text"] = _KEY_RING.rotate(secret["cypher_text"].encode()).decode()
+        except InvalidToken:
+            invalid += 1
+            if _ON_INVALID == "fail":
+                raise ValueError(f"Could not decrypt {field} of entry {entry_id} with any of the old keys")
+            if _ON_INVALID == "keep":
+                continue
+            secret["cypher_text"] = _KEY_RING.encrypt(b"null").decode()  # same as us-restore.sh --fix-connections
+        secret["key_id"] = _KEY_ID
+        rotated += 1
+    return rotated, invalid
+
+
+def _rotate_dump_batch(statements: list[str]) -> tuple[str, int, int]:
+    """ Worker: re-encrypts the entries INSERTs of a dump chunk, returns the chunk text and counters """
+
+    rotated = invalid = 0
+    chunks: list[str] = []
+    for statement in statements:
+        row = us_dump.parse_insert(statement, ("entries",)) if "cypher_text" in statement else None
+        if row is None or row.get("unversioned_data") is None:
+            chunks.append(statement)
+            continue
+        data = json.loads(row.get("unversioned_data"))
+        row_rotated, row_invalid = rotate_secrets(data, row.get("entry_id"))
+        rotated += row_rotated
+        invalid += row_invalid
+        if row_rotated:
+            row.set("unversioned_data", json.dumps(data, ensure_ascii=False))
+            chunks.append(us_dump.render_insert(row))
+        else:
+            chunks.append(statement)
+    return "".join(chunks), rotated, invalid
+
+
+def _rotate_db_batch(rows: list[list[str]]) -> tuple[list[tuple[str, str]], int, int]:
+    """ Worker: re-encrypts (entry_id, unversioned_data) pairs, returns only the changed ones """
+
+    rotated = invalid = 0
+    changed: list[tuple[str, str]] = []
+    for entry_id, raw_data in rows:
+        data = json.loads(raw_data)
+        row_rotated, row_invalid = rotate_secrets(data, entry_id)
+        rotated += row_rotated
+        invalid += row_invalid
+        if row_rotated:
+            changed.append((entry_id, json.dumps(data, ensure_ascii=False)))
+    return changed, rotated, invalid
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def ordered_map(executor: concurrent.futures.Executor, func: Callable[[T], R], items: Iterable[T], window: int) -> Iterator[R]:
+    """ Like executor.map, but keeps at most `window` tasks in flight, so the input is consumed lazily """
+
+    pending: collections.deque = collections.deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def rotate_dump(executor: concurrent.futures.Executor, src: str, dst: str, batch_size: int, window: int) -> tuple[int, int]:
+    rotated = invalid = 0
+    with us_dump.open_dump(src) as fi, us_dump.open_output(dst) as fo:
+        batches = batched(us_dump.iter_statements(fi), batch_size)
+        for text, batch_rotated, batch_invalid in ordered_map(executor, _rotate_dump_batch, batches, window):
+            fo.write(text)
+            rotated += batch_rotated
+            invalid += batch_invalid
+    return rotated, invalid
+
+
+def rotate_db(executor: concurrent.futures.Executor, batch_size: int, window: int) -> tuple[int, int]:
+    rows = us_db.copy_out_csv(
+        "SELECT entry_id, unversioned_data::text FROM entries WHERE unversioned_data::text LIKE '%\"cypher_text\"%'"
+    )
+    rotated = invalid = 0
+    psql = us_db.open_psql_input("--single-transaction")
+    try:
+        for changed, batch_rotated, batch_invalid in ordered_map(executor, _rotate_db_batch, batched(rows, batch_size), window):
+            rotated += batch_rotated
+            invalid += batch_invalid
+            if not changed:
+                continue
+            values = ",\n".join(f"({int(entry_id)}, {us_dump.sql_literal(data)})" for entry_id, data in changed)
+            psql.stdin.write(
+                "UPDATE entries SET unversioned_data = v.data::jsonb\n"
+                f"FROM (VALUES\n{values}\n) AS v(entry_id, data)\n"
+                "WHERE entries.entry_id = v.entry_id;\n"
+            )
+    except BaseException:
+        # nothing of a failed rotation is committed
+        us_db.abort_psql_input(psql)
+        raise
+    us_db.close_psql_input(psql)
+    return rotated, invalid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encrypt UnitedStorage connection secrets with a new crypto key")
+    parser.add_argument("--new-key", default=os.getenv("CONTROL_API_CRYPTO_KEY"), help="key to encrypt with, CONTROL_API_CRYPTO_KEY by default")
+    parser.add_argument("--old-key", action="append", default=[], help="key the secrets may be encrypted with, can be repeated")
+    parser.add_argument("--key-id", default="KEY", help="key_id to set on the re-encrypted secrets")
+    parser.add_argument("--on-invalid", choices=ON_INVALID_CHOICES, default="fail", help=(
+        "what to do with a secret none of the keys can decrypt: fail, keep it as is,"
+        " or replace it with an encrypted null like --fix-connections does"
+    ))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dump", help="us-dump.sh dump to read, '-' for stdin")
+    source.add_argument("--db", action="store_true", help="rotate the secrets in the UnitedStorage database in place")
+    parser.add_argument("--output", default="-", help="where to write the re-encrypted dump, '-' for stdout")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if not args.new_key:
+        parser.error("--new-key or CONTROL_API_CRYPTO_KEY is required")
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_init_worker,
+            initargs=(args.new_key, args.old_key, args.key_id, args.on_invalid),
+        ) as executor:
+            window = args.jobs * 2
+            if args.db:
+                rotated, invalid = rotate_db(executor, args.batch_size, window)
+            else:
+                rotated, invalid = rotate_dump(executor, args.dump, args.output, args.batch_size, window)
+    except ValueError as err:
+        sys.exit(f"  error: {err}")
+
+    print(f"  re-encrypted secrets: {rotated}, not decryptable: {invalid}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -67,30 +67,43 @@ export PGPASSWORD="${POSTGRES_PASSWORD_US}"
 
 FERNET_POSTGRES_PASSWORD=$(python /init/crypto.py "${CONTROL_API_CRYPTO_KEY}" "${POSTGRES_PASSWORD_DEMO}")
 
+# variants are stored as row-level deltas against the base demo data, see us_variant.py
+DEMO_VARIANT="d3"
 if [ "${HC}" == "1" ]; then
-  echo "  [demo] mode: hc"
-  # shellcheck disable=SC2002
-  cat /init/demo-data/us-hc-data.sql |
-    sed "s|{{DEMO_DATA_NAME}}|${DEMO_DATA_NAME}|" |
-    sed "s|{{POSTGRES_HOST}}|${POSTGRES_HOST}|" |
-    sed "s|{{POSTGRES_PORT}}|${POSTGRES_PORT}|" |
-    sed "s|{{POSTGRES_DB}}|${POSTGRES_DB_DEMO}|" |
-    sed "s|{{POSTGRES_USER}}|${POSTGRES_USER_DEMO}|" |
-    sed "s|{{POSTGRES_PASSWORD}}|${FERNET_POSTGRES_PASSWORD}|" |
+  DEMO_VARIANT="hc"
+fi
+echo "  [demo] mode: ${DEMO_VARIANT}"
+
+DEMO_BASE_FILE="/init/demo-data/us-data.sql"
+DEMO_DELTA_FILE="/init/demo-data/us-${DEMO_VARIANT}-data.delta.sql"
+
+SEED_START=$(date +%s%N)
+
+# all placeholders are filled in one pass, each value quoted for the sql or json string it stands in
+if [ -f "${DEMO_DELTA_FILE}" ]; then
+  echo "  [demo] apply [${DEMO_DELTA_FILE}] delta..."
+  python /init/us_variant.py materialize --base "${DEMO_BASE_FILE}" --delta "${DEMO_DELTA_FILE}" |
+    DEMO_DATA_NAME="${DEMO_DATA_NAME}" \
+      POSTGRES_HOST="${POSTGRES_HOST}" \
+      POSTGRES_PORT="${POSTGRES_PORT}" \
+      POSTGRES_DB="${POSTGRES_DB_DEMO}" \
+      POSTGRES_USER="${POSTGRES_USER_DEMO}" \
+      POSTGRES_PASSWORD="${FERNET_POSTGRES_PASSWORD}" \
+      python /init/us_render.py --template - |
     psql -v ON_ERROR_STOP=1 --username "${POSTGRES_USER_US}" --dbname "${POSTGRES_DB_US}" || exit 1
 else
-  echo "  [demo] mode: d3"
-  # shellcheck disable=SC2002
-  cat /init/demo-data/us-d3-data.sql |
-    sed "s|{{DEMO_DATA_NAME}}|${DEMO_DATA_NAME}|" |
-    sed "s|{{POSTGRES_HOST}}|${POSTGRES_HOST}|" |
-    sed "s|{{POSTGRES_PORT}}|${POSTGRES_PORT}|" |
-    sed "s|{{POSTGRES_DB}}|${POSTGRES_DB_DEMO}|" |
-    sed "s|{{POSTGRES_USER}}|${POSTGRES_USER_DEMO}|" |
-    sed "s|{{POSTGRES_PASSWORD}}|${FERNET_POSTGRES_PASSWORD}|" |
+  DEMO_DATA_NAME="${DEMO_DATA_NAME}" \
+    POSTGRES_HOST="${POSTGRES_HOST}" \
+    POSTGRES_PORT="${POSTGRES_PORT}" \
+    POSTGRES_DB="${POSTGRES_DB_DEMO}" \
+    POSTGRES_USER="${POSTGRES_USER_DEMO}" \
+    POSTGRES_PASSWORD="${FERNET_POSTGRES_PASSWORD}" \
+    python /init/us_render.py --template "${DEMO_BASE_FILE}" |
     psql -v ON_ERROR_STOP=1 --username "${POSTGRES_USER_US}" --dbname "${POSTGRES_DB_US}" || exit 1
 fi
 
+echo "  [demo] us demo entries imported in $((($(date +%s%N) - SEED_START) / 1000000)) ms"
+
 if [ "${IS_FIX_DLS}" == "true" ]; then
   echo "  [demo] fix dls permissions..."
 
@@ -0,0 +1,63 @@
+"""
+    python3 -m unittest test_us_manifest  (from postgres/)
+"""
+import os
+import tempfile
+import unittest
+
+import us_manifest
+
+# rows not in the form us_dump.render_insert gives back: a cast, extra spaces between the values
+WORKBOOK_1 = "INSERT INTO public.workbooks (workbook_id, title, meta) VALUES (1, 'first',  '{}'::jsonb) ON CONFLICT DO NOTHING;\n"
+WORKBOOK_2 = "INSERT INTO public.workbooks (workbook_id, title, meta) VALUES (2, 'second', '{}') ON CONFLICT DO NOTHING;\n"
+ENTRY_1 = "INSERT INTO public.entries (entry_id, workbook_id, key) VALUES (10,   1, 'a'::text) ON CONFLICT DO NOTHING;\n"
+ENTRY_2 = "INSERT INTO public.entries (entry_id, workbook_id, key) VALUES (20, 2, 'b') ON CONFLICT DO NOTHING;\n"
+REVISION_1 = "INSERT INTO public.revisions (rev_id, entry_id, data) VALUES (100, 10, '{\"a\": 1}'::jsonb) ON CONFLICT DO NOTHING;\n"
+REVISION_2 = "INSERT INTO public.revisions (rev_id, entry_id, data) VALUES (200, 20, '{}') ON CONFLICT DO NOTHING;\n"
+
+DUMP = "".join([
+    "-- test dump\n",
+    "BEGIN;\n",
+    WORKBOOK_1,
+    WORKBOOK_2,
+    ENTRY_1,
+    ENTRY_2,
+    REVISION_1,
+    REVISION_2,
+    "COMMIT;\n",
+])
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sql")
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(DUMP)
+        self.manifest = us_manifest.build(self.path, us_manifest.DEFAULT_CHUNK_SIZE, 1)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def _extract(self, tables, workbooks=()) -> str:
+        with tempfile.TemporaryFile() as out:
+            us_manifest.extract(self.path, self.manifest, tables, workbooks, out)
+            out.seek(0)
+            return out.read().decode()
+
+    def test_ranges_match_the_statements(self):
+        with open(self.path, encoding="utf-8", newline="") as f:
+            ranges = [(start, end) for _, start, end in us_manifest.iter_ranges(f)]
+        statements = [DUMP.encode()[start:end].decode() for start, end in ranges]
+        self.assertEqual(statements[2:8], [WORKBOOK_1, WORKBOOK_2, ENTRY_1, ENTRY_2, REVISION_1, REVISION_2])
+        self.assertEqual(ranges[-1][1], len(DUMP.encode()))
+
+    def test_extract_tables(self):
+        self.assertEqual(self._extract(["workbooks", "entries"]), WORKBOOK_1 + WORKBOOK_2 + ENTRY_1 + ENTRY_2)
+
+    def test_extract_workbook(self):
+        self.assertEqual(self._extract(["workbooks", "entries", "revisions"], ["1"]), WORKBOOK_1 + ENTRY_1 + REVISION_1)
+        self.assertEqual(self._extract(["workbooks", "entries", "revisions"], ["2"]), WORKBOOK_2 + ENTRY_2 + REVISION_2)
+
+
+if __name__ == "__main__":
+    unittest.main()
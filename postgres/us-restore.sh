@@ -13,6 +13,10 @@ IS_FIX_CONNECTIONS="false"
 IS_FIX_CRYPTO_KEY="false"
 IS_RESET_PASSWORDS="false"
 IS_RESET_CRYPTO_KEY="false"
+IS_ROTATE_CRYPTO_KEY="false"
+IS_COPY="false"
+IS_DEFER_INDEXES="false"
+RESTORE_JOBS=""
 RESTORE_FILE="/tmp/datalens_db.dump"
 
 # parse args
@@ -38,6 +42,23 @@ for _ in "$@"; do
     IS_RESET_CRYPTO_KEY="true"
     shift # past argument with no value
     ;;
+  --rotate-crypto-key)
+    IS_ROTATE_CRYPTO_KEY="true"
+    shift # past argument with no value
+    ;;
+  --copy)
+    IS_COPY="true"
+    shift # past argument with no value
+    ;;
+  --jobs)
+    RESTORE_JOBS="${2}"
+    shift # past argument
+    shift # past value
+    ;;
+  --defer-indexes)
+    IS_DEFER_INDEXES="true"
+    shift # past argument with no value
+    ;;
   --demo)
     IS_RESTORE_DEMO="true"
     shift # past argument with no value
@@ -76,15 +97,16 @@ export PGPASSWORD="${POSTGRES_PASSWORD_US}"
 
 if [ "${IS_RESET_PASSWORDS}" == "true" ]; then
   echo "  only fix connections passwords without restore..."
-  NULL_PASSWORD=$(python /init/crypto.py "${CONTROL_API_CRYPTO_KEY}" null)
+  # the token comes out as a json string, ready for jsonb_set
+  NULL_PASSWORD=$(echo '"null"' | python /init/crypto.py "${CONTROL_API_CRYPTO_KEY}" --stream ndjson)
 
   psql \
     --host "${POSTGRES_HOST}" \
     --port "${POSTGRES_PORT}" \
     --username "${POSTGRES_USER_US}" \
     --dbname "${POSTGRES_DB_US}" <<-EOSQL
-  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{password,cypher_text}', '"${NULL_PASSWORD}"', true) WHERE unversioned_data #> '{password,cypher_text}' IS NOT NULL;
-  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{token,cypher_text}', '"${NULL_PASSWORD}"', true) WHERE unversioned_data #> '{token,cypher_text}' IS NOT NULL;
+  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{password,cypher_text}', '${NULL_PASSWORD}', true) WHERE unversioned_data #> '{password,cypher_text}' IS NOT NULL;
+  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{token,cypher_text}', '${NULL_PASSWORD}', true) WHERE unversioned_data #> '{token,cypher_text}' IS NOT NULL;
 EOSQL
   exit 0
 fi
@@ -110,25 +132,75 @@ else
   exit 1
 fi
 
-pg_restore \
-  --host "${POSTGRES_HOST}" \
-  --port "${POSTGRES_PORT}" \
-  --disable-triggers \
-  --username "${POSTGRES_USER_US}" \
-  --dbname "${POSTGRES_DB_US}" \
-  <"${RESTORE_FILE}"
+if [ -n "${RESTORE_JOBS}" ]; then
+  echo "  load tables in parallel with [${RESTORE_JOBS}] jobs..."
+  # tables are split into row ranges loaded with COPY over several connections, in reference order
+  PARALLEL_ARGS=("--jobs" "${RESTORE_JOBS}" "--disable-triggers")
+  if [ "${IS_DEFER_INDEXES}" == "true" ]; then
+    PARALLEL_ARGS+=("--defer-indexes")
+  fi
+  POSTGRES_HOST="${POSTGRES_HOST}" POSTGRES_PORT="${POSTGRES_PORT}" POSTGRES_USER_US="${POSTGRES_USER_US}" POSTGRES_DB_US="${POSTGRES_DB_US}" \
+    python /init/us_parallel_restore.py --dump "${RESTORE_FILE}" "${PARALLEL_ARGS[@]}"
+elif [ "${IS_COPY}" == "true" ]; then
+  echo "  load rows with COPY..."
+  # one COPY block per table run instead of one INSERT statement per row
+  python /init/us_copy.py --dump "${RESTORE_FILE}" --disable-triggers |
+    psql -v ON_ERROR_STOP=1 \
+      --quiet \
+      --single-transaction \
+      --host "${POSTGRES_HOST}" \
+      --port "${POSTGRES_PORT}" \
+      --username "${POSTGRES_USER_US}" \
+      --dbname "${POSTGRES_DB_US}" >/dev/null
+elif [ "$(head -c 5 "${RESTORE_FILE}")" != "PGDMP" ]; then
+  echo "  load plain SQL dump..."
+  # e.g. a full dump merged from an incremental chain by us_incremental.py
+  psql -v ON_ERROR_STOP=1 \
+    --quiet \
+    --single-transaction \
+    --host "${POSTGRES_HOST}" \
+    --port "${POSTGRES_PORT}" \
+    --username "${POSTGRES_USER_US}" \
+    --dbname "${POSTGRES_DB_US}" \
+    --file "${RESTORE_FILE}" >/dev/null
+else
+  pg_restore \
+    --host "${POSTGRES_HOST}" \
+    --port "${POSTGRES_PORT}" \
+    --disable-triggers \
+    --username "${POSTGRES_USER_US}" \
+    --dbname "${POSTGRES_DB_US}" \
+    <"${RESTORE_FILE}"
+fi
+
+if [ "${IS_ROTATE_CRYPTO_KEY}" == "true" ]; then
+  echo "  re-encrypt connections secrets with the current crypto key..."
+
+  # space separated keys the dumped secrets may be encrypted with
+  OLD_KEY_ARGS=()
+  for OLD_KEY in ${CONTROL_API_CRYPTO_KEY_OLD}; do
+    OLD_KEY_ARGS+=("--old-key" "${OLD_KEY}")
+  done
+
+  python /init/crypto_rotate.py --db --new-key "${CONTROL_API_CRYPTO_KEY}" --key-id "KEY" --on-invalid null "${OLD_KEY_ARGS[@]}"
+
+  # secrets are already valid for the current key
+  IS_FIX_CONNECTIONS="false"
+  IS_FIX_CRYPTO_KEY="false"
+fi
 
 if [ "${IS_FIX_CONNECTIONS}" == "true" ]; then
   echo "  fix connections passwords..."
-  NULL_PASSWORD=$(python /init/crypto.py "${CONTROL_API_CRYPTO_KEY}" null)
+  # the token comes out as a json string, ready for jsonb_set
+  NULL_PASSWORD=$(echo '"null"' | python /init/crypto.py "${CONTROL_API_CRYPTO_KEY}" --stream ndjson)
 
   psql \
     --host "${POSTGRES_HOST}" \
     --port "${POSTGRES_PORT}" \
     --username "${POSTGRES_USER_US}" \
     --dbname "${POSTGRES_DB_US}" <<-EOSQL
-  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{password,cypher_text}', '"${NULL_PASSWORD}"', true) WHERE unversioned_data #> '{password,cypher_text}' IS NOT NULL;
-  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{token,cypher_text}', '"${NULL_PASSWORD}"', true) WHERE unversioned_data #> '{token,cypher_text}' IS NOT NULL;
+  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{password,cypher_text}', '${NULL_PASSWORD}', true) WHERE unversioned_data #> '{password,cypher_text}' IS NOT NULL;
+  UPDATE entries SET unversioned_data = jsonb_set(unversioned_data, '{token,cypher_text}', '${NULL_PASSWORD}', true) WHERE unversioned_data #> '{token,cypher_text}' IS NOT NULL;
 EOSQL
 fi
 
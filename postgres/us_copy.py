@@ -0,0 +1,131 @@
+"""
+Converts a UnitedStorage dump made of per-row INSERTs into COPY blocks.
+
+    us_copy.py --dump datalens_db.dump | psql ...
+
+Consecutive INSERTs into the same table become one `COPY ... FROM stdin` block. With the default
+`--mode staging` the rows are copied into a temporary table first and moved with a single
+`INSERT ... SELECT ... ON CONFLICT DO NOTHING`, keeping the semantics of the dumped statements;
+`--mode copy` copies straight into the target table and fails on conflicts. Other statements are passed
+through unchanged. Memory use does not depend on the dump size.
+"""
+import argparse
+import itertools
+import sys
+from typing import IO, Iterable, Optional, Sequence, Union
+
+import us_dump
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+
+COPY_MODES = ("staging", "copy")
+
+
+def copy_value(value: us_dump.SqlValue) -> str:
+    """ Encodes a parsed literal for the COPY text format; bytea ('\\x...') and json strings need no special care """
+
+    if value is None:
+        return "\\N"
+    if isinstance(value, us_dump.Bare):
+        return value
+    return value.translate(_COPY_ESCAPES)
+
+
+def copy_line(row: us_dump.InsertRow) -> str:
+    return "\t".join(map(copy_value, row.values)) + "\n"
+
+
+class CopyWriter:
+    """ Turns a stream of rows and other statements into COPY blocks, starting a new block on every table change """
+
+    def __init__(self, out: IO[str], mode: str = "staging"):
+        self.out = out
+        self.mode = mode
+        self.rows_by_table: dict[str, int] = {}
+        self._block: Optional[tuple[str, str, tuple[str, ...]]] = None  # schema-qualified table, table, columns
+        self._blocks = itertools.count(1)
+        self._staging_table = ""
+
+    def write_row(self, row: us_dump.InsertRow) -> None:
+        block = (row.qualified_table(), row.table, row.columns)
+        if block != self._block:
+            self.finish_block()
+            self._start_block(*block)
+        self.out.write(copy_line(row))
+        self.rows_by_table[row.table] = self.rows_by_table.get(row.table, 0) + 1
+
+    def write_statement(self, statement: str) -> None:
+        if self._block is not None and (not statement.strip() or statement.startswith("--")):
+            return  # blank lines and comments between rows of a block carry nothing
+        self.finish_block()
+        self.out.write(statement)
+
+    def write(self, item: Union[str, us_dump.InsertRow]) -> None:
+        if isinstance(item, us_dump.InsertRow):
+            self.write_row(item)
+        else:
+            self.write_statement(item)
+
+    def _start_block(self, qualified_table: str, table: str, columns: tuple[str, ...]) -> None:
+        self._block = (qualified_table, table, columns)
+        columns_sql = ", ".join(columns)
+        if self.mode == "staging":
+            self._staging_table = f"us_copy_{table}_{next(self._blocks)}"
+            self.out.write(
+                f"CREATE TEMP TABLE {self._staging_table} (LIKE {qualified_table} INCLUDING DEFAULTS);\n"
+                f"COPY {self._staging_table} ({columns_sql}) FROM stdin;\n"
+            )
+        else:
+            self.out.write(f"COPY {qualified_table} ({columns_sql}) FROM stdin;\n")
+
+    def finish_block(self) -> None:
+        if self._block is None:
+            return
+        qualified_table, _, columns = self._block
+        self.out.write("\\.\n")
+        if self.mode == "staging":
+            columns_sql = ", ".join(columns)
+            self.out.write(
+                f"INSERT INTO {qualified_table} ({columns_sql}) SELECT {columns_sql} FROM {self._staging_table} ON CONFLICT DO NOTHING;\n"
+                f"DROP TABLE {self._staging_table};\n"
+            )
+        self._block = None
+
+
+def convert(
+    items: Iterable[Union[str, us_dump.InsertRow]],
+    out: IO[str],
+    mode: str = "staging",
+    disable_triggers: bool = False,
+) -> dict[str, int]:
+    """ Writes the converted dump, returns the number of rows per table """
+
+    if disable_triggers:
+        out.write("SET session_replication_role = replica;\n")
+    writer = CopyWriter(out, mode)
+    for item in items:
+        writer.write(item)
+    writer.finish_block()
+    return writer.rows_by_table
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Convert the INSERTs of a UnitedStorage dump into COPY blocks")
+    parser.add_argument("--dump", default="-", help="dump to convert: plain, gzipped or custom format, '-' for stdin")
+    parser.add_argument("--output", default="-", help="converted SQL, '-' for stdout")
+    parser.add_argument("--mode", choices=COPY_MODES, default="staging", help=(
+        "staging: COPY into a temp table and INSERT ... ON CONFLICT DO NOTHING from it, copy: COPY into the table"
+    ))
+    parser.add_argument("--tables", nargs="*", default=list(us_dump.US_TABLES), help="tables to convert, the rest is passed through")
+    parser.add_argument("--disable-triggers", action="store_true", help="load with session_replication_role = replica (superuser)")
+    args = parser.parse_args(argv)
+
+    try:
+        with us_dump.open_dump(args.dump) as fi, us_dump.open_output(args.output) as fo:
+            convert(us_dump.iter_dump(fi, args.tables), fo, args.mode, args.disable_triggers)
+    except ValueError as err:
+        sys.exit(f"  error: {err}")
+
+
+if __name__ == "__main__":
+    main()
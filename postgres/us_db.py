@@ -0,0 +1,175 @@
+"""
+psql based access to the UnitedStorage database for the python tools.
+
+Connection settings come from the same environment variables as us-dump.sh and us-restore.sh, so the
+tools run unchanged inside the postgres container and against an external PostgreSQL.
+"""
+import contextlib
+import csv
+import io
+import os
+import re
+import subprocess
+from typing import IO, Iterator, Optional
+
+csv.field_size_limit(1 << 30)  # revisions data can be large
+
+
+def connection_env() -> dict[str, str]:
+    env = dict(os.environ)
+    if not env.get("PGPASSWORD"):
+        password = env.get("POSTGRES_PASSWORD_US") or env.get("POSTGRES_PASSWORD")
+        if password:
+            env["PGPASSWORD"] = password
+    return env
+
+
+def connection_args() -> list[str]:
+    return [
+        "--host", os.getenv("POSTGRES_HOST") or "localhost",
+        "--port", os.getenv("POSTGRES_PORT") or "5432",
+        "--username", os.getenv("POSTGRES_USER_US") or os.getenv("POSTGRES_USER") or "postgres",
+        "--dbname", os.getenv("POSTGRES_DB_US") or "pg-us-db",
+    ]
+
+
+def psql_command(*args: str) -> list[str]:
+    return ["psql", "--no-psqlrc", "--quiet", "-v", "ON_ERROR_STOP=1", *connection_args(), *args]
+
+
+def open_psql_input(*args: str) -> subprocess.Popen:
+    """ Starts a psql session that executes whatever is written to its stdin """
+
+    return subprocess.Popen(
+        psql_command(*args),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        env=connection_env(),
+        text=True,
+        encoding="utf-8",
+    )
+
+
+def close_psql_input(psql: subprocess.Popen) -> None:
+    psql.stdin.close()
+    if psql.wait() != 0:
+        raise RuntimeError(f"psql exited with code {psql.returncode}")
+
+
+def abort_psql_input(psql: subprocess.Popen) -> None:
+    """ Stops a psql session without committing: closing its stdin would end the input and commit it """
+
+    psql.kill()
+    psql.wait()
+    try:
+        psql.stdin.close()
+    except BrokenPipeError:
+        pass
+
+
+@contextlib.contextmanager
+def exported_snapshot() -> Iterator[str]:
+    """
+    Keeps a REPEATABLE READ transaction open and yields its exported snapshot: the queries given it as `snapshot`
+    all see the database as it was at that moment, whatever other sessions commit meanwhile.
+    """
+
+    psql = subprocess.Popen(
+        psql_command("--tuples-only", "--no-align"),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        env=connection_env(),
+        text=True,
+        encoding="utf-8",
+    )
+    try:
+        psql.stdin.write("BEGIN ISOLATION LEVEL REPEATABLE READ;\nSELECT pg_export_snapshot();\n")
+        psql.stdin.flush()
+        snapshot = psql.stdout.readline().strip()
+        if not snapshot:
+            raise RuntimeError(f"psql exited with code {psql.wait()} exporting a snapshot")
+        yield snapshot
+    finally:
+        # the transaction only read, ending the session rolls it back
+        try:
+            psql.stdin.close()
+        except BrokenPipeError:
+            pass
+        psql.wait()
+        psql.stdout.close()
+
+
+def _snapshot_commands(snapshot: Optional[str]) -> list[str]:
+    if snapshot is None:
+        return []
+    return [
+        "--command", "BEGIN ISOLATION LEVEL REPEATABLE READ",
+        "--command", f"SET TRANSACTION SNAPSHOT '{snapshot}'",
+    ]
+
+
+def run_sql(sql: str) -> None:
+    subprocess.run(psql_command(), input=sql, text=True, check=True, env=connection_env(), stdout=subprocess.DEVNULL)
+
+
+def query_value(sql: str, snapshot: Optional[str] = None) -> Optional[str]:
+    result = subprocess.run(
+        psql_command("--tuples-only", "--no-align", *_snapshot_commands(snapshot), "--command", sql),
+        capture_output=True,
+        text=True,
+        check=True,
+        env=connection_env(),
+    )
+    value = result.stdout.strip()
+    return value or None
+
+
+def copy_out_csv(query: str) -> Iterator[list[str]]:
+    """ Streams the rows of a query through `COPY ... TO STDOUT` in csv format; NULLs come out as empty strings """
+
+    psql = subprocess.Popen(
+        psql_command("--command", f"COPY ({query}) TO STDOUT WITH (FORMAT csv)"),
+        stdout=subprocess.PIPE,
+        env=connection_env(),
+    )
+    stream: IO[str] = io.TextIOWrapper(psql.stdout, encoding="utf-8", newline="")
+    try:
+        yield from csv.reader(stream)
+    finally:
+        stream.close()
+        if psql.wait() != 0:
+            raise RuntimeError(f"psql exited with code {psql.returncode}")
+
+
+_COPY_ESCAPES = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+_COPY_ESCAPE_RE = re.compile(r"\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)")
+
+
+def _copy_unescape(match: re.Match) -> str:
+    escape = match.group(1)
+    if escape[0] == "x" and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    if escape[0].isdigit():
+        return chr(int(escape, 8))
+    return _COPY_ESCAPES.get(escape, escape)
+
+
+def copy_out_rows(query: str, snapshot: Optional[str] = None) -> Iterator[list[Optional[str]]]:
+    """ Streams the rows of a query through `COPY ... TO STDOUT` in text format, keeping NULLs apart from empty strings """
+
+    psql = subprocess.Popen(
+        psql_command(*_snapshot_commands(snapshot), "--command", f"COPY ({query}) TO STDOUT"),
+        stdout=subprocess.PIPE,
+        env=connection_env(),
+    )
+    stream: IO[str] = io.TextIOWrapper(psql.stdout, encoding="utf-8", newline="\n")
+    try:
+        for line in stream:
+            yield [
+                None if field == "\\N" else _COPY_ESCAPE_RE.sub(_copy_unescape, field) if "\\" in field else field
+                for field in line[:-1].split("\t")
+            ]
+    finally:
+        stream.close()
+        if psql.wait() != 0:
+            raise RuntimeError(f"psql exited with code {psql.returncode}")
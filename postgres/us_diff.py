@@ -0,0 +1,222 @@
+"""
+Row-level comparison of two UnitedStorage dumps.
+
+    us_diff.py --old us-before-upgrade.sql --new us-after-upgrade.sql
+    us_diff.py --old a.dump --new b.sql.gz --keys --delta a-to-b.delta.sql
+
+Both dumps are streamed and every row is reduced to its table, primary key (see `us_dump.PRIMARY_KEYS`) and a
+digest of its values by column name, so the order of rows and columns does not matter. The records are sorted
+and the two sorted streams are walked side by side: a key only in the old dump is removed, only in the new one
+added, in both with other values changed. When a dump has more than `--buffer-rows` rows its records are sorted
+in runs spilled to temporary files and merged back, the memory stays bounded by the buffer whatever the dump size.
+A key repeated within a dump counts once, as the first row, the same one a restore keeps.
+
+The report lists the added, removed and changed rows per table, `--keys` lists the keys as well. `--delta`
+writes the difference in the delta format of us_variant.py: the rows of the new dump that were added or changed
+and the DELETE statements of the removed keys, so `us_variant.py materialize --base <old> --delta <delta>` or
+`us_incremental.py merge --base <old> --delta <delta>` turn the old dump into the new one.
+"""
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+from typing import IO, Iterator, Optional, Sequence
+
+import us_dump
+import us_variant
+
+DEFAULT_BUFFER_ROWS = 500_000
+CHANGES = ("added", "removed", "changed")
+
+# tables sort in load order, so the rows of a delta come out in the order they can be inserted in
+_TABLE_RANKS = {
+    table: rank for rank, table in enumerate(table for level in us_dump.US_TABLES_LOAD_LEVELS for table in level)
+}
+
+
+def _row_digest(row: us_dump.InsertRow) -> str:
+    values = "\0".join(f"{column}={us_dump.sql_literal(value)}" for column, value in sorted(row.as_dict().items()))
+    return hashlib.blake2b(values.encode(), digest_size=16).hexdigest()
+
+
+def _record(row: us_dump.InsertRow, with_row: bool) -> str:
+    """ "<rank>\\t<table>\\t<key>\\t<digest>\\t<row>" on a single line, the row is kept for the delta only """
+
+    key = json.dumps([str(value) for value in row.key()], ensure_ascii=False)
+    text = json.dumps(us_dump.render_insert(row), ensure_ascii=False) if with_row else ""
+    return f"{_TABLE_RANKS[row.table]}\t{row.table}\t{key}\t{_row_digest(row)}\t{text}\n"
+
+
+def _sort_key(record: str) -> str:
+    # rank, table and key; tabs in keys are escaped by json, so the third tab ends the key
+    return record[:record.index("\t", record.index("\t", record.index("\t") + 1) + 1)]
+
+
+class SortedRecords:
+    """ The records of a dump in key order, sorted in memory or, past `buffer_rows`, by external merge sort """
+
+    def __init__(self, stream: IO[str], with_rows: bool, buffer_rows: int, tmpdir: Optional[str] = None):
+        self.rows = 0
+        self.runs: list[IO[str]] = []
+        self._buffer: list[str] = []
+        records = (_record(row, with_rows) for row in us_dump.iter_rows(stream))
+        while True:
+            buffer = list(itertools.islice(records, buffer_rows))
+            self.rows += len(buffer)
+            buffer.sort(key=_sort_key)
+            if len(buffer) < buffer_rows and not self.runs:
+                self._buffer = buffer
+                return
+            if buffer:
+                run = tempfile.TemporaryFile("w+", encoding="utf-8", newline="", dir=tmpdir)
+                run.writelines(buffer)
+                run.seek(0)
+                self.runs.append(run)
+            if len(buffer) < buffer_rows:
+                return
+
+    def __iter__(self) -> Iterator[tuple[str, str, str, str]]:
+        """ Yields (sort key, table, digest, record) once per key, the first of the repeated keys """
+
+        # heapq.merge is stable: of the equal keys, the ones of the earlier runs, that is of the earlier rows, go first
+        records = heapq.merge(*self.runs, key=_sort_key) if self.runs else iter(self._buffer)
+        previous = None
+        for record in records:
+            sort_key = _sort_key(record)
+            if sort_key == previous:
+                continue
+            previous = sort_key
+            _, table, _, digest, _ = record.split("\t", 4)
+            yield sort_key, table, digest, record
+
+    def close(self) -> None:
+        for run in self.runs:
+            run.close()
+
+
+def diff(old: SortedRecords, new: SortedRecords) -> Iterator[tuple[str, str, str]]:
+    """ Walks both sorted record streams, yields (change, table, record) of the rows that differ """
+
+    old_records, new_records = iter(old), iter(new)
+    old_item, new_item = next(old_records, None), next(new_records, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield "removed", old_item[1], old_item[3]
+            old_item = next(old_records, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield "added", new_item[1], new_item[3]
+            new_item = next(new_records, None)
+        else:
+            if old_item[2] != new_item[2]:
+                yield "changed", new_item[1], new_item[3]
+            old_item, new_item = next(old_records, None), next(new_records, None)
+
+
+def _record_key(record: str) -> list[str]:
+    return json.loads(record.split("\t", 4)[2])
+
+
+def compare(
+    old: SortedRecords,
+    new: SortedRecords,
+    keys_out: Optional[IO[str]],
+    delta_out: Optional[IO[str]],
+    tmpdir: Optional[str] = None,
+) -> dict[str, Counter]:
+    """ Returns the number of added, removed and changed rows per table, writes the keys and the delta if asked """
+
+    counts: dict[str, Counter] = {}
+    with tempfile.TemporaryFile("w+", encoding="utf-8", newline="", dir=tmpdir) as tombstones:
+        for change, table, record in diff(old, new):
+            counts.setdefault(table, Counter())[change] += 1
+            if keys_out is not None:
+                keys_out.write(f"{'+-~'[CHANGES.index(change)]} {table} {', '.join(_record_key(record))}\n")
+            if delta_out is None:
+                continue
+            if change == "removed":
+                # an old record carries no row, only its key is needed; deletes go after all rows, as in us_incremental.py
+                tombstones.write(us_variant.render_delete(table, tuple(_record_key(record))))
+            else:
+                delta_out.write(json.loads(record.split("\t", 4)[4]))
+        if delta_out is not None:
+            tombstones.seek(0)
+            for line in tombstones:
+                delta_out.write(line)
+    return counts
+
+
+def format_report(counts: dict[str, Counter], old_rows: int, new_rows: int) -> str:
+    lines = [f"{'table':<12} {'added':>10} {'removed':>10} {'changed':>10}"]
+    for table in sorted(counts, key=_TABLE_RANKS.get):
+        lines.append(f"{table:<12} " + " ".join(f"{counts[table][change]:>10}" for change in CHANGES))
+    if not counts:
+        lines.append("no differences")
+    lines.append(f"{old_rows} rows in the old dump, {new_rows} rows in the new one")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare two UnitedStorage dumps row by row")
+    parser.add_argument("--old", required=True, help="dump to compare against, '-' for stdin")
+    parser.add_argument("--new", required=True, help="dump to compare, '-' for stdin")
+    parser.add_argument("--keys", action="store_true", help="list the keys of the rows that differ: + added, - removed, ~ changed")
+    parser.add_argument("--delta", help="write the delta turning the old dump into the new one, '-' for stdout")
+    parser.add_argument("--format", choices=("text", "json"), default="text", help="format of the report")
+    parser.add_argument("--buffer-rows", type=int, default=DEFAULT_BUFFER_ROWS, help="rows sorted in memory, larger dumps are sorted on disk")
+    parser.add_argument("--tmpdir", help="directory for the sorted runs and the deletes of the delta")
+    parser.add_argument("--exit-code", action="store_true", help="exit with 1 when the dumps differ")
+    args = parser.parse_args(argv)
+
+    if args.old == "-" and args.new == "-":
+        parser.error("only one of --old and --new can be read from stdin")
+    if args.delta == "-" and args.keys:
+        parser.error("--keys goes to stdout, write --delta to a file")
+
+    # the report goes to stderr when stdout has the delta
+    report_out = sys.stderr if args.delta == "-" else sys.stdout
+    sorted_records: list[SortedRecords] = []
+    try:
+        for path, with_rows in ((args.old, False), (args.new, args.delta is not None)):
+            with us_dump.open_dump(path) as f:
+                sorted_records.append(SortedRecords(f, with_rows, args.buffer_rows, args.tmpdir))
+            runs = len(sorted_records[-1].runs)
+            print(f"  {path}: {sorted_records[-1].rows} rows" + (f", sorted in {runs} runs" if runs else ""), file=sys.stderr)
+        old, new = sorted_records
+
+        delta_out = None
+        if args.delta is not None:
+            delta_out = us_dump.open_output(args.delta)
+            delta_out.write(f"-- rows that differ from {os.path.basename(args.old)}, see postgres/us_diff.py\n")
+        try:
+            counts = compare(old, new, report_out if args.keys else None, delta_out, args.tmpdir)
+        finally:
+            if delta_out is not None:
+                delta_out.close()
+    except (OSError, ValueError) as err:
+        sys.exit(f"  error: {err}")
+    finally:
+        for records in sorted_records:
+            records.close()
+
+    if args.format == "json":
+        report = dict(
+            old_rows=old.rows,
+            new_rows=new.rows,
+            tables={table: {change: counts[table][change] for change in CHANGES} for table in counts},
+        )
+        report_out.write(json.dumps(report) + "\n")
+    else:
+        report_out.write(format_report(counts, old.rows, new.rows))
+    report_out.flush()
+
+    if args.exit_code and counts:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Streaming reader and writer for UnitedStorage dumps made by us-dump.sh.
+
+A dump is a sequence of `INSERT INTO public.<table> (<columns>) VALUES (<literals>) ...;` statements
+(pg_dump --inserts --column-inserts), possibly spanning several lines when a value contains newlines,
+mixed with other statements, comments and blank lines. `iter_statements` cuts the text into statements
+without loading the whole dump, `parse_insert` turns an INSERT into an `InsertRow` and `render_insert`
+turns it back; rows whose values were not changed render byte-identical to the input.
+
+Literal parsing assumes standard_conforming_strings=on, which is what pg_dump emits.
+"""
+import gzip
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from typing import IO, Iterator, Optional, Sequence, Union
+
+US_TABLES = ("workbooks", "collections", "entries", "revisions", "links")
+
+# groups of tables in an order that satisfies their references, tables of a group do not reference each other
+US_TABLES_LOAD_LEVELS = (("collections",), ("workbooks",), ("entries",), ("revisions", "links"))
+
+PRIMARY_KEYS = {
+    "workbooks": ("workbook_id",),
+    "collections": ("collection_id",),
+    "entries": ("entry_id",),
+    "revisions": ("rev_id",),
+    "links": ("from_id", "to_id", "name"),
+}
+
+
+class Bare(str):
+    """ An unquoted literal kept as written: a number, true/false or another keyword """
+
+
+SqlValue = Union[None, str, Bare]
+
+_INSERT_RE = re.compile(r'INSERT INTO (?:"?(\w+)"?\.)?"?(\w+)"? \(([^)]*)\) VALUES \(')
+# one literal with an optional cast and the separator after it: 'string', E'escaped string' or a bare token
+_VALUE_RE = re.compile(
+    r"""\s*(?:'([^']*(?:''[^']*)*)'|[eE]'((?:[^'\\]|\\.|'')*)'|([^,)\s']+))(?:::[\w .\"\[\]]+?)?\s*([,)])""",
+    re.S,
+)
+
+
+class InsertRow:
+    """ A single-row INSERT: parsed values plus the text around them, so it can be rendered back as is """
+
+    __slots__ = ("table", "columns", "values", "prefix", "suffix", "_index")
+
+    def __init__(self, table: str, columns: tuple[str, ...], values: list[SqlValue], prefix: str, suffix: str):
+        self.table = table
+        self.columns = columns
+        self.values = values
+        self.prefix = prefix  # "INSERT INTO ... VALUES ("
+        self.suffix = suffix  # ") ON CONFLICT DO NOTHING;\n"
+        self._index: Optional[dict[str, int]] = None
+
+    def index(self, column: str) -> int:
+        if self._index is None:
+            self._index = _column_index(self.columns)
+        return self._index[column]
+
+    def get(self, column: str) -> SqlValue:
+        return self.values[self.index(column)]
+
+    def set(self, column: str, value: SqlValue) -> None:
+        self.values[self.index(column)] = value
+
+    def get_int(self, column: str) -> Optional[int]:
+        value = self.get(column)
+        return None if value is None else int(value)
+
+    def qualified_table(self) -> str:
+        # "INSERT INTO public.entries (" -> "public.entries"
+        return self.prefix[len("INSERT INTO "):self.prefix.index(" (")]
+
+    def key(self) -> tuple[SqlValue, ...]:
+        return tuple(self.get(column) for column in PRIMARY_KEYS[self.table])
+
+    def as_dict(self) -> dict[str, SqlValue]:
+        return dict(zip(self.columns, self.values))
+
+
+_COLUMN_INDEXES: dict[tuple[str, ...], dict[str, int]] = {}
+_COLUMNS: dict[str, tuple[str, ...]] = {}
+
+
+def _parse_columns(columns_sql: str) -> tuple[str, ...]:
+    columns = _COLUMNS.get(columns_sql)
+    if columns is None:
+        columns = _COLUMNS[columns_sql] = tuple(column.strip().strip('"') for column in columns_sql.split(","))
+    return columns
+
+
+def _column_index(columns: tuple[str, ...]) -> dict[str, int]:
+    index = _COLUMN_INDEXES.get(columns)
+    if index is None:
+        index = _COLUMN_INDEXES[columns] = {column: idx for idx, column in enumerate(columns)}
+    return index
+
+
+def open_dump(path: str) -> IO[str]:
+    """
+    Opens a dump as text: "-" is stdin, gzip files are decompressed and custom/directory format dumps
+    are converted to plain SQL on the fly with pg_restore.
+    """
+
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+
+    # the path is opened once and the format is sniffed from its buffer, so FIFOs and <(...) keep their first bytes
+    raw = open(path, "rb")
+    magic = raw.peek(5)[:5]
+
+    if magic[:2] == b"\x1f\x8b":
+        return gzip.open(raw, "rt", encoding="utf-8", newline="")
+
+    if magic == b"PGDMP":
+        if os.path.isfile(path):
+            raw.close()
+            return PgRestoreOutput(subprocess.Popen(["pg_restore", "--data-only", "--file", "-", path], stdout=subprocess.PIPE))
+        pg_restore = subprocess.Popen(["pg_restore", "--data-only", "--file", "-"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return PgRestoreOutput(pg_restore, raw)
+
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+class PgRestoreOutput(io.TextIOWrapper):
+    """
+    The plain SQL pg_restore writes to stdout. Closing it waits for pg_restore and raises ValueError when it
+    failed, so a corrupt or truncated dump does not pass for a short one; read it within `with`. A stream closed
+    before its end, or on an exception, stops pg_restore without checking it.
+    """
+
+    def __init__(self, pg_restore: subprocess.Popen, src: Optional[IO[bytes]] = None):
+        super().__init__(pg_restore.stdout, encoding="utf-8", newline="")
+        self._pg_restore = pg_restore
+        self._feed_error: list[BaseException] = []
+        self._feeder = None
+        if src is not None:
+            self._feeder = threading.Thread(target=self._feed, args=(src, pg_restore.stdin), daemon=True)
+            self._feeder.start()
+
+    def _feed(self, src: IO[bytes], dst: IO[bytes]) -> None:
+        with src:
+            try:
+                with dst:
+                    shutil.copyfileobj(src, dst)
+            except BrokenPipeError:
+                pass  # pg_restore stopped reading, its exit code tells why
+            except BaseException as err:
+                self._feed_error.append(err)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._abort()
+        return super().__exit__(exc_type, exc_value, traceback)
+
+    def _abort(self) -> None:
+        if self._pg_restore.poll() is None:
+            self._pg_restore.kill()
+        super().close()
+        self._pg_restore.wait()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.buffer.read(1):  # not read to the end
+            self._abort()
+            return
+        super().close()
+        returncode = self._pg_restore.wait()
+        if self._feeder is not None:
+            self._feeder.join()
+        if self._feed_error:
+            raise ValueError(f"could not feed the dump to pg_restore: {self._feed_error[0]}")
+        if returncode != 0:
+            raise ValueError(f"pg_restore exited with code {returncode}, the dump is corrupt or truncated")
+
+
+def open_output(path: str) -> IO[str]:
+    if path == "-":
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="", write_through=False)
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def iter_statements(stream: IO[str]) -> Iterator[str]:
+    """
+    Yields the dump as a sequence of chunks that concatenate back to the input: every statement with its
+    line terminator, and every blank or comment line between statements on its own.
+    """
+
+    pending: list[str] = []
+    in_string = False
+    for line in stream:
+        if not pending and (not line.strip() or line.startswith("--")):
+            yield line
+            continue
+
+        pending.append(line)
+        if line.count("'") % 2:
+            in_string = not in_string
+        if not in_string and line.rstrip().endswith(";"):
+            yield "".join(pending) if len(pending) > 1 else line
+            pending = []
+
+    if pending:
+        yield "".join(pending)
+
+
+def parse_insert(statement: str, tables: Optional[Sequence[str]] = None) -> Optional[InsertRow]:
+    """ Parses a single-row INSERT statement, returns None for any other statement or a table not in `tables` """
+
+    if not statement.startswith("INSERT INTO "):
+        return None
+    match = _INSERT_RE.match(statement)
+    if match is None:
+        return None
+    table = match.group(2)
+    if tables is not None and table not in tables:
+        return None
+
+    columns = _parse_columns(match.group(3))
+    values, end = parse_values(statement, match.end())
+    if len(values) != len(columns):
+        raise ValueError(f"Got {len(values)} values for {len(columns)} columns in: {statement[:200]}")
+
+    return InsertRow(table, columns, values, statement[:match.end()], statement[end:])
+
+
+def parse_values(text: str, pos: int) -> tuple[list[SqlValue], int]:
+    """ Parses comma separated literals starting at `pos` up to the closing parenthesis, returns them and its position """
+
+    values: list[SqlValue] = []
+    if text.startswith(")", pos):
+        return values, pos
+
+    match_value = _VALUE_RE.match
+    while True:
+        match = match_value(text, pos)
+        if match is None:
+            raise ValueError(f"Could not parse a value at {pos}: {text[:200]}")
+        string, e_string, bare, separator = match.groups()
+        if string is not None:
+            values.append(string.replace("''", "'") if "''" in string else string)
+        elif e_string is not None:
+            values.append(_unescape_e_string(e_string))
+        else:
+            values.append(None if bare == "NULL" else Bare(bare))
+        pos = match.end()
+        if separator == ")":
+            if text.startswith(",", pos):
+                raise ValueError(f"Multi-row INSERT statements are not supported: {text[:200]}")
+            return values, pos - 1
+
+
+_E_ESCAPES = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "'": "'", "\\": "\\"}
+_E_ESCAPE_RE = re.compile(r"\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)|''", re.S)
+
+
+def _unescape_e_string(body: str) -> str:
+    def _replace(match: re.Match) -> str:
+        escape = match.group(1)
+        if escape is None:
+            return "'"
+        if escape[0] == "x":
+            return chr(int(escape[1:], 16))
+        if escape[0] in "uU":
+            return chr(int(escape[1:], 16))
+        if escape[0].isdigit():
+            return chr(int(escape, 8))
+        return _E_ESCAPES.get(escape, escape)
+
+    return _E_ESCAPE_RE.sub(_replace, body)
+
+
+def sql_literal(value: SqlValue) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, Bare):
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def render_insert(row: InsertRow) -> str:
+    return row.prefix + ", ".join(map(sql_literal, row.values)) + row.suffix
+
+
+def iter_dump(stream: IO[str], tables: Optional[Sequence[str]] = US_TABLES) -> Iterator[Union[str, InsertRow]]:
+    """ Yields an `InsertRow` for every INSERT into one of `tables`, every other chunk is yielded as text """
+
+    for statement in iter_statements(stream):
+        row = parse_insert(statement, tables)
+        yield statement if row is None else row
+
+
+def iter_rows(stream: IO[str], tables: Optional[Sequence[str]] = US_TABLES) -> Iterator[InsertRow]:
+    for item in iter_dump(stream, tables):
+        if isinstance(item, InsertRow):
+            yield item
@@ -0,0 +1,323 @@
+"""
+Export of single workbooks with every row they need, see scripts/dump-entries.sh --workbook.
+
+    us_export.py export --workbook 1507164764046888724 > workbook.sql
+    us_export.py export --dump datalens_db.sql --workbook 1507164764046888724 --output workbook.sql
+    us_export.py index --dump datalens_db.sql
+
+The closure of the workbooks is walked from the entries with their workbook_id, along links to the linked
+entries (connections, datasets of other workbooks, ...) and their links in turn; it then takes the
+workbooks and collections (up to the root) the entries are in, and the saved and published revisions of
+the entries. The output is a plain dump of these rows in reference order, restorable with us-restore.sh.
+
+Rows come from the database by default, found through its primary key and workbook_id/from_id indexes.
+With `--dump` they come from a plain SQL dump: its row offsets and ids are indexed once into
+`<dump>.export.sqlite` (or into the temp dir, when the dump dir is read-only), rebuilt when the dump size
+or mtime changes; an export then reads only the rows of the closure. Either way the cost of an export
+follows the size of the workbooks, not the one of the database.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from typing import IO, Iterable, Iterator, Optional, Sequence
+
+import us_db
+import us_dump
+import us_incremental
+import us_manifest
+
+INDEX_SUFFIX = ".export.sqlite"
+BATCH_SIZE = 500
+
+INDEX_SCHEMA = """
+CREATE TABLE stamp (size INTEGER, mtime_ns INTEGER);
+CREATE TABLE workbooks (workbook_id TEXT PRIMARY KEY, collection_id TEXT, start INTEGER, end INTEGER);
+CREATE TABLE collections (collection_id TEXT PRIMARY KEY, parent_id TEXT, start INTEGER, end INTEGER);
+CREATE TABLE entries (
+    entry_id TEXT PRIMARY KEY, workbook_id TEXT, collection_id TEXT, saved_id TEXT, published_id TEXT, start INTEGER, end INTEGER
+);
+CREATE TABLE revisions (rev_id TEXT PRIMARY KEY, start INTEGER, end INTEGER);
+CREATE TABLE links (from_id TEXT, to_id TEXT, start INTEGER, end INTEGER);
+"""
+INDEX_INDEXES = """
+CREATE INDEX entries_workbook_id ON entries (workbook_id);
+CREATE INDEX links_from_id ON links (from_id);
+"""
+
+# columns the closure is walked along, after the primary key
+REFERENCE_COLUMNS = {
+    "workbooks": ("collection_id",),
+    "collections": ("parent_id",),
+    "entries": ("workbook_id", "collection_id", "saved_id", "published_id"),
+    "revisions": (),
+    "links": ("to_id",),
+}
+
+
+@dataclass
+class Entry:
+    workbook_id: Optional[str]
+    collection_id: Optional[str]
+    saved_id: Optional[str]
+    published_id: Optional[str]
+
+
+@dataclass
+class Closure:
+    collections: dict[str, Optional[str]] = field(default_factory=dict)  # collection_id -> parent_id
+    workbooks: dict[str, Optional[str]] = field(default_factory=dict)  # workbook_id -> collection_id
+    entries: dict[str, Entry] = field(default_factory=dict)
+    revisions: set[str] = field(default_factory=set)
+
+    def collections_order(self) -> list[str]:
+        """ Parents before their children """
+
+        depths: dict[str, int] = {}
+
+        def _depth(collection_id: str) -> int:
+            if collection_id not in depths:
+                parent_id = self.collections[collection_id]
+                depths[collection_id] = 0 if parent_id not in self.collections else _depth(parent_id) + 1
+            return depths[collection_id]
+
+        return sorted(self.collections, key=lambda collection_id: (_depth(collection_id), collection_id))
+
+
+def _batches(ids: Iterable[str]) -> Iterator[list[str]]:
+    batch: list[str] = []
+    for value in ids:
+        batch.append(value)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class DatabaseSource:
+    """ Rows of the database the POSTGRES_* variables point at """
+
+    def __init__(self):
+        self.tables = {table.name: table for table in us_incremental.load_tables()}
+
+    def _select(self, table: str, columns: Sequence[str], column: str, ids: Iterable[str]) -> Iterator[list[Optional[str]]]:
+        for batch in _batches(ids):
+            yield from us_db.copy_out_rows(
+                f"SELECT {', '.join(columns)} FROM public.{table} WHERE {column} IN ({', '.join(batch)})"
+            )
+
+    def references(self, table: str, column: str, ids: Iterable[str]) -> Iterator[list[Optional[str]]]:
+        """ Yields the key and the reference columns of the rows whose `column` is in `ids` """
+
+        if table not in self.tables:
+            return iter(())
+        key = us_dump.PRIMARY_KEYS[table][0]
+        return self._select(table, (key, *REFERENCE_COLUMNS[table]), column, ids)
+
+    def write(self, table: str, column: str, ids: Sequence[str], out: IO[bytes]) -> int:
+        if table not in self.tables or not ids:
+            return 0
+        info = self.tables[table]
+        rows: Iterable[list[Optional[str]]] = self._select(table, info.columns, column, ids)
+        if table == "collections":
+            # in the order of the ids, parents before their children; collections are few
+            by_id = {values[info.columns.index(column)]: values for values in rows}
+            rows = [by_id[collection_id] for collection_id in ids if collection_id in by_id]
+        written = 0
+        for values in rows:
+            out.write(info.render_row(values).encode())
+            written += 1
+        return written
+
+
+class DumpSource:
+    """ Rows of a plain SQL dump, found through its export index """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = open_index(path)
+
+    def references(self, table: str, column: str, ids: Iterable[str]) -> Iterator[list[Optional[str]]]:
+        key = us_dump.PRIMARY_KEYS[table][0]
+        columns = ", ".join((key, *REFERENCE_COLUMNS[table]))
+        for batch in _batches(ids):
+            yield from self.index.execute(
+                f"SELECT {columns} FROM {table} WHERE {column} IN ({', '.join('?' * len(batch))})", batch
+            )
+
+    def write(self, table: str, column: str, ids: Sequence[str], out: IO[bytes]) -> int:
+        ranges: list[tuple[int, int, int]] = []  # (order, start, end)
+        order = {value: idx for idx, value in enumerate(ids)}
+        for batch in _batches(ids):
+            for value, start, end in self.index.execute(
+                f"SELECT {column}, start, end FROM {table} WHERE {column} IN ({', '.join('?' * len(batch))})", batch
+            ):
+                ranges.append((order[value], start, end))
+        if table != "collections":
+            ranges.sort(key=lambda item: item[1])  # read the dump forward
+        else:
+            ranges.sort()
+        with open(self.path, "rb") as f:
+            for _, start, end in ranges:
+                out.write(os.pread(f.fileno(), end - start, start))
+        return len(ranges)
+
+
+def _index_paths(path: str) -> list[str]:
+    flat_name = os.path.abspath(path).strip(os.sep).replace(os.sep, "_")
+    return [f"{path}{INDEX_SUFFIX}", os.path.join(tempfile.gettempdir(), f"{flat_name}{INDEX_SUFFIX}")]
+
+
+def _index_value(value: us_dump.SqlValue) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def build_index(path: str, index_path: str) -> None:
+    if us_manifest.dump_format(path) != "plain":
+        raise ValueError(f"{path} is not a plain SQL dump, convert it with pg_restore --data-only --file first")
+    stat = os.stat(path)
+    tmp_path = f"{index_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    index = sqlite3.connect(tmp_path)
+    try:
+        index.executescript(INDEX_SCHEMA)
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for item, start, end in us_manifest.iter_ranges(f):
+                if not isinstance(item, us_dump.InsertRow):
+                    continue
+                columns = (us_dump.PRIMARY_KEYS[item.table][0], *REFERENCE_COLUMNS[item.table])
+                values = [_index_value(item.get(column)) for column in columns]
+                index.execute(
+                    f"INSERT OR REPLACE INTO {item.table} ({', '.join(columns)}, start, end)"
+                    f" VALUES ({', '.join('?' * (len(columns) + 2))})",
+                    (*values, start, end),
+                )
+        index.executescript(INDEX_INDEXES)
+        index.execute("INSERT INTO stamp VALUES (?, ?)", (stat.st_size, stat.st_mtime_ns))
+        index.commit()
+    finally:
+        index.close()
+    os.replace(tmp_path, index_path)
+
+
+def open_index(path: str) -> sqlite3.Connection:
+    """ Opens the first valid export index of a dump, builds it otherwise """
+
+    stat = os.stat(path)
+    paths = _index_paths(path)
+    for index_path in paths:
+        if not os.path.exists(index_path):
+            continue
+        index = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        try:
+            if index.execute("SELECT size, mtime_ns FROM stamp").fetchone() == (stat.st_size, stat.st_mtime_ns):
+                return index
+        except sqlite3.Error:
+            pass
+        index.close()
+
+    for index_path in paths:
+        try:
+            build_index(path, index_path)
+        except (OSError, sqlite3.OperationalError):
+            continue
+        print(f"  {path}: export index built at {index_path}", file=sys.stderr)
+        return sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    raise ValueError(f"no writable place for the export index of {path}")
+
+
+def walk(source, workbook_ids: Sequence[str]) -> Closure:
+    closure = Closure()
+    for workbook_id, collection_id in source.references("workbooks", "workbook_id", workbook_ids):
+        closure.workbooks[workbook_id] = collection_id
+    missing = set(workbook_ids) - closure.workbooks.keys()
+    if missing:
+        raise ValueError(f"workbooks not found: {', '.join(sorted(missing))}")
+
+    frontier = _add_entries(closure, source.references("entries", "workbook_id", workbook_ids))
+    while frontier:
+        targets = {to_id for _, to_id in source.references("links", "from_id", frontier)}
+        frontier = _add_entries(closure, source.references("entries", "entry_id", targets - closure.entries.keys()))
+
+    extra_workbooks = {entry.workbook_id for entry in closure.entries.values()} - {None} - closure.workbooks.keys()
+    for workbook_id, collection_id in source.references("workbooks", "workbook_id", extra_workbooks):
+        closure.workbooks[workbook_id] = collection_id
+
+    frontier = set(closure.workbooks.values()) | {entry.collection_id for entry in closure.entries.values()}
+    while frontier - {None}:
+        found = dict(source.references("collections", "collection_id", frontier - {None}))
+        closure.collections.update(found)
+        frontier = set(found.values()) - closure.collections.keys()
+
+    closure.revisions = {
+        rev_id for entry in closure.entries.values() for rev_id in (entry.saved_id, entry.published_id) if rev_id is not None
+    }
+    return closure
+
+
+def _add_entries(closure: Closure, rows: Iterable[Sequence[Optional[str]]]) -> set[str]:
+    added = set()
+    for entry_id, *references in rows:
+        if entry_id not in closure.entries:
+            closure.entries[entry_id] = Entry(*references)
+            added.add(entry_id)
+    return added
+
+
+def export(source, closure: Closure, out: IO[bytes], disable_triggers: bool = False) -> dict[str, int]:
+    """ Writes the rows of the closure in reference order, returns the number of rows per table """
+
+    if disable_triggers:
+        out.write(b"SET session_replication_role = replica;\n")
+    entry_ids = sorted(closure.entries)
+    return dict(
+        collections=source.write("collections", "collection_id", closure.collections_order(), out),
+        workbooks=source.write("workbooks", "workbook_id", sorted(closure.workbooks), out),
+        entries=source.write("entries", "entry_id", entry_ids, out),
+        revisions=source.write("revisions", "rev_id", sorted(closure.revisions), out),
+        links=source.write("links", "from_id", entry_ids, out),
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Export workbooks with every row they need")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write a plain dump of the workbooks and their dependencies")
+    export_parser.add_argument("--workbook", action="append", required=True, help="workbook_id, can be repeated")
+    export_parser.add_argument("--dump", help="plain SQL dump to export from instead of the database")
+    export_parser.add_argument("--disable-triggers", action="store_true", help="load with session_replication_role = replica (superuser)")
+    export_parser.add_argument("--output", default="-", help="'-' for stdout")
+
+    index_parser = commands.add_parser("index", help="build the export index of a plain SQL dump")
+    index_parser.add_argument("--dump", required=True)
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "index":
+            open_index(args.dump).close()
+            return
+
+        for workbook_id in args.workbook:
+            if not workbook_id.isdigit():
+                raise ValueError(f"workbook_id has to be a number: {workbook_id}")
+        source = DumpSource(args.dump) if args.dump else DatabaseSource()
+        closure = walk(source, args.workbook)
+        if args.output == "-":
+            counts = export(source, closure, sys.stdout.buffer, args.disable_triggers)
+            sys.stdout.buffer.flush()
+        else:
+            with open(args.output, "wb") as out:
+                counts = export(source, closure, out, args.disable_triggers)
+        print("  " + ", ".join(f"{table}: {count}" for table, count in counts.items()), file=sys.stderr)
+    except ValueError as err:
+        sys.exit(f"  error: {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Generates a synthetic UnitedStorage dataset of any size for load testing.
+
+    us_generate.py --workbooks 10000 --entries-per-workbook 100 --revisions-per-entry 3 | psql ...
+    us_generate.py --workbooks 1000 --format inserts --output big-dump.sql
+
+Rows follow the demo data: the same columns, bigint ids, `<entry_id>/<name>` keys, a connection with an
+encrypted password per workbook, datasets linked to it, wizard widgets linked to the datasets and dashes
+linked to the widgets. The output is fully determined by `--seed` and the sizes. Every workbook is derived
+from the seed and its number alone, so tables are written one after another, in reference order, by
+generating the workbooks again for each table: memory use does not depend on the dataset size.
+
+`--format copy` writes one `COPY ... FROM stdin` block per table, `--format inserts` a us-dump.sh like dump
+with one INSERT per row, for the tools that read those (us_copy.py, us_sanitize.py, us_parallel_restore.py).
+The columns of collections are not in the demo data, they follow the US schema and are only written with
+`--collections`.
+"""
+import argparse
+import base64
+import datetime
+import json
+import random
+import string
+import sys
+from dataclasses import dataclass
+from typing import IO, Iterator, Optional, Sequence
+
+import us_copy
+import us_dump
+
+Bare = us_dump.Bare
+
+COLUMNS = {
+    "collections": (
+        "collection_id", "title", "title_lower", "description", "parent_id", "tenant_id", "created_by", "created_at",
+        "updated_by", "updated_at", "deleted_by", "deleted_at", "meta", "sort_title",
+    ),
+    "workbooks": (
+        "workbook_id", "title", "description", "tenant_id", "meta", "created_by", "created_at", "deleted_at",
+        "is_template", "collection_id", "deleted_by", "updated_by", "updated_at", "title_lower", "sort_title", "status",
+    ),
+    "entries": (
+        "scope", "type", "key", "inner_meta", "created_by", "created_at", "updated_by", "updated_at", "is_deleted",
+        "deleted_at", "hidden", "display_key", "entry_id", "saved_id", "published_id", "tenant_id", "name",
+        "sort_name", "public", "unversioned_data", "workbook_id", "mirrored", "collection_id",
+    ),
+    "revisions": (
+        "data", "meta", "created_by", "created_at", "updated_by", "updated_at", "rev_id", "entry_id", "links",
+        "annotation",
+    ),
+    "links": ("from_id", "to_id", "name"),
+}
+
+# widget types with their share of the widgets of the demo data
+WIDGET_TYPES = (("graph_wizard_node", 51), ("table_wizard_node", 25), ("metric_wizard_node", 8), ("ymap_wizard_node", 8))
+CONNECTION_TYPES = ("postgres", "clickhouse", "greenplum", "mysql")
+VISUALIZATIONS = {
+    "graph_wizard_node": ("line", "area", "column", "bar", "pie", "scatter"),
+    "table_wizard_node": ("flatTable", "pivotTable"),
+    "metric_wizard_node": ("metric",),
+    "ymap_wizard_node": ("geolayer",),
+}
+WORDS = (
+    "sales", "orders", "revenue", "profit", "customers", "regions", "products", "categories", "cohorts", "returns",
+    "delivery", "payments", "stock", "margin", "traffic", "sessions", "retention", "forecast", "budget", "plan",
+)
+
+ID_BASE = 1507164764046888724
+ID_KINDS = {"collections": 1, "workbooks": 2, "entries": 3, "revisions": 4}
+CREATED_AT = datetime.datetime(2023, 9, 11, 8, 47, 20, tzinfo=datetime.timezone.utc)
+SYSTEM_USER = "uid:systemId"
+
+_FILLER = "".join(random.Random(0).choices(string.ascii_letters + string.digits + " ", k=4096))
+
+
+@dataclass
+class Sizes:
+    workbooks: int = 10
+    entries_per_workbook: int = 96
+    revisions_per_entry: int = 1
+    links_per_dash: int = 10
+    collections: int = 0
+    collections_fanout: int = 10
+    revision_bytes: int = 1024
+
+    @property
+    def max_revisions(self) -> int:
+        return 2 * self.revisions_per_entry - 1
+
+
+@dataclass
+class Entry:
+    index: int  # global number of the entry
+    scope: str
+    type: str
+    name: str
+    revisions: int
+    links: list[tuple[int, str]]  # (index of the linked entry in the workbook, link name)
+
+    @property
+    def entry_id(self) -> int:
+        return make_id("entries", self.index)
+
+
+def make_id(kind: str, index: int) -> int:
+    return ID_BASE + index * 8 + ID_KINDS[kind]
+
+
+def encode_id(value: int) -> str:
+    """ A public id of the same shape as the US ones (13 lowercase characters), not the US encoding """
+
+    return base64.b32encode(value.to_bytes(8, "big")).decode().rstrip("=").lower()
+
+
+def timestamp(seconds: int) -> str:
+    return (CREATED_AT + datetime.timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S.%f+00")
+
+
+def sort_bytes(text: str) -> str:
+    return "\\x" + text.encode().hex()
+
+
+def to_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class WorkbookPlan:
+    """ Everything about one workbook, derived from the seed and the workbook number only """
+
+    def __init__(self, seed: int, number: int, sizes: Sizes):
+        self.number = number
+        self.sizes = sizes
+        self.rng = random.Random(f"{seed}/{number}")
+        self.workbook_id = make_id("workbooks", number)
+        self.collection_id = make_id("collections", number % sizes.collections) if sizes.collections else None
+        self.title = f"{self.rng.choice(WORDS).capitalize()} {self.rng.choice(WORDS)} {number}"
+        self.entries = self._plan_entries()
+
+    def _plan_entries(self) -> list[Entry]:
+        rng, sizes = self.rng, self.sizes
+        total = sizes.entries_per_workbook
+        first = self.number * total
+        datasets = min(max(1, total // 40), max(total - 1, 0))
+        dashes = min(max(1, total // 50), max(total - 1 - datasets, 0))
+        widgets = max(total - 1 - datasets - dashes, 0)
+        widget_types = [name for name, _ in WIDGET_TYPES]
+        widget_weights = [weight for _, weight in WIDGET_TYPES]
+
+        entries: list[Entry] = []
+
+        def add(scope: str, entry_type: str, links: list[tuple[int, str]]) -> None:
+            name = f"{rng.choice(WORDS)} by {rng.choice(WORDS)} {len(entries)}"
+            revisions = rng.randint(1, sizes.max_revisions)
+            entries.append(Entry(first + len(entries), scope, entry_type, name, revisions, links))
+
+        if total:
+            add("connection", rng.choice(CONNECTION_TYPES), [])
+        for _ in range(datasets):
+            add("dataset", "", [(0, "connection")])
+        dataset_indexes = range(1, 1 + datasets)
+        for _ in range(widgets):
+            links = [(rng.choice(dataset_indexes), "dataset")] if datasets else []
+            add("widget", rng.choices(widget_types, widget_weights)[0], links)
+        widget_indexes = range(1 + datasets, 1 + datasets + widgets)
+        for _ in range(dashes):
+            linked = rng.sample(widget_indexes, min(sizes.links_per_dash, widgets))
+            add("dash", "", [(idx, f"{rng.getrandbits(128):032x}") for idx in linked])
+        return entries
+
+    def workbook_row(self) -> list[us_dump.SqlValue]:
+        created_at = timestamp(self.number)
+        return [
+            Bare(str(self.workbook_id)), self.title, "", "common", "{}", "systemId", created_at, None, Bare("false"),
+            None if self.collection_id is None else Bare(str(self.collection_id)), None, "systemId", created_at,
+            self.title.lower(), sort_bytes(self.title), "active",
+        ]
+
+    def entry_rows(self) -> Iterator[list[us_dump.SqlValue]]:
+        for entry in self.entries:
+            created_at = timestamp(self.number + entry.index)
+            last_rev_id = Bare(str(self.rev_id(entry, entry.revisions - 1)))
+            display_name = entry.name.capitalize()
+            unversioned_data = "{}"
+            if entry.scope == "connection":
+                unversioned_data = to_json({"password": {
+                    "key_id": "KEY", "key_kind": "local_fernet", "cypher_text": f"gAAAAA{self.rng.getrandbits(256):064x}",
+                }})
+            yield [
+                entry.scope, entry.type, f"{entry.entry_id}/{entry.name}", None, SYSTEM_USER, created_at, SYSTEM_USER,
+                created_at, Bare("false"), None, Bare("false"), f"{entry.entry_id}/{display_name}",
+                Bare(str(entry.entry_id)), last_rev_id, None if entry.scope == "connection" else last_rev_id, "common",
+                entry.name, sort_bytes(entry.name), Bare("false"), unversioned_data, Bare(str(self.workbook_id)),
+                Bare("false"), None,
+            ]
+
+    def rev_id(self, entry: Entry, revision: int) -> int:
+        return make_id("revisions", entry.index * self.sizes.max_revisions + revision)
+
+    def revision_rows(self) -> Iterator[list[us_dump.SqlValue]]:
+        for entry in self.entries:
+            links = {name: encode_id(self.entries[idx].entry_id) for idx, name in entry.links}
+            for revision in range(entry.revisions):
+                updated_at = timestamp(self.number + entry.index + revision * 3600)
+                yield [
+                    self._revision_data(entry, revision), "{}", SYSTEM_USER, updated_at, SYSTEM_USER, updated_at,
+                    Bare(str(self.rev_id(entry, revision))), Bare(str(entry.entry_id)), to_json(links), None,
+                ]
+
+    def _revision_data(self, entry: Entry, revision: int) -> str:
+        offset = self.rng.randrange(len(_FILLER))
+        filler = (_FILLER[offset:] + _FILLER[:offset]) * (self.sizes.revision_bytes // len(_FILLER) + 1)
+        if entry.scope == "connection":
+            data = {
+                "host": f"{entry.type}-{self.number}.internal", "port": 5432, "db_name": f"db_{self.number}",
+                "username": f"user_{self.number}", "table_name": "", "mdb_cluster_id": None,
+            }
+        elif entry.scope == "widget":
+            data = {
+                "version": "12", "visualization": {"id": self.rng.choice(VISUALIZATIONS[entry.type])},
+                "datasetsIds": [encode_id(self.entries[idx].entry_id) for idx, _ in entry.links], "revision": revision,
+            }
+        else:
+            data = {"revision": revision}
+        data["description"] = filler[:self.sizes.revision_bytes]
+        return to_json(data)
+
+    def link_rows(self) -> Iterator[list[us_dump.SqlValue]]:
+        for entry in self.entries:
+            for idx, name in entry.links:
+                yield [Bare(str(entry.entry_id)), Bare(str(self.entries[idx].entry_id)), name]
+
+
+def collection_rows(sizes: Sizes) -> Iterator[list[us_dump.SqlValue]]:
+    """ Collections form a tree: the first one is the root, every collection has `collections_fanout` children """
+
+    for number in range(sizes.collections):
+        title = f"Collection {number}"
+        created_at = timestamp(number)
+        parent_id = None if number == 0 else Bare(str(make_id("collections", (number - 1) // sizes.collections_fanout)))
+        yield [
+            Bare(str(make_id("collections", number))), title, title.lower(), "", parent_id, "common", "systemId",
+            created_at, "systemId", created_at, None, None, "{}", sort_bytes(title),
+        ]
+
+
+def iter_table_rows(table: str, seed: int, sizes: Sizes) -> Iterator[list[us_dump.SqlValue]]:
+    if table == "collections":
+        yield from collection_rows(sizes)
+        return
+    for number in range(sizes.workbooks):
+        plan = WorkbookPlan(seed, number, sizes)
+        if table == "workbooks":
+            yield plan.workbook_row()
+        elif table == "entries":
+            yield from plan.entry_rows()
+        elif table == "revisions":
+            yield from plan.revision_rows()
+        else:
+            yield from plan.link_rows()
+
+
+def write_dataset(out: IO[str], seed: int, sizes: Sizes, output_format: str) -> dict[str, int]:
+    """ Writes all tables in reference order, returns the number of rows per table """
+
+    counts: dict[str, int] = {}
+    for level in us_dump.US_TABLES_LOAD_LEVELS:
+        for table in level:
+            if table == "collections" and not sizes.collections:
+                continue
+            columns_sql = ", ".join(COLUMNS[table])
+            count = 0
+            if output_format == "copy":
+                out.write(f"COPY public.{table} ({columns_sql}) FROM stdin;\n")
+                for values in iter_table_rows(table, seed, sizes):
+                    out.write("\t".join(map(us_copy.copy_value, values)) + "\n")
+                    count += 1
+                out.write("\\.\n\n")
+            else:
+                prefix = f"INSERT INTO public.{table} ({columns_sql}) VALUES ("
+                for values in iter_table_rows(table, seed, sizes):
+                    out.write(prefix + ", ".join(map(us_dump.sql_literal, values)) + ") ON CONFLICT DO NOTHING;\n")
+                    count += 1
+                out.write("\n")
+            counts[table] = count
+    return counts
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic UnitedStorage dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workbooks", type=int, default=Sizes.workbooks)
+    parser.add_argument("--entries-per-workbook", type=int, default=Sizes.entries_per_workbook)
+    parser.add_argument("--revisions-per-entry", type=int, default=Sizes.revisions_per_entry, help=(
+        "mean number of revisions of an entry, each gets 1 to 2 * N - 1"
+    ))
+    parser.add_argument("--links-per-dash", type=int, default=Sizes.links_per_dash, help="widgets linked to every dash")
+    parser.add_argument("--collections", type=int, default=Sizes.collections, help="collections to put the workbooks into")
+    parser.add_argument("--collections-fanout", type=int, default=Sizes.collections_fanout)
+    parser.add_argument("--revision-bytes", type=int, default=Sizes.revision_bytes, help="approximate size of the revisions data")
+    parser.add_argument("--format", choices=("copy", "inserts"), default="copy")
+    parser.add_argument("--output", default="-", help="'-' for stdout, a .gz name to compress")
+    args = parser.parse_args(argv)
+
+    if args.revisions_per_entry < 1 or args.collections_fanout < 1:
+        parser.error("--revisions-per-entry and --collections-fanout have to be positive")
+
+    sizes = Sizes(
+        workbooks=args.workbooks,
+        entries_per_workbook=args.entries_per_workbook,
+        revisions_per_entry=args.revisions_per_entry,
+        links_per_dash=args.links_per_dash,
+        collections=args.collections,
+        collections_fanout=args.collections_fanout,
+        revision_bytes=args.revision_bytes,
+    )
+    with us_dump.open_output(args.output) as out:
+        counts = write_dataset(out, args.seed, sizes, args.format)
+    print("  " + ", ".join(f"{table}: {count}" for table, count in counts.items()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Incremental dumps of the UnitedStorage tables, see scripts/dump-entries.sh --incremental.
+
+    us_incremental.py dump > us-20240101-000000.sql
+    us_incremental.py dump --previous us-20240101-000000.sql > us-20240102-000000.sql
+    us_incremental.py merge --base us-20240101-000000.sql --delta us-20240102-000000.sql --output merged.sql
+
+Without `--previous` all rows are dumped. With the newest dump of a chain as `--previous` only these are:
+- rows with `updated_at` not older than the watermark of the previous dump minus `--overlap` seconds, so rows of
+  transactions that committed late are not lost;
+- rows whose keys were not in the previous dump, whatever their timestamps;
+- tombstones, `DELETE FROM <table> WHERE <key>;`, for the keys that are gone.
+
+Every dump ends with a `-- us-incremental-state: ...` line holding the watermarks (max `updated_at` per table) and
+the sorted keys of all tables, gzipped and base64 encoded; the next dump is computed against it. Keys are compared
+by walking the stored and the current ones in order, so memory does not depend on the table sizes. `--previous`
+only needs that line: dump-entries.sh keeps it next to each dump as `<dump>.state` and passes that instead of
+the whole dump.
+
+Rows of a delta are INSERT ... ON CONFLICT DO NOTHING like in a full dump, so a changed row does not replace the
+restored one: a delta is only correct applied with `merge`, not restored with us-restore.sh on top of its base.
+
+`merge` compacts a base and its deltas into one dump in the plain us-dump.sh format, restorable with us-restore.sh,
+and keeps the state of the last delta so the chain goes on from it. Deltas apply as in us_variant.py: rows replace
+the rows with the same key, tombstones drop them.
+"""
+import argparse
+import base64
+import gzip
+import io
+import itertools
+import json
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import IO, Iterable, Iterator, Optional, Sequence
+
+import us_db
+import us_dump
+import us_variant
+
+STATE_PREFIX = "-- us-incremental-state: "
+FULL_HEADER = "-- us-incremental full dump\n"
+DELTA_HEADER = "-- us-incremental delta\n"
+
+TIMESTAMP_COLUMN = "updated_at"
+INTEGER_TYPES = ("smallint", "integer", "bigint")
+BARE_TYPES = (*INTEGER_TYPES, "numeric", "real", "double precision")
+
+FETCH_BATCH_SIZE = 1000
+
+Key = tuple
+
+
+@dataclass
+class Table:
+    name: str
+    columns: list[str]
+    types: dict[str, str]
+
+    @property
+    def key_columns(self) -> tuple[str, ...]:
+        return us_dump.PRIMARY_KEYS[self.name]
+
+    @property
+    def order_by(self) -> str:
+        # text keys are compared byte-wise, the same order python compares them in
+        return ", ".join(
+            column if self.types[column] in INTEGER_TYPES else f'{column} COLLATE "C"' for column in self.key_columns
+        )
+
+    def sort_key(self, values: Sequence[Optional[str]]) -> Key:
+        return tuple(
+            int(value) if self.types[column] in INTEGER_TYPES else value for column, value in zip(self.key_columns, values)
+        )
+
+    def literal(self, column: str, value: Optional[str]) -> us_dump.SqlValue:
+        if value is None:
+            return None
+        data_type = self.types[column]
+        if data_type == "boolean":
+            return us_dump.Bare("true" if value == "t" else "false")
+        if data_type in BARE_TYPES:
+            return us_dump.Bare(value)
+        return value
+
+    def render_row(self, values: Sequence[Optional[str]]) -> str:
+        literals = ", ".join(us_dump.sql_literal(self.literal(column, value)) for column, value in zip(self.columns, values))
+        return f"INSERT INTO public.{self.name} ({', '.join(self.columns)}) VALUES ({literals}) ON CONFLICT DO NOTHING;\n"
+
+    def select(self, where: str = "", order: bool = False) -> str:
+        query = f"SELECT {', '.join(self.columns)} FROM public.{self.name}"
+        if where:
+            query += f" WHERE {where}"
+        if order:
+            query += f" ORDER BY {self.order_by}"
+        return query
+
+    def key_of_row(self, values: Sequence[Optional[str]]) -> Key:
+        return self.sort_key([values[self.columns.index(column)] for column in self.key_columns])
+
+
+def load_tables() -> list[Table]:
+    """ The US tables present in the database, in reference order """
+
+    names = ", ".join(us_dump.sql_literal(table) for table in us_dump.US_TABLES)
+    columns: dict[str, list[tuple[str, str]]] = {}
+    for table, column, data_type in us_db.copy_out_rows(
+        "SELECT table_name, column_name, data_type FROM information_schema.columns"
+        f" WHERE table_schema = 'public' AND table_name IN ({names}) ORDER BY table_name, ordinal_position"
+    ):
+        columns.setdefault(table, []).append((column, data_type))
+    return [
+        Table(table, [column for column, _ in columns[table]], dict(columns[table]))
+        for level in us_dump.US_TABLES_LOAD_LEVELS
+        for table in level
+        if table in columns
+    ]
+
+
+class StateReader:
+    """ Reads the state line of a dump: watermarks first, then the keys of the tables in dump order """
+
+    def __init__(self, state_line: str):
+        self._lines = gzip.GzipFile(fileobj=io.BytesIO(base64.b64decode(state_line[len(STATE_PREFIX):])))
+        self.watermarks: dict[str, Optional[str]] = json.loads(self._lines.readline())["watermarks"]
+        self._pending: Optional[list] = None
+
+    def keys(self, table: str) -> Iterator[Key]:
+        while True:
+            if self._pending is None:
+                line = self._lines.readline()
+                if not line:
+                    return
+                self._pending = json.loads(line)
+            if self._pending[0] != table:
+                return
+            yield tuple(self._pending[1:])
+            self._pending = None
+
+    @classmethod
+    def from_dump(cls, stream: IO[str]) -> Optional["StateReader"]:
+        state_line = None
+        for line in stream:
+            if line.startswith(STATE_PREFIX):
+                state_line = line.strip()
+        return None if state_line is None else cls(state_line)
+
+
+class StateWriter:
+    def __init__(self, watermarks: dict[str, Optional[str]]):
+        self._file = tempfile.TemporaryFile()
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode="wb")
+        self._gzip.write(json.dumps(dict(watermarks=watermarks)).encode() + b"\n")
+
+    def add_key(self, table: str, key: Key) -> None:
+        self._gzip.write(json.dumps([table, *key], ensure_ascii=False).encode() + b"\n")
+
+    def write(self, out: IO[str]) -> None:
+        self._gzip.close()
+        self._file.seek(0)
+        out.write(STATE_PREFIX)
+        while chunk := self._file.read(3 * 65536):
+            out.write(base64.b64encode(chunk).decode())
+        out.write("\n")
+        self._file.close()
+
+
+def diff_keys(previous: Iterable[Key], current: Iterable[Key]) -> Iterator[tuple[str, Key]]:
+    """ Walks two sorted key streams, yields ("added" | "removed" | "kept", key) """
+
+    previous, current = iter(previous), iter(current)
+    old, new = next(previous, None), next(current, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old < new):
+            yield "removed", old
+            old = next(previous, None)
+        elif old is None or new < old:
+            yield "added", new
+            new = next(current, None)
+        else:
+            yield "kept", new
+            old, new = next(previous, None), next(current, None)
+
+
+def _key_literal(table: Table, key: Key) -> str:
+    values = ", ".join(us_dump.sql_literal(us_dump.Bare(str(value)) if isinstance(value, int) else value) for value in key)
+    return f"({values})"
+
+
+def dump_table(
+    table: Table, previous: Optional[StateReader], state: StateWriter, overlap: int, snapshot: str, out: IO[str]
+) -> tuple[int, list[str]]:
+    """ Writes the rows of a table for the dump, returns their number and the tombstones of the table """
+
+    rows = 0
+    if previous is None:
+        for values in us_db.copy_out_rows(table.select(order=True), snapshot):
+            out.write(table.render_row(values))
+            state.add_key(table.name, table.key_of_row(values))
+            rows += 1
+        return rows, []
+
+    written: set[Key] = set()
+    watermark = previous.watermarks.get(table.name)
+    if watermark is not None and TIMESTAMP_COLUMN in table.types:
+        where = f"{TIMESTAMP_COLUMN} >= {us_dump.sql_literal(watermark)}::timestamptz - interval '{overlap} seconds'"
+        for values in us_db.copy_out_rows(table.select(where), snapshot):
+            out.write(table.render_row(values))
+            written.add(table.key_of_row(values))
+            rows += 1
+
+    added: list[Key] = []
+    tombstones: list[str] = []
+    current = (table.sort_key(values) for values in us_db.copy_out_rows(
+        f"SELECT {', '.join(table.key_columns)} FROM public.{table.name} ORDER BY {table.order_by}", snapshot
+    ))
+    for change, key in diff_keys(previous.keys(table.name), current):
+        if change == "removed":
+            tombstones.append(us_variant.render_delete(table.name, tuple(
+                us_dump.Bare(str(value)) if isinstance(value, int) else value for value in key
+            )))
+            continue
+        state.add_key(table.name, key)
+        if change == "added" and key not in written:
+            added.append(key)
+
+    key_columns = ", ".join(table.key_columns)
+    for batch in itertools.zip_longest(*[iter(added)] * FETCH_BATCH_SIZE):
+        keys = ", ".join(_key_literal(table, key) for key in batch if key is not None)
+        for values in us_db.copy_out_rows(table.select(f"({key_columns}) IN ({keys})"), snapshot):
+            out.write(table.render_row(values))
+            rows += 1
+    return rows, tombstones
+
+
+def dump(previous: Optional[StateReader], overlap: int, out: IO[str]) -> None:
+    tables = load_tables()
+    # every query of the dump reads the same snapshot, so the rows, the tombstones and the state agree with each other
+    with us_db.exported_snapshot() as snapshot:
+        watermarks = {
+            table.name: us_db.query_value(f"SELECT max({TIMESTAMP_COLUMN})::text FROM public.{table.name}", snapshot)
+            for table in tables
+            if TIMESTAMP_COLUMN in table.types
+        }
+        state = StateWriter(watermarks)
+        out.write(FULL_HEADER if previous is None else DELTA_HEADER)
+        tombstones: list[str] = []
+        for table in tables:
+            rows, table_tombstones = dump_table(table, previous, state, overlap, snapshot, out)
+            tombstones.extend(table_tombstones)
+            print(f"  {table.name}: {rows} rows, {len(table_tombstones)} deleted", file=sys.stderr)
+    out.writelines(tombstones)
+    state.write(out)
+
+
+def merge(base: str, deltas: list[str], out: IO[str]) -> None:
+    delta = us_variant.Delta()
+    state_line = None
+    for path in [base, *deltas]:
+        with us_dump.open_dump(path) as f:
+            for line in f:
+                if line.startswith(STATE_PREFIX):
+                    state_line = line
+        if path != base:
+            with us_dump.open_dump(path) as f:
+                delta.update(us_variant.Delta.load(f))
+
+    out.write(FULL_HEADER)
+    with us_dump.open_dump(base) as f:
+        for chunk in us_variant.materialize(f, delta):
+            if not chunk.startswith((STATE_PREFIX, FULL_HEADER, DELTA_HEADER)):
+                out.write(chunk)
+    if state_line is not None:
+        out.write(state_line)
+    print(f"  merged {len(deltas)} deltas, {len(delta)} changed rows", file=sys.stderr)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Incremental dumps of the UnitedStorage tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dump_parser = commands.add_parser("dump", help="dump all rows, or the changes since a previous dump")
+    dump_parser.add_argument("--previous", help="newest dump of the chain, '-' for stdin")
+    dump_parser.add_argument("--overlap", type=int, default=300, help="seconds to look back from the watermarks")
+    dump_parser.add_argument("--output", default="-", help="'-' for stdout")
+
+    merge_parser = commands.add_parser("merge", help="compact a base dump and its deltas into one dump")
+    merge_parser.add_argument("--base", required=True)
+    merge_parser.add_argument("--delta", action="append", default=[], help="delta to apply, oldest first, can be repeated")
+    merge_parser.add_argument("--output", default="-", help="'-' for stdout")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "dump":
+            previous = None
+            if args.previous:
+                with us_dump.open_dump(args.previous) as f:
+                    previous = StateReader.from_dump(f)
+                if previous is None:
+                    sys.exit(f"  error: {args.previous} has no incremental state, make a full dump first")
+            with us_dump.open_output(args.output) as out:
+                dump(previous, args.overlap, out)
+        else:
+            with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as tmp:
+                merge(args.base, args.delta, tmp)
+                tmp.seek(0)
+                with us_dump.open_output(args.output) as out:
+                    shutil.copyfileobj(tmp, out)
+    except ValueError as err:
+        sys.exit(f"  error: {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Manifest of a UnitedStorage dump, written next to it as `<dump>.manifest.json` by scripts/dump-entries.sh.
+
+    us_manifest.py build --dump datalens_db.dump
+    us_manifest.py verify --dump datalens_db.dump --jobs 8
+    us_manifest.py extract --dump datalens_db.sql --workbook 1507164764046888724 --output workbook.sql
+
+The manifest holds the dump size and a blake2b checksum of every `--chunk-size` bytes of it, so `verify`
+checks the chunks concurrently, reading them with pread. For plain SQL dumps (POSTGRES_DUMP_FORMAT=plain,
+us_incremental.py dumps) it also holds, per table, the row count and the byte ranges of the sections of
+its rows, and a sparse workbook index: per workbook and table, the byte ranges of runs of consecutive
+rows that belong to the workbook (entries by workbook_id, revisions and links through their entry).
+`extract` seeks to these ranges and writes the rows of the requested tables and workbooks in reference
+order, without parsing the rest of the dump. The rows of collections are not in the workbook index.
+
+Custom format dumps are compressed by table, byte ranges of rows do not exist in them: their manifest only
+has checksums, use `pg_restore --table` to restore a part of them.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+from typing import IO, Iterator, Optional, Sequence, Union
+
+import us_dump
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+Range = list[int]  # [start, end) byte offsets in the dump
+
+
+def dump_format(path: str) -> str:
+    with open(path, "rb") as f:
+        magic = f.read(5)
+    if magic[:2] == b"\x1f\x8b":
+        return "gzip"
+    if magic == b"PGDMP":
+        return "custom"
+    return "plain"
+
+
+def _chunk_digest(fd: int, offset: int, size: int) -> str:
+    return hashlib.blake2b(os.pread(fd, size, offset), digest_size=16).hexdigest()
+
+
+def chunk_checksums(path: str, chunk_size: int, jobs: int) -> list[str]:
+    size = os.path.getsize(path)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(lambda offset: _chunk_digest(fd, offset, chunk_size), range(0, size, chunk_size)))
+    finally:
+        os.close(fd)
+
+
+def _add_range(ranges: list[Range], start: int, end: int) -> None:
+    # rows that follow each other extend the last range, so a run of rows costs a single range
+    if ranges and ranges[-1][1] == start:
+        ranges[-1][1] = end
+    else:
+        ranges.append([start, end])
+
+
+def iter_ranges(stream: IO[str]) -> Iterator[tuple[Union[str, us_dump.InsertRow], int, int]]:
+    """ Yields the items of a plain dump with their [start, end) byte offsets """
+
+    # the offsets are measured on the statements as they are in the dump: a row rendered back from its values
+    # can differ in spacing or casts
+    offset = 0
+    for statement in us_dump.iter_statements(stream):
+        row = us_dump.parse_insert(statement, us_dump.US_TABLES)
+        end = offset + len(statement.encode())
+        yield statement if row is None else row, offset, end
+        offset = end
+
+
+def index_sections(stream: IO[str]) -> tuple[dict, dict]:
+    """ Returns the tables (rows, sections) and the workbook index of a plain dump """
+
+    tables: dict[str, dict] = {}
+    workbooks: dict[str, dict[str, list[Range]]] = {}
+    entry_workbooks: dict[str, str] = {}
+    current_table: Optional[str] = None
+    for item, offset, end in iter_ranges(stream):
+        if isinstance(item, us_dump.InsertRow):
+            table = tables.setdefault(item.table, dict(rows=0, sections=[]))
+            table["rows"] += 1
+            if item.table == current_table:
+                table["sections"][-1][1] = end
+            else:
+                table["sections"].append([offset, end])
+                current_table = item.table
+
+            if item.table == "workbooks":
+                workbook_id = item.get("workbook_id")
+            elif item.table == "entries":
+                workbook_id = item.get("workbook_id")
+                if workbook_id is not None:
+                    entry_workbooks[item.get("entry_id")] = workbook_id
+            elif item.table == "revisions":
+                workbook_id = entry_workbooks.get(item.get("entry_id"))
+            elif item.table == "links":
+                workbook_id = entry_workbooks.get(item.get("from_id"))
+            else:
+                workbook_id = None
+            if workbook_id is not None:
+                _add_range(workbooks.setdefault(workbook_id, {}).setdefault(item.table, []), offset, end)
+        elif item.strip() and not item.startswith("--"):
+            current_table = None
+    return tables, workbooks
+
+
+def build(path: str, chunk_size: int, jobs: int) -> dict:
+    manifest = dict(
+        version=MANIFEST_VERSION,
+        dump=os.path.basename(path),
+        format=dump_format(path),
+        size=os.path.getsize(path),
+        chunk_size=chunk_size,
+        chunks=chunk_checksums(path, chunk_size, jobs),
+    )
+    if manifest["format"] == "plain":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            manifest["tables"], manifest["workbooks"] = index_sections(f)
+    return manifest
+
+
+def load_manifest(path: str) -> dict:
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{path}: unsupported manifest version {manifest.get('version')}")
+    return manifest
+
+
+def verify(path: str, manifest: dict, jobs: int) -> list[int]:
+    """ Returns the numbers of the chunks that do not match the manifest """
+
+    size = os.path.getsize(path)
+    if size != manifest["size"]:
+        raise ValueError(f"{path} is {size} bytes, the manifest expects {manifest['size']}")
+    checksums = chunk_checksums(path, manifest["chunk_size"], jobs)
+    return [number for number, (actual, expected) in enumerate(zip(checksums, manifest["chunks"])) if actual != expected]
+
+
+def extract(path: str, manifest: dict, tables: Sequence[str], workbooks: Sequence[str], out: IO[bytes]) -> int:
+    """ Writes the rows of the tables, only of the workbooks when there are any, returns the bytes written """
+
+    if "tables" not in manifest:
+        raise ValueError(f"{path} is a {manifest['format']} dump, only plain SQL dumps are indexed")
+    for workbook_id in workbooks:
+        if workbook_id not in manifest["workbooks"]:
+            raise ValueError(f"workbook {workbook_id} is not in {path}")
+
+    written = 0
+    with open(path, "rb") as f:
+        for level in us_dump.US_TABLES_LOAD_LEVELS:
+            for table in level:
+                if table not in tables:
+                    continue
+                if workbooks:
+                    ranges = sorted(r for workbook_id in workbooks for r in manifest["workbooks"][workbook_id].get(table, []))
+                else:
+                    ranges = manifest["tables"].get(table, {}).get("sections", [])
+                for start, end in ranges:
+                    f.seek(start)
+                    out.write(f.read(end - start))
+                    written += end - start
+    return written
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Build, verify and use the manifest of a UnitedStorage dump")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="write the manifest of a dump")
+    build_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="bytes per checksum")
+
+    verify_parser = commands.add_parser("verify", help="check a dump against its manifest")
+
+    extract_parser = commands.add_parser("extract", help="write a part of a plain dump")
+    extract_parser.add_argument("--table", action="append", choices=us_dump.US_TABLES, help="can be repeated, all by default")
+    extract_parser.add_argument("--workbook", action="append", default=[], help="workbook_id, can be repeated")
+    extract_parser.add_argument("--output", default="-", help="'-' for stdout")
+
+    for command_parser in (build_parser, verify_parser, extract_parser):
+        command_parser.add_argument("--dump", required=True)
+        command_parser.add_argument("--manifest", help=f"<dump>{MANIFEST_SUFFIX} by default")
+        command_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="concurrent chunk checks")
+
+    args = parser.parse_args(argv)
+    manifest_path = args.manifest or args.dump + MANIFEST_SUFFIX
+
+    try:
+        if args.command == "build":
+            manifest = build(args.dump, args.chunk_size, args.jobs)
+            with open(manifest_path, "w") as f:
+                json.dump(manifest, f, separators=(",", ":"))
+            rows = sum(table["rows"] for table in manifest.get("tables", {}).values())
+            print(f"  {manifest_path}: {len(manifest['chunks'])} chunks, {rows} rows indexed", file=sys.stderr)
+        elif args.command == "verify":
+            bad_chunks = verify(args.dump, load_manifest(manifest_path), args.jobs)
+            if bad_chunks:
+                sys.exit(f"  error: {args.dump} is corrupted, chunks {', '.join(map(str, bad_chunks))} do not match")
+            print(f"  {args.dump} matches its manifest", file=sys.stderr)
+        else:
+            manifest = load_manifest(manifest_path)
+            tables = args.table or us_dump.US_TABLES
+            if args.output == "-":
+                written = extract(args.dump, manifest, tables, args.workbook, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            else:
+                with open(args.output, "wb") as out:
+                    written = extract(args.dump, manifest, tables, args.workbook, out)
+            print(f"  {written} bytes extracted", file=sys.stderr)
+    except (OSError, ValueError) as err:
+        sys.exit(f"  error: {err}")
+
+
+if __name__ == "__main__":
+    main()
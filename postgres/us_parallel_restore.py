@@ -0,0 +1,262 @@
+"""
+Parallel restore of a UnitedStorage dump.
+
+    us_parallel_restore.py --dump datalens_db.dump --jobs 8 [--defer-indexes] [--disable-triggers]
+
+The dump is read once and split by table into partitions of `--rows-per-partition` consecutive rows,
+i.e. key ranges in dump order, each written as a standalone COPY script (see us_copy.py). Partitions are
+then loaded over a pool of psql sessions level by level, so references are always satisfied:
+collections -> workbooks -> entries -> revisions/links; partitions of one level load concurrently.
+With `--defer-indexes` the secondary indexes of the tables are dropped before the load and created
+again, in parallel, after it; their definitions are kept in the work dir until they are restored.
+The other statements of the dump, `setval` calls of the sequences and the like, are applied in their order
+after the last level has loaded; INSERTs into tables other than the US ones are skipped.
+
+Connection settings come from the usual POSTGRES_* variables. To try it locally, build and run the
+image from postgres/dockerfile and point POSTGRES_HOST/POSTGRES_PORT at it.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import IO, Optional, Sequence
+
+import us_copy
+import us_db
+import us_dump
+
+# tables that reference themselves are never split, so parents always load before children
+UNSPLIT_TABLES = ("collections",)
+
+INDEXES_FILE = "deferred-indexes.json"
+OTHER_STATEMENTS_FILE = "other-statements.sql"
+
+# the other statements are applied in a single transaction of their own
+_TRANSACTION_CONTROL_RE = re.compile(r"^(?:BEGIN|COMMIT|END|START TRANSACTION)\b", re.IGNORECASE)
+
+
+@dataclass
+class Partition:
+    table: str
+    path: str
+    rows: int = 0
+
+
+@dataclass
+class TableProgress:
+    total_rows: int
+    loaded_rows: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+
+class PartitionSplitter:
+    """ Writes rows of every table into partition scripts of at most `rows_per_partition` rows """
+
+    def __init__(self, work_dir: str, rows_per_partition: int, mode: str, disable_triggers: bool):
+        self.work_dir = work_dir
+        self.rows_per_partition = rows_per_partition
+        self.mode = mode
+        self.disable_triggers = disable_triggers
+        self.partitions: dict[str, list[Partition]] = {table: [] for table in us_dump.US_TABLES}
+        self._open: dict[str, tuple[Partition, IO[str], us_copy.CopyWriter]] = {}
+
+    def add(self, row: us_dump.InsertRow) -> None:
+        current = self._open.get(row.table)
+        if current is None or (current[0].rows >= self.rows_per_partition and row.table not in UNSPLIT_TABLES):
+            if current is not None:
+                self._close(row.table)
+            current = self._open[row.table] = self._new_partition(row.table)
+        partition, _, writer = current
+        writer.write_row(row)
+        partition.rows += 1
+
+    def _new_partition(self, table: str) -> tuple[Partition, IO[str], us_copy.CopyWriter]:
+        partition = Partition(table, os.path.join(self.work_dir, f"{table}-{len(self.partitions[table]):05d}.sql"))
+        self.partitions[table].append(partition)
+        f = open(partition.path, "w", encoding="utf-8", newline="")
+        if self.disable_triggers:
+            f.write("SET session_replication_role = replica;\n")
+        return partition, f, us_copy.CopyWriter(f, self.mode)
+
+    def _close(self, table: str) -> None:
+        _, f, writer = self._open.pop(table)
+        writer.finish_block()
+        f.close()
+
+    def close(self) -> None:
+        for table in list(self._open):
+            self._close(table)
+
+
+class ProgressReporter:
+    def __init__(self, partitions: dict[str, list[Partition]]):
+        self.tables = {table: TableProgress(sum(p.rows for p in parts)) for table, parts in partitions.items() if parts}
+        self._lock = threading.Lock()
+
+    def start_table(self, table: str) -> None:
+        if table in self.tables:
+            self.tables[table].started_at = time.monotonic()
+
+    def partition_done(self, partition: Partition) -> None:
+        with self._lock:
+            progress = self.tables[partition.table]
+            progress.loaded_rows += partition.rows
+            elapsed = max(time.monotonic() - progress.started_at, 1e-6)
+            print(
+                f"  {partition.table}: {progress.loaded_rows}/{progress.total_rows} rows,"
+                f" {progress.loaded_rows / elapsed:.0f} rows/s",
+                file=sys.stderr,
+            )
+
+
+def run_script(path: str) -> None:
+    subprocess.run(
+        us_db.psql_command("--single-transaction", "--file", path),
+        check=True,
+        env=us_db.connection_env(),
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def load_partition(partition: Partition) -> Partition:
+    run_script(partition.path)
+    return partition
+
+
+_CREATE_INDEX_RE = re.compile(r"^(CREATE (?:UNIQUE )?INDEX)(?! IF NOT EXISTS)")
+
+
+def deferrable_indexes() -> list[dict[str, str]]:
+    """
+    Secondary indexes of the US tables: the ones neither backing a constraint nor unique, ON CONFLICT needs
+    those to skip duplicates
+    """
+
+    tables = ", ".join(us_dump.sql_literal(table) for table in us_dump.US_TABLES)
+    rows = us_db.copy_out_csv(
+        "SELECT i.relname, pg_get_indexdef(x.indexrelid) FROM pg_index x"
+        " JOIN pg_class i ON i.oid = x.indexrelid JOIN pg_class t ON t.oid = x.indrelid"
+        " JOIN pg_namespace n ON n.oid = t.relnamespace"
+        f" WHERE n.nspname = 'public' AND t.relname IN ({tables}) AND NOT x.indisunique"
+        " AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)"
+    )
+    return [dict(name=name, definition=definition) for name, definition in rows]
+
+
+def drop_indexes(indexes: list[dict[str, str]], work_dir: str) -> None:
+    with open(os.path.join(work_dir, INDEXES_FILE), "w") as f:
+        json.dump(indexes, f, indent=2)
+    us_db.run_sql("".join(f"DROP INDEX IF EXISTS public.{index['name']};\n" for index in indexes))
+
+
+def _if_not_exists(definition: str) -> str:
+    # an index created before an interrupted restore is kept when it is resumed
+    return _CREATE_INDEX_RE.sub(r"\1 IF NOT EXISTS", definition, count=1)
+
+
+def create_indexes(pool: concurrent.futures.Executor, indexes: list[dict[str, str]]) -> None:
+    started_at = time.monotonic()
+    futures = [pool.submit(us_db.run_sql, _if_not_exists(index["definition"]) + ";\n") for index in indexes]
+    for future in concurrent.futures.as_completed(futures):
+        future.result()
+    print(f"  recreated {len(indexes)} indexes in {time.monotonic() - started_at:.1f}s", file=sys.stderr)
+
+
+def restore(
+    dump_path: str,
+    work_dir: str,
+    jobs: int,
+    rows_per_partition: int,
+    mode: str,
+    disable_triggers: bool,
+    defer_indexes: bool,
+) -> None:
+    started_at = time.monotonic()
+    splitter = PartitionSplitter(work_dir, rows_per_partition, mode, disable_triggers)
+    skipped = other = 0
+    other_path = os.path.join(work_dir, OTHER_STATEMENTS_FILE)
+    with us_dump.open_dump(dump_path) as f, open(other_path, "w", encoding="utf-8", newline="") as other_out:
+        for item in us_dump.iter_dump(f):
+            if isinstance(item, us_dump.InsertRow):
+                splitter.add(item)
+            elif item.startswith("INSERT INTO "):
+                skipped += 1
+            elif not _TRANSACTION_CONTROL_RE.match(item.lstrip()):
+                other_out.write(item)
+                if item.strip() and not item.lstrip().startswith("--"):
+                    other += 1
+    splitter.close()
+    partitions = splitter.partitions
+    print(
+        f"  split {sum(len(parts) for parts in partitions.values())} partitions in {time.monotonic() - started_at:.1f}s"
+        + (f", skipped {skipped} rows of other tables" if skipped else ""),
+        file=sys.stderr,
+    )
+
+    progress = ProgressReporter(partitions)
+    indexes = deferrable_indexes() if defer_indexes else []
+    if indexes:
+        drop_indexes(indexes, work_dir)
+        print(f"  dropped {len(indexes)} indexes until the load is done", file=sys.stderr)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        try:
+            for level in us_dump.US_TABLES_LOAD_LEVELS:
+                for table in level:
+                    progress.start_table(table)
+                futures = [pool.submit(load_partition, partition) for table in level for partition in partitions[table]]
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        progress.partition_done(future.result())
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            if indexes:
+                create_indexes(pool, indexes)
+                os.remove(os.path.join(work_dir, INDEXES_FILE))
+
+    if other:
+        # sequences and settings are set once all rows are in, as in a sequential restore
+        run_script(other_path)
+        print(f"  applied {other} other statements of the dump", file=sys.stderr)
+
+    us_db.run_sql("".join(f"ANALYZE public.{table};\n" for table, parts in partitions.items() if parts))
+    print(f"  restore done in {time.monotonic() - started_at:.1f}s", file=sys.stderr)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Restore a UnitedStorage dump over several connections")
+    parser.add_argument("--dump", required=True, help="dump to restore: plain, gzipped or custom format")
+    parser.add_argument("--jobs", type=int, default=min(os.cpu_count() or 1, 8), help="number of concurrent psql sessions")
+    parser.add_argument("--rows-per-partition", type=int, default=50000)
+    parser.add_argument("--mode", choices=us_copy.COPY_MODES, default="staging", help="see us_copy.py")
+    parser.add_argument("--disable-triggers", action="store_true", help="load with session_replication_role = replica (superuser)")
+    parser.add_argument("--defer-indexes", action="store_true", help="drop secondary indexes for the load and create them after")
+    parser.add_argument("--work-dir", help="where to keep the partitions, a temporary dir by default")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="us-restore-")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        restore(args.dump, work_dir, args.jobs, args.rows_per_partition, args.mode, args.disable_triggers, args.defer_indexes)
+    except subprocess.CalledProcessError as err:
+        sys.exit(f"  error: psql exited with code {err.returncode} running {err.cmd[-1]}")
+    except ValueError as err:
+        sys.exit(f"  error: {err}")
+    finally:
+        if args.work_dir is None and not os.path.exists(os.path.join(work_dir, INDEXES_FILE)):
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Fills the `{{PLACEHOLDER}}` values of a demo data template in a single pass.
+
+    POSTGRES_HOST=... POSTGRES_PASSWORD=... us_render.py --template /init/demo-data/us-data.sql | psql ...
+
+Values are taken from the environment variables named after the placeholders, unset ones render empty.
+Every placeholder is quoted for the place it stands in:
+- `sql`: outside of a string literal, rendered as a string literal;
+- `sql_string`: inside a string literal, quotes are doubled;
+- `json_string`: inside a json string of a string literal, json escaped, then quotes are doubled;
+- `json_value`: a bare json value of a string literal, kept as is when it is a json number, a json string otherwise.
+
+The placeholder offsets and contexts of a template are found once and cached next to it in
+`<template>.placeholders.json` (or in the temp dir, when the template dir is read-only); the cache is
+rebuilt when the template size or mtime changes. Rendering maps the template and writes the text between
+the cached offsets as is, so its cost does not depend on the number of placeholders. `--template -` renders
+stdin, e.g. a variant from us_variant.py, scanning it on the fly instead.
+
+Scanning assumes standard_conforming_strings=on, as the dumps the templates are made of.
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+from typing import BinaryIO, Optional, Sequence
+
+_SCAN_RE = re.compile(rb"'|\{\{([A-Z0-9_]+)\}\}")
+_JSON_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+
+CONTEXTS = ("sql", "sql_string", "json_string", "json_value")
+
+Placeholder = tuple[int, int, str, str]  # start, end, name, context
+
+
+def scan_template(data: bytes) -> list[Placeholder]:
+    return _scan(data, False)[0]
+
+
+def _scan(data: bytes, in_string: bool) -> tuple[list[Placeholder], bool]:
+    """ Returns the placeholders of `data` and whether it ends inside a string literal """
+
+    placeholders: list[Placeholder] = []
+    for match in _SCAN_RE.finditer(data):
+        name = match.group(1)
+        if name is None:
+            in_string = not in_string  # a doubled quote toggles twice
+            continue
+        start, end = match.span()
+        if not in_string:
+            context = "sql"
+        elif data[start - 1:start] == b'"' and data[end:end + 1] == b'"':
+            context = "json_string"
+        elif data[max(start - 3, 0):start] == b'": ' or data[start - 1:start] == b"[":
+            context = "json_value"
+        else:
+            context = "sql_string"
+        placeholders.append((start, end, name.decode(), context))
+    return placeholders, in_string
+
+
+def _cache_paths(template: str) -> list[str]:
+    flat_name = os.path.abspath(template).strip(os.sep).replace(os.sep, "_")
+    return [f"{template}.placeholders.json", os.path.join(tempfile.gettempdir(), f"{flat_name}.placeholders.json")]
+
+
+def load_placeholders(template: str, data: bytes) -> list[Placeholder]:
+    """ Returns the placeholders of a template from the first valid cache, scans and caches them otherwise """
+
+    stat = os.stat(template)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    paths = _cache_paths(template)
+    for path in paths:
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if cache.get("stamp") == stamp:
+            return [tuple(placeholder) for placeholder in cache["placeholders"]]
+
+    placeholders = scan_template(data)
+    for path in paths:
+        try:
+            with open(path, "w") as f:
+                json.dump(dict(stamp=stamp, placeholders=placeholders), f)
+            break
+        except OSError:
+            continue
+    return placeholders
+
+
+def quote(value: str, context: str) -> str:
+    if context == "sql":
+        return "'" + value.replace("'", "''") + "'"
+    if context == "json_string":
+        value = json.dumps(value, ensure_ascii=False)[1:-1]
+    elif context == "json_value" and not _JSON_NUMBER_RE.fullmatch(value):
+        value = json.dumps(value, ensure_ascii=False)
+    return value.replace("'", "''")
+
+
+def _write_rendered(data, placeholders: list[Placeholder], values: dict[str, str], rendered: dict, out: BinaryIO) -> None:
+    pos = 0
+    for start, end, name, context in placeholders:
+        value = rendered.get((name, context))
+        if value is None:
+            value = rendered[(name, context)] = quote(values.get(name, ""), context).encode()
+        out.write(data[pos:start])
+        out.write(value)
+        pos = end
+    out.write(data[pos:])
+
+
+def render(template: str, values: dict[str, str], out: BinaryIO) -> None:
+    with open(template, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            placeholders = load_placeholders(template, data)
+            view = memoryview(data)
+            try:
+                _write_rendered(view, placeholders, values, {}, out)
+            finally:
+                view.release()
+
+
+def render_stream(stream: BinaryIO, values: dict[str, str], out: BinaryIO) -> None:
+    """ Renders a template that is not a file, e.g. a materialized variant, scanning it line by line """
+
+    rendered: dict = {}
+    in_string = False
+    for line in stream:
+        placeholders, in_string = _scan(line, in_string)
+        _write_rendered(line, placeholders, values, rendered, out)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Fill the {{PLACEHOLDER}} values of a demo data template")
+    parser.add_argument("--template", required=True, nargs="+", help=(
+        "template file, '-' to render stdin without caching; with --index, all the templates to index"
+    ))
+    parser.add_argument("--index", action="store_true", help="only build the placeholder caches of the templates")
+    args = parser.parse_args(argv)
+
+    if args.index:
+        for template in args.template:
+            with open(template, "rb") as f:
+                placeholders = load_placeholders(template, f.read())
+            print(f"  {template}: {len(placeholders)} placeholders", file=sys.stderr)
+        return
+
+    if len(args.template) != 1:
+        parser.error("a single --template is rendered at a time")
+    if args.template[0] == "-":
+        render_stream(sys.stdin.buffer, dict(os.environ), sys.stdout.buffer)
+    else:
+        render(args.template[0], dict(os.environ), sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    main()
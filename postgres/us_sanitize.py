@@ -0,0 +1,200 @@
+"""
+Turns a us-dump.sh dump into demo data, see scripts/update-demo-data.sh.
+
+    us-dump.sh | us_sanitize.py --transaction [--clear-deleted] [--clear-revisions] --output us-data.sql
+
+- connection secrets, hosts, ports, databases and users are replaced by the placeholders
+  seed-demo-data.sh fills in, line by line, the same way the former sed chain did;
+- `--clear-deleted` drops entries moved to the trash (`__trash/<entry_id>_...` keys) together with
+  their revisions and links;
+- `--clear-revisions` drops revisions that are neither the saved nor the published one of their entry,
+  for entries with more than one revision;
+- runs of blank lines between statements are collapsed into one.
+
+The clear flags need two passes over the dump, as the former grep loops did: the first one collects the
+trashed entry ids, the saved/published revision ids and the number of revisions per entry, whatever the
+order of the rows, the second one writes the output. A dump read from stdin or a pipe is spooled to a
+temporary file for that. Only ids and counts are kept in memory.
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+import us_dump
+
+# (literal the line must contain, pattern, replacement), applied in order to the first match of every line
+ANONYMIZE_RULES = tuple(
+    (literal, re.compile(pattern), replacement)
+    for literal, pattern, replacement in (
+        ('"cypher_text": "', r'"cypher_text": "[^"]+"', '"cypher_text": "{{POSTGRES_PASSWORD}}"'),
+        ('"host": "', r'"host": "[^"]+"', '"host": "{{POSTGRES_HOST}}"'),
+        ('"port": ', r'"port": [^,]+,', '"port": {{POSTGRES_PORT}},'),
+        ('"db_name": "', r'"db_name": "[^"]+"', '"db_name": "{{POSTGRES_DB}}"'),
+        ('"username": "', r'"username": "[^"]+"', '"username": "{{POSTGRES_USER}}"'),
+        (" 'OpenSource Demo', ", r" 'OpenSource Demo', ", " '{{DEMO_DATA_NAME}}', "),
+    )
+)
+
+_TRASH_KEY_RE = re.compile(r"__trash/(\d+)_")
+
+
+def anonymize(text: str) -> str:
+    if not any(literal in text for literal, _, _ in ANONYMIZE_RULES):
+        return text
+    lines = text.splitlines(keepends=True)
+    for idx, line in enumerate(lines):
+        for literal, pattern, replacement in ANONYMIZE_RULES:
+            if literal in line:
+                line = pattern.sub(replacement, line, count=1)
+        lines[idx] = line
+    return "".join(lines)
+
+
+class DumpSanitizer:
+    def __init__(self, clear_deleted: bool = False, clear_revisions: bool = False):
+        self.clear_deleted = clear_deleted
+        self.clear_revisions = clear_revisions
+        self.deleted_entries: set[str] = set()
+        self.actual_revisions: set[str] = set()
+        self.entries_with_revisions: set[str] = set()
+        self.revision_counts: Counter = Counter()
+        self.trash_rows: list[tuple[str, str]] = []  # (table, trashed key) of the rows left in the output
+
+    @property
+    def needs_scan(self) -> bool:
+        return self.clear_deleted or self.clear_revisions
+
+    def scan(self, items: Iterable[Union[str, us_dump.InsertRow]]) -> None:
+        """ First pass: collects the ids the clear flags decide on """
+
+        for item in items:
+            if not isinstance(item, us_dump.InsertRow):
+                continue
+            if item.table == "entries":
+                if self.clear_deleted:
+                    # the key names the trashed entry, which is not necessarily the row's own one
+                    match = _TRASH_KEY_RE.search(item.get("key") or "")
+                    if match is not None:
+                        self.deleted_entries.add(match.group(1))
+                if self.clear_revisions:
+                    revision_ids = {item.get("saved_id"), item.get("published_id")} - {None}
+                    if revision_ids:
+                        self.actual_revisions.update(revision_ids)
+                        self.entries_with_revisions.add(item.get("entry_id"))
+            elif item.table == "revisions" and self.clear_revisions:
+                self.revision_counts[item.get("entry_id")] += 1
+
+    def keep(self, row: us_dump.InsertRow) -> bool:
+        if row.table == "entries":
+            return self._keep_entry(row)
+        if row.table == "revisions":
+            return self._keep_revision(row)
+        if row.table == "links" and self.deleted_entries:
+            return row.get("from_id") not in self.deleted_entries and row.get("to_id") not in self.deleted_entries
+        return True
+
+    def _keep_entry(self, row: us_dump.InsertRow) -> bool:
+        entry_id = row.get("entry_id")
+        if entry_id in self.deleted_entries:
+            print(f"  clear deleted entry: {entry_id}", file=sys.stderr)
+            return False
+        return True
+
+    def _keep_revision(self, row: us_dump.InsertRow) -> bool:
+        entry_id = row.get("entry_id")
+        if entry_id in self.deleted_entries:
+            return False
+        if (
+            self.clear_revisions
+            and entry_id in self.entries_with_revisions
+            and self.revision_counts[entry_id] > 1
+            and row.get("rev_id") not in self.actual_revisions
+        ):
+            print(f"  clear revision id: {row.get('rev_id')}", file=sys.stderr)
+            return False
+        return True
+
+    def sanitize(self, items: Iterable[Union[str, us_dump.InsertRow]]) -> Iterator[str]:
+        """ Yields the chunks of the sanitized dump """
+
+        blank = False
+        for item in items:
+            if isinstance(item, us_dump.InsertRow):
+                if not self.keep(item):
+                    continue
+                statement = us_dump.render_insert(item)
+                trash_key = next((v for v in reversed(item.values) if isinstance(v, str) and "__trash/" in v), None)
+                if trash_key is not None:
+                    self.trash_rows.append((item.qualified_table(), trash_key))
+            else:
+                statement = item
+            if statement == "\n":
+                if blank:
+                    continue
+                blank = True
+            else:
+                blank = False
+            yield anonymize(statement)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Prepare a UnitedStorage dump for the demo data")
+    parser.add_argument("--dump", default="-", help="us-dump.sh dump, '-' for stdin")
+    parser.add_argument("--output", default="-", help="sanitized SQL, '-' for stdout")
+    parser.add_argument("--clear-deleted", action="store_true", help="drop entries in the trash with their revisions and links")
+    parser.add_argument("--clear-revisions", action="store_true", help="drop revisions that are neither saved nor published of entries with several revisions")
+    parser.add_argument("--transaction", action="store_true", help="wrap the output into BEGIN; ... COMMIT;")
+    args = parser.parse_args(argv)
+
+    sanitizer = DumpSanitizer(args.clear_deleted, args.clear_revisions)
+    try:
+        with _rereadable_dump(args.dump, sanitizer.needs_scan) as dump:
+            if sanitizer.needs_scan:
+                with us_dump.open_dump(dump) as fi:
+                    sanitizer.scan(us_dump.iter_dump(fi, us_dump.US_TABLES))
+            with us_dump.open_dump(dump) as fi, us_dump.open_output(args.output) as fo:
+                chunks = sanitizer.sanitize(us_dump.iter_dump(fi, us_dump.US_TABLES))
+                if args.transaction:
+                    chunks = _in_transaction(chunks)
+                for chunk in chunks:
+                    fo.write(chunk)
+    except ValueError as err:
+        sys.exit(f"  error: {err}")
+
+    if sanitizer.trash_rows:
+        print("", file=sys.stderr)
+        print("⚠️ WARNING: Found deleted entries:", file=sys.stderr)
+        for table, key in sanitizer.trash_rows:
+            print(f"  - {table} - {key}", file=sys.stderr)
+
+
+@contextmanager
+def _rereadable_dump(path: str, twice: bool) -> Iterator[str]:
+    """ Yields a path the dump can be opened at as many times as needed, stdin and pipes are spooled to a temporary file """
+
+    if not twice or os.path.isfile(path):
+        yield path
+        return
+    fd, spool = tempfile.mkstemp(suffix=".sql")
+    try:
+        with us_dump.open_dump(path) as fi, os.fdopen(fd, "w", encoding="utf-8", newline="") as fo:
+            shutil.copyfileobj(fi, fo)
+        yield spool
+    finally:
+        os.unlink(spool)
+
+
+def _in_transaction(chunks: Iterator[str]) -> Iterator[str]:
+    yield "BEGIN;\n"
+    yield from chunks
+    yield "COMMIT;\n"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Demo data variants stored as row-level deltas against the base demo data.
+
+    us_variant.py diff --base demo-data/us-data.sql --variant us-hc-data.sql --output demo-data/us-hc-data.delta.sql
+    us_variant.py materialize --base demo-data/us-data.sql --delta demo-data/us-hc-data.delta.sql | us_render.py --template - | psql ...
+
+A delta is a dump itself: an INSERT row replaces the base row with the same primary key (see
+`us_dump.PRIMARY_KEYS`) in place, or is added after the rows of its table when the base has no such key, and
+`DELETE FROM <table> WHERE <key> = <value> [AND ...];` drops a base row. Deltas are small and are kept in
+memory, the base is streamed.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+from typing import IO, Iterator, Optional, Sequence
+
+import us_dump
+
+Key = tuple[str, tuple[us_dump.SqlValue, ...]]
+
+_DELETE_RE = re.compile(r'DELETE FROM (?:"?(\w+)"?\.)?"?(\w+)"? WHERE (.+);\s*$', re.S)
+_CONDITION_RE = re.compile(r"(\w+) = ('(?:[^']|'')*'|[^\s;']+)")
+
+_LOAD_LEVEL = {table: idx for idx, level in enumerate(us_dump.US_TABLES_LOAD_LEVELS) for table in level}
+
+
+def render_delete(table: str, key: tuple[us_dump.SqlValue, ...]) -> str:
+    conditions = " AND ".join(
+        f"{column} = {us_dump.sql_literal(value)}" for column, value in zip(us_dump.PRIMARY_KEYS[table], key)
+    )
+    return f"DELETE FROM public.{table} WHERE {conditions};\n"
+
+
+def parse_delete(statement: str) -> Optional[Key]:
+    match = _DELETE_RE.match(statement)
+    if match is None or match.group(2) not in us_dump.PRIMARY_KEYS:
+        return None
+    table = match.group(2)
+    values = {}
+    for column, literal in _CONDITION_RE.findall(match.group(3)):
+        values[column] = literal[1:-1].replace("''", "'") if literal.startswith("'") else us_dump.Bare(literal)
+    try:
+        return table, tuple(values[column] for column in us_dump.PRIMARY_KEYS[table])
+    except KeyError:
+        raise ValueError(f"DELETE has to match the whole primary key of {table}: {statement.strip()}")
+
+
+class Delta:
+    def __init__(self):
+        self.rows: dict[Key, us_dump.InsertRow] = {}
+        self.deleted: set[Key] = set()
+
+    @classmethod
+    def load(cls, stream: IO[str]) -> "Delta":
+        delta = cls()
+        for item in us_dump.iter_dump(stream):
+            if isinstance(item, us_dump.InsertRow):
+                delta.rows[(item.table, item.key())] = item
+                continue
+            if not item.strip() or item.startswith("--"):
+                continue
+            key = parse_delete(item)
+            if key is None:
+                raise ValueError(f"Only rows and DELETE statements are allowed in a delta: {item[:200].strip()}")
+            delta.deleted.add(key)
+        return delta
+
+    def update(self, newer: "Delta") -> None:
+        """ Applies a newer delta on top of this one, its rows and deletions win """
+
+        for key, row in newer.rows.items():
+            self.rows[key] = row
+            self.deleted.discard(key)
+        for key in newer.deleted:
+            self.rows.pop(key, None)
+            self.deleted.add(key)
+
+    def __len__(self) -> int:
+        return len(self.rows) + len(self.deleted)
+
+
+def materialize(base: IO[str], delta: Delta) -> Iterator[str]:
+    """
+    Yields the base dump with the delta applied. The rows of a table the base has none of are added before
+    the first table of a later load level, so the output keeps the reference order whatever the delta adds.
+    """
+
+    added: dict[str, list[us_dump.InsertRow]] = {table: [] for table in us_dump.US_TABLES}
+    for (table, _), row in delta.rows.items():
+        added[table].append(row)
+    replaced = set()
+    flushed: set[str] = set()
+
+    def _flush(table: Optional[str]) -> Iterator[str]:
+        if table is None or table in flushed:
+            return
+        flushed.add(table)
+        for row in added.get(table, []):
+            if (row.table, row.key()) not in replaced:
+                yield us_dump.render_insert(row)
+
+    def _flush_levels(levels: Sequence[Sequence[str]]) -> Iterator[str]:
+        for level in levels:
+            for table in level:
+                yield from _flush(table)
+
+    current_table: Optional[str] = None
+    for item in us_dump.iter_dump(base):
+        if isinstance(item, us_dump.InsertRow):
+            if item.table != current_table:
+                yield from _flush(current_table)
+                # the tables it may reference go first, rows of the base or not
+                yield from _flush_levels(us_dump.US_TABLES_LOAD_LEVELS[:_LOAD_LEVEL[item.table]])
+                current_table = item.table
+            key = (item.table, item.key())
+            if key in delta.deleted:
+                continue
+            row = delta.rows.get(key)
+            if row is not None:
+                if item.table not in flushed:
+                    replaced.add(key)
+                    yield us_dump.render_insert(row)
+                # otherwise the table was flushed before this row of the base came, the delta row is out already
+            else:
+                yield us_dump.render_insert(item)
+            continue
+
+        if current_table is not None and item.strip() and not item.startswith("--"):
+            # the rows are over (COMMIT;), add the rows of the tables the base has none of before it
+            yield from _flush(current_table)
+            yield from _flush_levels(us_dump.US_TABLES_LOAD_LEVELS)
+            current_table = None
+        yield item
+
+    yield from _flush(current_table)
+    yield from _flush_levels(us_dump.US_TABLES_LOAD_LEVELS)
+
+
+def _row_digest(row: us_dump.InsertRow) -> bytes:
+    return hashlib.blake2b(us_dump.render_insert(row).encode(), digest_size=16).digest()
+
+
+def diff(base: IO[str], variant: IO[str]) -> Iterator[str]:
+    """ Yields the delta turning the base into the variant; only the keys and digests of the base are kept in memory """
+
+    base_rows: dict[Key, bytes] = {(row.table, row.key()): _row_digest(row) for row in us_dump.iter_rows(base)}
+    for row in us_dump.iter_rows(variant):
+        key = (row.table, row.key())
+        if base_rows.pop(key, None) != _row_digest(row):
+            yield us_dump.render_insert(row)
+    for table, key in base_rows:
+        yield render_delete(table, key)
+
+
+def _write(chunks: Iterator[str], out: IO[str]) -> int:
+    count = 0
+    for chunk in chunks:
+        out.write(chunk)
+        count += 1
+    return count
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Store demo data variants as deltas against the base demo data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = commands.add_parser("diff", help="write the delta turning the base into a variant")
+    diff_parser.add_argument("--base", required=True)
+    diff_parser.add_argument("--variant", required=True, help="full dump of the variant, '-' for stdin")
+    diff_parser.add_argument("--output", default="-", help="delta file, '-' for stdout")
+
+    materialize_parser = commands.add_parser("materialize", help="write the base with a delta applied")
+    materialize_parser.add_argument("--base", required=True)
+    materialize_parser.add_argument("--delta", required=True)
+    materialize_parser.add_argument("--output", default="-", help="variant dump, '-' for stdout")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "diff":
+            with us_dump.open_dump(args.base) as fb, us_dump.open_dump(args.variant) as fv, us_dump.open_output(args.output) as fo:
+                fo.write(f"-- rows that differ from {os.path.basename(args.base)}, see postgres/us_variant.py\n")
+                changes = _write(diff(fb, fv), fo)
+            print(f"  {changes} rows differ from the base", file=sys.stderr)
+        else:
+            with us_dump.open_dump(args.delta) as fd:
+                delta = Delta.load(fd)
+            print(f"  {len(delta)} rows differ from the base", file=sys.stderr)
+            with us_dump.open_dump(args.base) as fb, us_dump.open_output(args.output) as fo:
+                _write(materialize(fb, delta), fo)
+    except ValueError as err:
+        sys.exit(f"  error: {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,19 +14,132 @@ echo "  - entries"
 echo "  - revisions"
 echo "  - links"
 
-DUMP_FILE="${1}"
+INCREMENTAL_DIR=""
+COMPACT_DIR=""
+WORKBOOK_ARGS=()
+
+# parse args
+for _ in "$@"; do
+  case ${1} in
+  --incremental)
+    INCREMENTAL_DIR="${2}"
+    shift # past argument
+    shift # past value
+    ;;
+  --compact)
+    COMPACT_DIR="${2}"
+    shift # past argument
+    shift # past value
+    ;;
+  --workbook)
+    WORKBOOK_ARGS+=("--workbook" "${2}")
+    shift # past argument
+    shift # past value
+    ;;
+  -*)
+    echo "unknown arg: ${1}"
+    exit 1
+    ;;
+  *) ;;
+  esac
+done
+
+SCRIPT_DIR=$(dirname -- "$(readlink -f -- "$0")")
+# dump tools: ../postgres in the repository, ./postgres in a release made by pack-release.sh
+US_TOOLS_DIR="${SCRIPT_DIR}/../postgres"
+if [ ! -d "${US_TOOLS_DIR}" ]; then US_TOOLS_DIR="${SCRIPT_DIR}/postgres"; fi
+
+# row counts, section offsets and checksums, see postgres/us_manifest.py; optional, the dump is usable without it
+build_manifest() {
+  if ! command -v python3 >/dev/null 2>&1 || [ ! -f "${US_TOOLS_DIR}/us_manifest.py" ]; then
+    echo "  warning: python3 or [${US_TOOLS_DIR}/us_manifest.py] not found, no manifest for [${1}]" >&2
+    return 0
+  fi
+  if ! python3 "${US_TOOLS_DIR}/us_manifest.py" build --dump "${1}"; then
+    echo "  warning: could not build the manifest of [${1}]" >&2
+  fi
+}
+
+if [ -n "${COMPACT_DIR}" ]; then
+  # merge the newest full dump of the chain and the deltas after it into one full dump
+  CHAIN=()
+  for FILE in $(find "${COMPACT_DIR}" -maxdepth 1 -name 'us-*.sql' | sort); do
+    if [ "$(head -n 1 "${FILE}")" == "-- us-incremental full dump" ]; then
+      CHAIN=("${FILE}")
+    elif [ "${#CHAIN[@]}" != "0" ]; then
+      CHAIN+=("${FILE}")
+    fi
+  done
+
+  if [ "${#CHAIN[@]}" -lt "2" ]; then
+    echo "  nothing to compact in [${COMPACT_DIR}]"
+    exit 0
+  fi
+
+  MERGE_ARGS=("--base" "${CHAIN[0]}")
+  for FILE in "${CHAIN[@]:1}"; do
+    MERGE_ARGS+=("--delta" "${FILE}")
+  done
+
+  # the merged dump takes the name of the newest delta, the next dumps go on from its state
+  LAST_FILE="${CHAIN[${#CHAIN[@]} - 1]}"
+  python3 "${US_TOOLS_DIR}/us_incremental.py" merge "${MERGE_ARGS[@]}" --output "${LAST_FILE}.merged"
+  mkdir -p "${COMPACT_DIR}/compacted"
+  for FILE in "${CHAIN[@]}"; do
+    mv "${FILE}" "${COMPACT_DIR}/compacted/"
+    if [ -f "${FILE}.manifest.json" ]; then mv "${FILE}.manifest.json" "${COMPACT_DIR}/compacted/"; fi
+    if [ -f "${FILE}.state" ]; then mv "${FILE}.state" "${COMPACT_DIR}/compacted/"; fi
+  done
+  mv "${LAST_FILE}.merged" "${LAST_FILE}"
+  tail -n 1 "${LAST_FILE}" >"${LAST_FILE}.state"
+  build_manifest "${LAST_FILE}"
+
+  echo ""
+  echo "Compact done, ${#CHAIN[@]} dumps merged into [${LAST_FILE}], merged ones moved to [${COMPACT_DIR}/compacted]"
+  exit 0
+fi
+
+if [ -n "${INCREMENTAL_DIR}" ]; then
+  mkdir -p "${INCREMENTAL_DIR}"
+  PREVIOUS_FILE="$(find "${INCREMENTAL_DIR}" -maxdepth 1 -name 'us-*.sql' | sort | tail -n 1)"
+  DUMP_FILE="${INCREMENTAL_DIR}/us-$(date -u +%Y%m%d-%H%M%S).sql"
+  DUMP_COMMAND=("python" "/init/us_incremental.py" "dump")
+
+  if [ -n "${PREVIOUS_FILE}" ]; then
+    echo "  changes since [${PREVIOUS_FILE}]"
+    # only the state of the previous dump, its last line with the watermarks and keys to compare with,
+    # is sent to stdin, kept next to the dump as <dump>.state
+    if [ ! -f "${PREVIOUS_FILE}.state" ]; then
+      tail -n 1 "${PREVIOUS_FILE}" >"${PREVIOUS_FILE}.state"
+    fi
+    PREVIOUS_FILE="${PREVIOUS_FILE}.state"
+    DUMP_COMMAND+=("--previous" "-")
+  else
+    echo "  no previous dump in [${INCREMENTAL_DIR}], full dump"
+    PREVIOUS_FILE="/dev/null"
+  fi
+elif [ "${#WORKBOOK_ARGS[@]}" != "0" ]; then
+  # the workbooks with their linked entries, revisions and collections as a plain dump
+  DUMP_FILE="${1:-./datalens_workbooks.sql}"
+  DUMP_COMMAND=("python" "/init/us_export.py" "export" "${WORKBOOK_ARGS[@]}")
+  PREVIOUS_FILE="/dev/null"
+else
+  DUMP_FILE="${1}"
+  DUMP_COMMAND=("/init/us-dump.sh")
+  PREVIOUS_FILE="/dev/null"
+fi
 
 if [ -z "${DUMP_FILE}" ]; then
   DUMP_FILE="./datalens_db.dump"
 fi
 
 if docker compose ps --services postgres | grep -q -s postgres; then
-  docker --log-level error compose exec -T postgres /init/us-dump.sh >"${DUMP_FILE}"
+  docker --log-level error compose exec -T postgres "${DUMP_COMMAND[@]}" <"${PREVIOUS_FILE}" >"${DUMP_FILE}"
 else
   echo ""
   echo "Running dump command for external PostgreSQL..."
   echo ""
-  docker --log-level error compose run -T --rm --entrypoint /init/us-dump.sh postgres >"${DUMP_FILE}"
+  docker --log-level error compose run -T --rm --entrypoint "${DUMP_COMMAND[0]}" postgres "${DUMP_COMMAND[@]:1}" <"${PREVIOUS_FILE}" >"${DUMP_FILE}"
 fi
 
 EXIT="$?"
@@ -37,7 +150,13 @@ if [ "${EXIT}" != "0" ]; then
   echo "Dump error, exit..."
   exit "${EXIT}"
 else
+  build_manifest "${DUMP_FILE}"
+  if [ -n "${INCREMENTAL_DIR}" ]; then
+    tail -n 1 "${DUMP_FILE}" >"${DUMP_FILE}.state"
+  fi
+
   echo ""
   echo "Dump done, saved at [${DUMP_FILE}]"
+  if [ -f "${DUMP_FILE}.manifest.json" ]; then echo "Manifest at [${DUMP_FILE}.manifest.json]"; fi
   exit 0
 fi
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Bundle of docker images for offline installs with every layer stored once, see save-images.sh --bundle.
+
+    images-bundle.py save --bundle datalens-images --platform linux/amd64 ghcr.io/datalens-tech/datalens-us:0.1.0 ...
+    images-bundle.py load --bundle datalens-images [--image ghcr.io/datalens-tech/datalens-us:0.1.0 ...]
+    images-bundle.py add --bundle datalens-images --name my-image:1.0 --tar my-image.tar
+    images-bundle.py extract --bundle datalens-images --image my-image:1.0 --output my-image.tar
+
+`save` pulls the images in parallel, then reads the `docker save` output of each of them as a stream. Every
+regular file of it (layers, image configs, OCI manifests) is stored once in `blobs/` under the sha256 of its
+content, whatever images it is shared by: OCI blobs (`blobs/sha256/<digest>`) are skipped without reading
+when they are already stored, other files are hashed first. New blobs are compressed concurrently, with
+the zstd command (multi-threaded) when there is one, with gzip otherwise; a zstd bundle needs the zstd
+command wherever it is used, release bundles (pack-release.sh --bundle) are made with gzip.
+
+`bundle.json` lists the blobs and, per image, its id and the members of its `docker save` tar in order.
+`load` rebuilds the tar of every selected image from the blobs and pipes it into `docker load`, skipping
+the images docker already has with the same id, so an interrupted load is resumed by running it again.
+`save` is resumable the same way: images already in the bundle with the same id are not saved again.
+
+`add` and `extract` do the same without docker, on tar files: the bundle can be built and checked offline,
+e.g. with synthetic layer tarballs.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from dataclasses import asdict, dataclass
+from typing import IO, Iterator, Optional, Sequence
+
+BUNDLE_VERSION = 1
+BUNDLE_FILE = "bundle.json"
+BLOBS_DIR = "blobs"
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+_OCI_BLOB_RE = re.compile(r"(?:^|/)blobs/sha256/([0-9a-f]{64})$")
+
+COMPRESSION_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+
+@dataclass
+class Member:
+    """ A member of a `docker save` tar, regular files point at their blob by digest """
+
+    name: str
+    type: str  # file, dir, symlink or link
+    mode: int
+    mtime: int
+    size: int = 0
+    digest: Optional[str] = None
+    linkname: Optional[str] = None
+
+    @classmethod
+    def from_tarinfo(cls, info: tarfile.TarInfo, digest: Optional[str] = None) -> "Member":
+        if info.isdir():
+            member_type = "dir"
+        elif info.issym():
+            member_type = "symlink"
+        elif info.islnk():
+            member_type = "link"
+        else:
+            member_type = "file"
+        return cls(
+            name=info.name,
+            type=member_type,
+            mode=info.mode,
+            mtime=int(info.mtime),
+            size=info.size if member_type == "file" else 0,
+            digest=digest,
+            linkname=info.linkname or None,
+        )
+
+    def to_tarinfo(self) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(self.name)
+        info.type = {"dir": tarfile.DIRTYPE, "symlink": tarfile.SYMTYPE, "link": tarfile.LNKTYPE}.get(self.type, tarfile.REGTYPE)
+        info.mode = self.mode
+        info.mtime = self.mtime
+        info.size = self.size
+        info.linkname = self.linkname or ""
+        return info
+
+
+def default_compression() -> str:
+    return "zstd" if shutil.which("zstd") else "gzip"
+
+
+def compress_file(source: str, target: str, compression: str, threads: int) -> None:
+    if compression == "zstd":
+        subprocess.run(["zstd", "--quiet", "--force", f"-T{threads}", "-3", source, "-o", target], check=True)
+        return
+    with open(source, "rb") as fi, gzip.open(target, "wb", compresslevel=1) as fo:
+        shutil.copyfileobj(fi, fo, COPY_BUFFER_SIZE)
+
+
+@contextlib.contextmanager
+def open_blob(path: str, compression: str) -> Iterator[IO[bytes]]:
+    if compression == "gzip":
+        with gzip.open(path, "rb") as f:
+            yield f
+        return
+    zstd = subprocess.Popen(["zstd", "--quiet", "--decompress", "--stdout", path], stdout=subprocess.PIPE)
+    try:
+        yield zstd.stdout
+    finally:
+        zstd.stdout.close()
+        if zstd.wait() != 0:
+            raise RuntimeError(f"zstd exited with code {zstd.returncode} on {path}")
+
+
+class Bundle:
+    def __init__(self, path: str, compression: Optional[str] = None, jobs: int = 4):
+        self.path = path
+        self.blobs: dict[str, dict] = {}
+        self.images: dict[str, dict] = {}
+        self.compression = compression or default_compression()
+
+        manifest_path = os.path.join(path, BUNDLE_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") != BUNDLE_VERSION:
+                raise ValueError(f"{manifest_path}: unsupported bundle version {manifest.get('version')}")
+            self.blobs = manifest["blobs"]
+            self.images = manifest["images"]
+            # blobs of a bundle share one compression
+            if self.blobs:
+                self.compression = manifest["compression"]
+        if self.compression == "zstd" and not shutil.which("zstd"):
+            raise ValueError(f"{path} is compressed with zstd, install the zstd command to use it")
+
+        self.jobs = jobs
+        self._lock = threading.Lock()
+        self._claimed: set[str] = set(self.blobs)
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._futures: list[concurrent.futures.Future] = []
+
+    def __enter__(self) -> "Bundle":
+        os.makedirs(os.path.join(self.path, BLOBS_DIR), exist_ok=True)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            self.wait()
+        finally:
+            self._pool.shutdown()
+            self._pool = None
+            self.save()
+
+    def has_image(self, name: str, image_id: Optional[str]) -> bool:
+        image = self.images.get(name)
+        return (
+            image is not None
+            and image_id is not None
+            and image["id"] == image_id
+            and all(member["digest"] in self.blobs for member in image["members"] if member["digest"])
+        )
+
+    def _claim(self, digest: str) -> bool:
+        """ Whether the caller is the one to store the blob """
+
+        with self._lock:
+            if digest in self._claimed:
+                return False
+            self._claimed.add(digest)
+            return True
+
+    def add_image(self, name: str, image_id: Optional[str], stream: IO[bytes]) -> int:
+        """ Reads the `docker save` tar of an image, returns the number of new blobs """
+
+        members: list[Member] = []
+        new_blobs = 0
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for info in tar:
+                if not info.isreg():
+                    members.append(Member.from_tarinfo(info))
+                    continue
+                match = _OCI_BLOB_RE.search(info.name)
+                if match is not None and not self._claim(f"sha256:{match.group(1)}"):
+                    # already stored or being stored: the stream moves past its content unread
+                    members.append(Member.from_tarinfo(info, f"sha256:{match.group(1)}"))
+                    continue
+                digest, tmp_path = self._spool(tar.extractfile(info))
+                if match is not None and digest != f"sha256:{match.group(1)}":
+                    os.remove(tmp_path)
+                    raise ValueError(f"{info.name} of {name} does not match its digest, the tar is corrupted")
+                if match is not None or self._claim(digest):
+                    self._futures.append(self._pool.submit(self._store, digest, info.size, tmp_path))
+                    new_blobs += 1
+                else:
+                    os.remove(tmp_path)
+                members.append(Member.from_tarinfo(info, digest))
+
+        with self._lock:
+            self.images[name] = dict(id=image_id, members=[asdict(member) for member in members])
+        return new_blobs
+
+    def _spool(self, content: IO[bytes]) -> tuple[str, str]:
+        sha256 = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=os.path.join(self.path, BLOBS_DIR), suffix=".tmp", delete=False) as f:
+            while chunk := content.read(COPY_BUFFER_SIZE):
+                sha256.update(chunk)
+                f.write(chunk)
+        return f"sha256:{sha256.hexdigest()}", f.name
+
+    def _store(self, digest: str, size: int, tmp_path: str) -> None:
+        blob_file = os.path.join(BLOBS_DIR, digest.split(":")[1] + COMPRESSION_SUFFIXES[self.compression])
+        target = os.path.join(self.path, blob_file)
+        try:
+            compress_file(tmp_path, f"{target}.tmp", self.compression, max(1, (os.cpu_count() or 1) // self.jobs))
+            os.replace(f"{target}.tmp", target)
+        finally:
+            os.remove(tmp_path)
+        with self._lock:
+            self.blobs[digest] = dict(file=blob_file, size=size, compressed_size=os.path.getsize(target))
+
+    def wait(self) -> None:
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def save(self) -> None:
+        """ Writes bundle.json with the images whose blobs are all stored """
+
+        with self._lock:
+            images = {
+                name: image for name, image in self.images.items()
+                if all(member["digest"] in self.blobs for member in image["members"] if member["digest"])
+            }
+            manifest = dict(version=BUNDLE_VERSION, compression=self.compression, blobs=self.blobs, images=images)
+        manifest_path = os.path.join(self.path, BUNDLE_FILE)
+        with open(f"{manifest_path}.tmp", "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def write_image(self, name: str, out: IO[bytes]) -> None:
+        """ Writes the `docker save` tar of an image """
+
+        image = self.images.get(name)
+        if image is None:
+            raise ValueError(f"image {name} is not in the bundle, images: {', '.join(sorted(self.images))}")
+        with tarfile.open(fileobj=out, mode="w|") as tar:
+            for member in map(lambda fields: Member(**fields), image["members"]):
+                if member.type != "file":
+                    tar.addfile(member.to_tarinfo())
+                    continue
+                with open_blob(os.path.join(self.path, self.blobs[member.digest]["file"]), self.compression) as f:
+                    tar.addfile(member.to_tarinfo(), f)
+
+
+def docker_image_id(image: str) -> Optional[str]:
+    result = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Id}}", image], capture_output=True, text=True
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def pull(image: str, platform: str) -> str:
+    result = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Os}}/{{.Architecture}}", image], capture_output=True, text=True
+    )
+    if result.returncode == 0 and result.stdout.strip() == platform:
+        return f"  pull not needed: {image}"
+    subprocess.run(["docker", "pull", "--platform", platform, "--quiet", image], check=True, stdout=subprocess.DEVNULL)
+    return f"  pull finish: {image}"
+
+
+def save_image(bundle: Bundle, image: str) -> str:
+    image_id = docker_image_id(image)
+    if bundle.has_image(image, image_id):
+        return f"  save not needed: {image}"
+    docker = subprocess.Popen(["docker", "save", image], stdout=subprocess.PIPE)
+    try:
+        new_blobs = bundle.add_image(image, image_id, docker.stdout)
+    finally:
+        docker.stdout.close()
+        if docker.wait() != 0:
+            raise RuntimeError(f"docker save {image} exited with code {docker.returncode}")
+    return f"  save finish: {image}, {new_blobs} new blobs"
+
+
+def load_image(bundle: Bundle, image: str) -> str:
+    image_id = bundle.images[image]["id"]
+    if image_id is not None and docker_image_id(image) == image_id:
+        return f"  load not needed: {image}"
+    docker = subprocess.Popen(["docker", "load", "--quiet"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    try:
+        bundle.write_image(image, docker.stdin)
+    finally:
+        docker.stdin.close()
+        if docker.wait() != 0:
+            raise RuntimeError(f"docker load of {image} exited with code {docker.returncode}")
+    return f"  load finish: {image}"
+
+
+def _run_all(function, items: Sequence, jobs: int) -> None:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        for message in pool.map(function, items):
+            print(message, file=sys.stderr)
+
+
+def _sizes(bundle: Bundle) -> str:
+    size = sum(blob["size"] for blob in bundle.blobs.values())
+    compressed_size = sum(blob["compressed_size"] for blob in bundle.blobs.values())
+    return f"{len(bundle.blobs)} blobs, {size / 2**20:.0f} MiB, {compressed_size / 2**20:.0f} MiB {bundle.compression}"
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Bundle docker images with every layer stored once")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    save_parser = commands.add_parser("save", help="pull images and add them to the bundle")
+    save_parser.add_argument("images", nargs="+")
+    save_parser.add_argument("--platform", required=True, help="e.g. linux/amd64")
+    save_parser.add_argument("--compression", choices=tuple(COMPRESSION_SUFFIXES), help="zstd when available by default")
+
+    add_parser = commands.add_parser("add", help="add a `docker save` tar to the bundle")
+    add_parser.add_argument("--name", required=True, help="image name the tar is loaded as")
+    add_parser.add_argument("--id", help="image id, for the resume checks")
+    add_parser.add_argument("--tar", required=True, help="'-' for stdin")
+    add_parser.add_argument("--compression", choices=tuple(COMPRESSION_SUFFIXES), help="zstd when available by default")
+
+    load_parser = commands.add_parser("load", help="load images of the bundle into docker")
+    load_parser.add_argument("--image", action="append", help="image to load, can be repeated, all by default")
+
+    extract_parser = commands.add_parser("extract", help="write the `docker save` tar of an image of the bundle")
+    extract_parser.add_argument("--image", required=True)
+    extract_parser.add_argument("--output", default="-", help="'-' for stdout")
+
+    for command_parser in (save_parser, add_parser, load_parser, extract_parser):
+        command_parser.add_argument("--bundle", required=True, help="bundle directory")
+        command_parser.add_argument("--jobs", type=int, default=4, help="concurrent pulls, saves and compressions")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "save":
+            print("Pulling images...", file=sys.stderr)
+            _run_all(lambda image: pull(image, args.platform), args.images, args.jobs)
+            print("Saving images...", file=sys.stderr)
+            with Bundle(args.bundle, args.compression, args.jobs) as bundle:
+                _run_all(lambda image: save_image(bundle, image), args.images, args.jobs)
+            print(f"  {args.bundle}: {_sizes(bundle)}", file=sys.stderr)
+        elif args.command == "add":
+            with Bundle(args.bundle, args.compression, args.jobs) as bundle:
+                with contextlib.ExitStack() as stack:
+                    stream = sys.stdin.buffer if args.tar == "-" else stack.enter_context(open(args.tar, "rb"))
+                    new_blobs = bundle.add_image(args.name, args.id, stream)
+            print(f"  {args.name}: {new_blobs} new blobs, {args.bundle}: {_sizes(bundle)}", file=sys.stderr)
+        elif args.command == "load":
+            bundle = Bundle(args.bundle)
+            images = args.image or sorted(bundle.images)
+            for image in images:
+                if image not in bundle.images:
+                    raise ValueError(f"image {image} is not in the bundle, images: {', '.join(sorted(bundle.images))}")
+            # docker load is the bottleneck and does not get faster with concurrent loads
+            for image in images:
+                print(load_image(bundle, image), file=sys.stderr)
+        else:
+            bundle = Bundle(args.bundle)
+            if args.output == "-":
+                bundle.write_image(args.image, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            else:
+                with open(args.output, "wb") as out:
+                    bundle.write_image(args.image, out)
+    except (OSError, ValueError, RuntimeError, subprocess.CalledProcessError) as err:
+        sys.exit(f"  error: {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,11 @@ set -eo pipefail
 # [-x] - all executed commands are printed to the terminal [not secure]
 # [-o pipefail] - if any command in a pipeline fails, that return code will be used as the return code of the whole pipeline
 
+SCRIPT_DIR=$(dirname -- "$(readlink -f -- "$0")")
+
 IS_SPLIT="false"
+BUNDLE_DIR="./datalens-images"
+IMAGE_ARGS=()
 
 # parse args
 for _ in "$@"; do
@@ -15,6 +19,16 @@ for _ in "$@"; do
     IS_SPLIT="true"
     shift # past argument with no value
     ;;
+  --bundle)
+    BUNDLE_DIR="${2}"
+    shift # past argument
+    shift # past value
+    ;;
+  --image)
+    IMAGE_ARGS+=("--image" "${2}")
+    shift # past argument
+    shift # past value
+    ;;
   -*)
     echo "unknown arg: ${1}"
     exit 1
@@ -23,6 +37,23 @@ for _ in "$@"; do
   esac
 done
 
+if [ -f "${BUNDLE_DIR}/bundle.json" ]; then
+  echo ""
+  echo "Load docker images from [${BUNDLE_DIR}] bundle..."
+  if grep -q '"compression": "zstd"' "${BUNDLE_DIR}/bundle.json" && ! command -v zstd >/dev/null; then
+    echo "The bundle is compressed with zstd, install the zstd command to load it, exit..."
+    exit 1
+  fi
+  # images docker already has are skipped, run again to resume an interrupted load
+  python3 "${SCRIPT_DIR}/images-bundle.py" load --bundle "${BUNDLE_DIR}" "${IMAGE_ARGS[@]}"
+  exit 0
+fi
+
+if [ "${#IMAGE_ARGS[@]}" != "0" ]; then
+  echo "Selective load needs an images bundle, [${BUNDLE_DIR}/bundle.json] not found, exit..."
+  exit 1
+fi
+
 if [ "${IS_SPLIT}" == "true" ]; then
   echo "Load docker images from separated archives..."
 
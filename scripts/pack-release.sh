@@ -14,6 +14,7 @@ export COPYFILE_DISABLE=1
 IMAGE_PLATFORM="linux/amd64"
 README_URL=""
 SPLIT_MODE="false"
+BUNDLE_MODE="false"
 
 # parse args
 for _ in "$@"; do
@@ -32,6 +33,10 @@ for _ in "$@"; do
     SPLIT_MODE="true"
     shift # past argument with no value
     ;;
+  --bundle)
+    BUNDLE_MODE="true"
+    shift # past argument with no value
+    ;;
   -*)
     echo "unknown arg: ${1}"
     exit 1
@@ -54,7 +59,11 @@ rm -rf "${OUT_PATH}/datalens-${VERSION}"
 rm -rf "${OUT_PATH}/${FILE_RELEASE}.tmp"
 mkdir -p "${OUT_PATH}/datalens-${VERSION}"
 
-if [ "${SPLIT_MODE}" == "true" ]; then
+if [ "${BUNDLE_MODE}" == "true" ]; then
+  echo "  bundle mode: true"
+  # gzip: the install host may have no zstd command to decompress the blobs
+  "${SCRIPT_DIR}/save-images.sh" --platform "${IMAGE_PLATFORM}" --force --bundle --bundle-compression gzip --target-dir "${OUT_PATH}/datalens-${VERSION}"
+elif [ "${SPLIT_MODE}" == "true" ]; then
   echo "  split mode: true"
   "${SCRIPT_DIR}/save-images.sh" --platform "${IMAGE_PLATFORM}" --force --split --target-dir "${OUT_PATH}/datalens-${VERSION}"
 else
@@ -73,8 +82,13 @@ cp "${SCRIPT_DIR}/../README.md" "${OUT_PATH}/datalens-${VERSION}/README.md"
 cp "${SCRIPT_DIR}/../docker-compose.yaml" "${OUT_PATH}/datalens-${VERSION}/docker-compose.yaml"
 cp "${SCRIPT_DIR}/save-images.sh" "${OUT_PATH}/datalens-${VERSION}/save-images.sh"
 cp "${SCRIPT_DIR}/load-images.sh" "${OUT_PATH}/datalens-${VERSION}/load-images.sh"
+cp "${SCRIPT_DIR}/images-bundle.py" "${OUT_PATH}/datalens-${VERSION}/images-bundle.py"
 cp "${SCRIPT_DIR}/dump-entries.sh" "${OUT_PATH}/datalens-${VERSION}/dump-entries.sh"
 cp "${SCRIPT_DIR}/restore-entries.sh" "${OUT_PATH}/datalens-${VERSION}/restore-entries.sh"
+mkdir -p "${OUT_PATH}/datalens-${VERSION}/postgres"
+for TOOL in us_db.py us_diff.py us_dump.py us_incremental.py us_manifest.py us_variant.py; do
+  cp "${SCRIPT_DIR}/../postgres/${TOOL}" "${OUT_PATH}/datalens-${VERSION}/postgres/${TOOL}"
+done
 cp "${SCRIPT_DIR}/../init.sh" "${OUT_PATH}/datalens-${VERSION}/init.sh"
 
 # shellcheck disable=SC2236
@@ -9,7 +9,13 @@ set -eo pipefail
 IS_RESTORE_DEMO="false"
 IS_FIX_CONNECTIONS_DISABLED="false"
 IS_FIX_CRYPTO_KEY_DISABLED="false"
+IS_ROTATE_CRYPTO_KEY="false"
+IS_COPY="false"
+IS_DEFER_INDEXES="false"
+RESTORE_JOBS=""
 RESTORE_FILE="/tmp/datalens_db.dump"
+TABLE_ARGS=()
+WORKBOOK_ARGS=()
 
 # parse args
 for _ in "$@"; do
@@ -22,10 +28,37 @@ for _ in "$@"; do
     IS_FIX_CRYPTO_KEY_DISABLED="true"
     shift # past argument with no value
     ;;
+  --rotate-crypto-key)
+    IS_ROTATE_CRYPTO_KEY="true"
+    shift # past argument with no value
+    ;;
+  --copy)
+    IS_COPY="true"
+    shift # past argument with no value
+    ;;
+  --jobs)
+    RESTORE_JOBS="${2}"
+    shift # past argument
+    shift # past value
+    ;;
+  --defer-indexes)
+    IS_DEFER_INDEXES="true"
+    shift # past argument with no value
+    ;;
   --demo)
     IS_RESTORE_DEMO="true"
     shift # past argument with no value
     ;;
+  --table)
+    TABLE_ARGS+=("--table" "${2}")
+    shift # past argument
+    shift # past value
+    ;;
+  --workbook)
+    WORKBOOK_ARGS+=("--workbook" "${2}")
+    shift # past argument
+    shift # past value
+    ;;
   -*)
     echo "unknown arg: ${1}"
     exit 1
@@ -49,27 +82,68 @@ else
   exit 1
 fi
 
+SCRIPT_DIR=$(dirname -- "$(readlink -f -- "$0")")
+# dump tools: ../postgres in the repository, ./postgres in a release made by pack-release.sh
+US_TOOLS_DIR="${SCRIPT_DIR}/../postgres"
+if [ ! -d "${US_TOOLS_DIR}" ]; then US_TOOLS_DIR="${SCRIPT_DIR}/postgres"; fi
+MANIFEST_FILE="${RESTORE_FILE}.manifest.json"
+
+if [ -f "${MANIFEST_FILE}" ]; then
+  echo "Verify dump against [${MANIFEST_FILE}]..."
+  VERIFY_ARGS=()
+  if [ -n "${RESTORE_JOBS}" ]; then
+    VERIFY_ARGS+=("--jobs" "${RESTORE_JOBS}")
+  fi
+  python3 "${US_TOOLS_DIR}/us_manifest.py" verify --dump "${RESTORE_FILE}" "${VERIFY_ARGS[@]}"
+fi
+
+if [ "${#TABLE_ARGS[@]}" != "0" ] || [ "${#WORKBOOK_ARGS[@]}" != "0" ]; then
+  if [ ! -f "${MANIFEST_FILE}" ]; then
+    echo "Manifest [${MANIFEST_FILE}] not found, --table and --workbook need a plain dump made by dump-entries.sh, exit..."
+    exit 1
+  fi
+  # only the indexed sections are read, the restore gets a plain dump of the selected rows
+  PART_FILE="$(mktemp)"
+  trap 'rm -f "${PART_FILE}"' EXIT
+  python3 "${US_TOOLS_DIR}/us_manifest.py" extract --dump "${RESTORE_FILE}" "${TABLE_ARGS[@]}" "${WORKBOOK_ARGS[@]}" --output "${PART_FILE}"
+  RESTORE_FILE="${PART_FILE}"
+fi
+
 echo ""
 
 RESTORE_ARGS=""
-if [ "${IS_FIX_CONNECTIONS_DISABLED}" != "true" ]; then
-  RESTORE_ARGS="${RESTORE_ARGS} --fix-connections"
-fi
-if [ "${IS_FIX_CRYPTO_KEY_DISABLED}" != "true" ]; then
-  RESTORE_ARGS="${RESTORE_ARGS} --fix-crypto-key"
+if [ "${IS_ROTATE_CRYPTO_KEY}" == "true" ]; then
+  # keeps connections secrets: re-encrypts them from CONTROL_API_CRYPTO_KEY_OLD keys to the current key
+  RESTORE_ARGS="${RESTORE_ARGS} --rotate-crypto-key"
+else
+  if [ "${IS_FIX_CONNECTIONS_DISABLED}" != "true" ]; then
+    RESTORE_ARGS="${RESTORE_ARGS} --fix-connections"
+  fi
+  if [ "${IS_FIX_CRYPTO_KEY_DISABLED}" != "true" ]; then
+    RESTORE_ARGS="${RESTORE_ARGS} --fix-crypto-key"
+  fi
 fi
 if [ "${IS_RESTORE_DEMO}" == "true" ]; then
   RESTORE_ARGS="${RESTORE_ARGS} --demo"
 fi
+if [ "${IS_COPY}" == "true" ]; then
+  RESTORE_ARGS="${RESTORE_ARGS} --copy"
+fi
+if [ -n "${RESTORE_JOBS}" ]; then
+  RESTORE_ARGS="${RESTORE_ARGS} --jobs ${RESTORE_JOBS}"
+fi
+if [ "${IS_DEFER_INDEXES}" == "true" ]; then
+  RESTORE_ARGS="${RESTORE_ARGS} --defer-indexes"
+fi
 
 if docker compose ps --services postgres | grep -q -s postgres; then
   docker --log-level error compose cp "${RESTORE_FILE}" "postgres:/tmp/datalens_db.dump"
-  docker --log-level error compose exec postgres /init/us-restore.sh --root-user ${RESTORE_ARGS}
+  docker --log-level error compose exec --env "CONTROL_API_CRYPTO_KEY_OLD=${CONTROL_API_CRYPTO_KEY_OLD}" postgres /init/us-restore.sh --root-user ${RESTORE_ARGS}
 else
   echo "Running restore command for external PostgreSQL..."
   echo ""
   RESTORE_FILE=$(realpath "${RESTORE_FILE}")
-  docker --log-level error compose run --volume "${RESTORE_FILE}:/tmp/datalens_db.dump" --rm --entrypoint /init/us-restore.sh postgres --root-user ${RESTORE_ARGS}
+  docker --log-level error compose run --env "CONTROL_API_CRYPTO_KEY_OLD=${CONTROL_API_CRYPTO_KEY_OLD}" --volume "${RESTORE_FILE}:/tmp/datalens_db.dump" --rm --entrypoint /init/us-restore.sh postgres --root-user ${RESTORE_ARGS}
 fi
 
 EXIT="$?"
@@ -6,11 +6,16 @@ set -eo pipefail
 # [-x] - all executed commands are printed to the terminal [not secure]
 # [-o pipefail] - if any command in a pipeline fails, that return code will be used as the return code of the whole pipeline
 
+SCRIPT_DIR=$(dirname -- "$(readlink -f -- "$0")")
+
 IMAGE_PLATFORM="linux/$(uname -m | grep -o --color=never arm64 || echo amd64)"
 
 IS_GZIP_COMPRESS="true"
 IS_FORCE="false"
 IS_SPLIT="false"
+IS_BUNDLE="false"
+SAVE_JOBS="4"
+BUNDLE_COMPRESSION=""
 TARGET_DIR="."
 
 # parse args
@@ -34,6 +39,20 @@ for _ in "$@"; do
     IS_SPLIT="true"
     shift # past argument with no value
     ;;
+  --bundle)
+    IS_BUNDLE="true"
+    shift # past argument with no value
+    ;;
+  --jobs)
+    SAVE_JOBS="${2}"
+    shift # past argument
+    shift # past value
+    ;;
+  --bundle-compression)
+    BUNDLE_COMPRESSION="${2}"
+    shift # past argument
+    shift # past value
+    ;;
   --force)
     IS_FORCE="true"
     shift # past argument with no value
@@ -58,6 +77,31 @@ IMAGES_PULL=$(grep -h image: docker-compose.yaml | awk '{print $2}' | uniq)
 IMAGES_PULL_PRETTY=$(echo "${IMAGES_PULL}" | sort | sed 's|^|  - |')
 echo "${IMAGES_PULL_PRETTY}"
 echo ""
+
+if [ "${IS_BUNDLE}" == "true" ]; then
+  # images are pulled and saved in parallel, layers shared by images are stored once
+  echo "${IMAGES_PULL}" >"${TARGET_DIR}/datalens-images.txt"
+
+  if [ "${IS_FORCE}" == "true" ]; then
+    rm -rf "${TARGET_DIR}/datalens-images"
+  fi
+
+  BUNDLE_ARGS=("--bundle" "${TARGET_DIR}/datalens-images" "--platform" "${IMAGE_PLATFORM}" "--jobs" "${SAVE_JOBS}")
+  if [ -n "${BUNDLE_COMPRESSION}" ]; then
+    BUNDLE_ARGS+=("--compression" "${BUNDLE_COMPRESSION}")
+  fi
+  if [ "${IS_GZIP_COMPRESS}" == "false" ]; then
+    echo "Bundle blobs are always compressed, --no-compress ignored..."
+  fi
+
+  # shellcheck disable=SC2086
+  python3 "${SCRIPT_DIR}/images-bundle.py" save "${BUNDLE_ARGS[@]}" ${IMAGES_PULL}
+
+  echo ""
+  echo "Images bundle saved at [${TARGET_DIR}/datalens-images]"
+  exit 0
+fi
+
 echo "Pulling images..."
 
 for IMG in ${IMAGES_PULL}; do